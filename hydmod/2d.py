@@ -5,6 +5,12 @@ import hydmod.conversions as conv
 import hydmod.groundwater as gw
 import hydmod.flow_routing as fr
 import hydmod.radiation as rad
+import hydmod.smr as smr
+import hydmod.forcing as frc
+import hydmod.climate as clm
+import hydmod.raster as rst
+import hydmod.terrain as trn
+import hydmod.probes as prb
 from datetime import datetime
 import pandas as pd
 from osgeo import gdal
@@ -42,37 +48,27 @@ dempath = dirpath + "/testdem.tif"
 demnp = CreateTestDEM(dempath)
 # rddem = rd.LoadGDAL(dempath, no_data=-9999)
 # rdprop = rd.FlowProportions(dem=rddem, method='D4')
-gdal.DEMProcessing(dirpath + "/testslopedeg.tif",
-                   dempath,'slope', computeEdges=True, slopeFormat='degree')
-gdal.DEMProcessing(dirpath + "/testslopeper.tif",
-                   dempath,'slope', computeEdges=True, slopeFormat='percent')
-gdal.DEMProcessing(dirpath + "/testaspect.tif", dempath, 'aspect',
-                   computeEdges=True, trigonometric=False, zeroForFlat=True)
+geot = rst.RasterInputs({'dem': dempath}).geotransform()
+#slope (percent) and aspect (degrees) in memory, Horn's method as gdaldem with computeEdges
+slope, aspect = trn.SlopeAspect(demnp, trn.CellSize(geot), nodata=-9999.0)
 #read data
-str2date = lambda x: datetime.strptime(x.decode("utf-8"), '%m/%d/%Y')
-indate = pd.DatetimeIndex(
-    np.genfromtxt(fn, delimiter=",", skip_header=1, converters={0: str2date}, usecols=(0)))
-indat = np.genfromtxt(fn, delimiter=",", skip_header=1, usecols=(1,2,3,4,5,6))
+snotel = clm.ReadSNOTEL(fn)
 
-doy = conv.DayOfYear(indate.month.values, indate.day.values, indate.year.values)
+ndays = math.ceil(365) #len(snotel['date'])
+swe = snotel['swe'][1:ndays] #m
+ppt = snotel['ppt'][:ndays-1] #m
 
-#convert to mm
-ndays = math.ceil(365)#indat.shape[0]
-swe = indat[1:ndays,0]*0.0254 #m
-ppt = indat[:ndays-1,5]*0.0254 #m
-ppt2d = np.reshape(np.repeat(ppt, nrow*ncol), (ndays-1, nrow, ncol))
+doy = snotel['doy'][:ndays-1]
+date = pd.DatetimeIndex(snotel['date'][:ndays-1])
 
-doy = doy[:ndays-1]
-date = indate[:ndays-1]
+#degrees C
+tmin = snotel['tmin'][:ndays-1]
+tmax = snotel['tmax'][:ndays-1]
+tavg = snotel['tavg'][:ndays-1]
 
-#convert to degrees C
-tmin = np.multiply(np.subtract(indat[:ndays-1,3],32.0), (5.0/9.0))
-tmax = np.multiply(np.subtract(indat[:ndays-1,2],32.0), (5.0/9.0))
-tavg = np.multiply(np.subtract(indat[:ndays-1,4],32.0), (5.0/9.0))
-
-tmin2d = np.reshape(np.repeat(tmin, nrow*ncol), (ndays-1, nrow, ncol))
-tmax2d = np.reshape(np.repeat(tmax, nrow*ncol), (ndays-1, nrow, ncol))
-tavg2d = np.reshape(np.repeat(tavg, nrow*ncol), (ndays-1, nrow, ncol))
+forcing = frc.Forcing((nrow, ncol), dates=date, ppt=ppt, tmin=tmin, tmax=tmax, tavg=tavg)
+#station series broadcast onto the grid without copying
+ppt2d, tmin2d, tmax2d, tavg2d = forcing['ppt'], forcing['tmin'], forcing['tmax'], forcing['tavg']
 
 #from optimization in R
 k = 1.1456
@@ -94,59 +90,27 @@ Ra2d = rad.ExtraterrestrialRadiation_2d(np.full((nrow, ncol),conv.DegreesToRadia
 #calculate PET
 pet2d = et.PET_Hargreaves1985(tmax2d, tmin2d, tavg2d, Ra2d)/1000.0 # m/day
 
-s = np.zeros(ppt_in2d.shape)
-r = np.zeros(ppt_in2d.shape)
-ra = np.zeros(ppt_in2d.shape) #accumulated runoff
-hwt = np.zeros(ppt_in2d.shape)
-qlat_out = np.zeros(ppt_in2d.shape)
-qlat_in = np.zeros(ppt_in2d.shape)
-perc = np.zeros(ppt_in2d.shape)
-sb = np.zeros(ppt_in2d.shape)
-bf = np.zeros(ppt_in2d.shape)
-q = np.zeros(ppt_in2d.shape)
-r[0,:,:] = 0 # set initial runoff m
-ra[0,:,:] = 0
-s[0,:,:] = 0.1 # set initial storage (i.e water content) m
-sb[0,:,:] = 0 # set initial aquifer storage (baseflow source) m
+#soil parameters
 soildepth = np.full((nrow, ncol), 1.0) #depth of soil profile m
-
-aet = np.zeros(ppt_in2d.shape)
 ksat = np.full((nrow, ncol), 1.0) # m/day
-slpds = gdal.Open(dirpath + "/testslopeper.tif")
-geot = slpds.GetGeoTransform()
-slope = slpds.GetRasterBand(1).ReadAsArray()
-# print("slope", slope)
 por = np.full((nrow, ncol), 0.5)
 fc = np.full((nrow, ncol), 0.3)
 wp = np.full((nrow, ncol), 0.1)
 ksub = np.full((nrow, ncol), 0.001) # m/day
 alpha = 0.02
-porl = np.multiply(por, soildepth)
-fcl = np.multiply(fc, soildepth)
-wpl = np.multiply(wp, soildepth)
-smax = porl
-qlat_nr = np.zeros(ndays)
-
-fprop = fr.FlowProportions(demnp)
-aet[0,:,:] = et.ET_theta_2d(pet2d[0,:,:], fcl, wpl, s[0,:,:])
-
-for i in range(1, ppt_in2d.shape[0]):
-    s[i, :, :] = s[i - 1, :, :] + ppt_in2d[i,:,:]
-    hwt[i, :, :] = gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], soildepth), soildepth)
-    qlat_out[i, :, :] = gw.LateralFlow_Darcy_2d(ksat, np.divide(slope, 100.0), hwt[i, :, :], geot[1], geot[1])
-    qlat_in[i, :, :], qlat_nr[i] = fr.RouteFlow(fprop, qlat_out[i, :, :])
-    s[i, :, :] = s[i, :, :] + qlat_in[i,:,:] - qlat_out[i,:,:]
-    aet[i, :, :] = et.ET_theta_2d(pet2d[i, :, :], fcl, wpl, s[i - 1, :, :])
-    s[i,:,:] = s[i,:,:] - aet[i,:,:]
-    perc[i, :, :] = gw.Percolation_2d(ksub, gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], 1.0), soildepth))
-    s[i, :, :] = s[i, :, :] - perc[i,:,:]
-    r[i, :, :] = np.where(s[i, :, :] > (soildepth*por), (s[i, :, :] - (soildepth*por)), 0.0)
-    ra[i, :, :] = rd.FlowAccumulation(rd.LoadGDAL(dempath), method='Dinf', weights=r[i,:,:])
-    # print(intm)
-    # print('r',r[i, :, :])
-    # print('ppt', ppt_in2d[i,:,:])
-
-    s[i, :, :] = np.where(s[i, :, :] > (soildepth * por), (soildepth * por), s[i, :, :])
+
+#run soil moisture routing model, initial storage (i.e water content) 0.1 m
+grid = smr.SMRGrid(demnp, slope, geot)
+params = smr.SMRParameters(soildepth, por, fc, wp, ksat, ksub, alpha)
+model = smr.SMRModel(grid, params, {'ppt': ppt_in2d, 'pet': pet2d}, storage=0.1, start=1)
+#day 0 of the forcing is the initial state and the model steps from day 1, as the original daily loop
+simdate = date[model.start:]
+outrow = 4
+outcol = 2
+#record only the series that are plotted
+point = prb.PointProbe(outrow, outcol, names=('qlat_in', 'ra', 'hwt', 's'))
+model.run(record=(), probes=(point,))
+qlat_in, ra, hwt, s = (point.values[name] for name in ('qlat_in', 'ra', 'hwt', 's'))
 
 # print("ppt", ppt_in2d)
 # print("pet", pet)
@@ -165,13 +129,11 @@ for i in range(1, ppt_in2d.shape[0]):
 # print("r", r)
 # print("s", s)
 # print('ra', ra)
-outrow = 4
-outcol = 2
-plt.plot(date, qlat_in[:, outrow, outcol], 'g',
-         date, ra[:, outrow, outcol], 'c',
-         date, (ra[:, outrow, outcol]+qlat_in[:, outrow, outcol]), 'b')
+plt.plot(simdate, qlat_in, 'g',
+         simdate, ra, 'c',
+         simdate, (ra+qlat_in), 'b')
 plt.show()
-plt.plot(date, hwt[:, outrow, outcol], 'b')
+plt.plot(simdate, hwt, 'b')
 plt.show()
-plt.plot(date, s[:, outrow, outcol], 'b')
+plt.plot(simdate, s, 'b')
 plt.show()
@@ -5,6 +5,14 @@ import hydmod.conversions as conv
 import hydmod.groundwater as gw
 import hydmod.flow_routing as fr
 import hydmod.radiation as rad
+import hydmod.smr as smr
+import hydmod.forcing as frc
+import hydmod.climate as clm
+import hydmod.raster as rst
+import hydmod.terrain as trn
+import hydmod.probes as prb
+import hydmod.aggregate as agg
+import hydmod.store as sto
 import datetime
 import pandas as pd
 from osgeo import gdal
@@ -15,22 +23,18 @@ import os
 
 os.chdir('C:/temp/smr/trimmer_peak')
 dempath = 'dem/dem.tif'
-demds = gdal.Open(dempath)
-geot = demds.GetGeoTransform()
-demnp = demds.GetRasterBand(1).ReadAsArray()
-nrow = demds.RasterYSize
-ncol = demds.RasterXSize
-demds = None
+rasters = rst.RasterInputs({'dem': dempath})
+geot = rasters.geotransform()
+nrow, ncol = rasters.shape
+demnp = rasters.read('dem')
 demfil = rd.FillDepressions(rd.LoadGDAL(dempath))
 rdaccum = rd.FlowAccumulation(demfil, method='Dinf')
 
-slpds = gdal.Open('export/arcmap/gtiffs/FVSLOP.tif')
-slpnp = slpds.GetRasterBand(1).ReadAsArray()*100.0
-aspds = gdal.Open('export/arcmap/gtiffs/TASPEC.tif')
-aspnp = aspds.GetRasterBand(1).ReadAsArray()
+#slope (percent) and aspect (radians) from the dem, Horn's method as gdaldem
+slpnp, aspnp = trn.SlopeAspect(demnp, trn.CellSize(geot), units='radians', nodata=rasters.nodata['dem'])
 #clipath = 'climate/424856.cli' #temple fork
 clipath = 'climate/265191.cli' #trimmer peak
-clidat = np.genfromtxt(clipath, skip_header=15)
+cli = clm.ReadCLI(clipath, yearoffset=2000)
 
 lat = 41.82 #latitude
 lat2d = np.full((nrow, ncol), lat)
@@ -43,22 +47,17 @@ ndays = dayend-daystart
 dayindex = np.arange(ndays)
 
 #read input data
-d = clidat[daystart-1:dayend-1, 0]
-m = clidat[daystart-1:dayend-1, 1]
-y = clidat[daystart-1:dayend-1, 2]+2000
-
-df = pd.DataFrame({'year': y, 'month': m, 'day': d})
-dt = pd.DatetimeIndex(pd.to_datetime(df))
+days = slice(daystart-1, dayend-1)
+dt = pd.DatetimeIndex(cli['date'][days])
 #print(dt)
 
-doy = conv.DayOfYear(m, d, y)
-ppt = np.reshape(np.repeat(clidat[daystart-1:dayend-1, 3] * 0.0254, nrow*ncol), (ndays, nrow, ncol))
-tmax =  np.reshape(np.repeat(clidat[daystart-1:dayend-1, 7], nrow*ncol), (ndays, nrow, ncol))
-tmin =  np.reshape(np.repeat(clidat[daystart-1:dayend-1, 8], nrow*ncol), (ndays, nrow, ncol))
-tavg = 0.5 * (tmin + tmax)
-wind =  np.reshape(np.repeat(clidat[daystart-1:dayend-1, 10], nrow*ncol), (ndays, nrow, ncol))
-td =  np.reshape(np.repeat(clidat[daystart-1:dayend-1, 12], nrow*ncol), (ndays, nrow, ncol))
-radobs =  np.reshape(np.repeat(conv.LangleyTokJsqm(clidat[daystart-1:dayend-1, 9]), nrow*ncol), (ndays, nrow, ncol)) #langleys -> kJ/m^2
+doy = cli['doy'][days]
+forcing = frc.Forcing((nrow, ncol), dates=dt, ppt=cli['ppt'][days], tmax=cli['tmax'][days], tmin=cli['tmin'][days],
+                      wind=cli['wind'][days], td=cli['td'][days], radobs=cli['radobs'][days])
+forcing.add('tavg', 0.5 * (forcing.station('tmin') + forcing.station('tmax')))
+#station series broadcast onto the grid without copying
+ppt, tmax, tmin, tavg = forcing['ppt'], forcing['tmax'], forcing['tmin'], forcing['tavg']
+wind, td, radobs = forcing['wind'], forcing['td'], forcing['radobs']
 qcs = rad.ClearSkyRadiation(rad.ExtraterrestrialRadiation_2d(np.full((nrow, ncol),conv.DegreesToRadians(lat)), doy))
 cc = rad.CloudCoverFraction(radobs, qcs)
 #parameters for precip phase
@@ -70,82 +69,34 @@ snow, rain = precip.PrecipPhase_2d(ppt, tavg, train, tsnow)
 snowage = precip.SnowAge(snow) #assumes snow never melts
 snowalbedo = rad.SnowAlbedo(snowage, 1.0) #assumes snow never melts
 radadj = rad.DirectSolarRadiation_SlopingSurface(lat2d, doy, radobs, slpnp, aspnp)
-radadj = rad.DirectSolarRadiation_Adjustment(radadj, pfc, snowalbedo)
-
-rl = rad.LongwaveRadiation(tavg, pfc, cc)
-wr = rad.WindRoughness(wind, pfc)
-qs = rad.SensibleRadiation(tavg, wr)
-es = rad.VaporPressure(tavg)
-e = rad.VaporPressure(td)
-vda = rad.VaporDensity(e, td)
-vds = rad.VaporDensity(es, tavg)
-vdsnow = rad.VaporDensity(rad.VaporPressure(np.where(tavg < 0.0, tavg, 0.0)), np.where(tavg < 0.0, tavg, 0.0))
-ql = rad.LatentRadiation(td, tsnow, wind, pfc)
-qtotal = radadj + rl + qs + ql + rad.HEAT_FROM_GROUND
-qtotal = np.where(qtotal>0.0, qtotal, 0.0)
-maxmelt = qtotal/(rad.LATENT_HEAT_FUSION*rad.DENSITY_WATER)
+
+#energy balance fused over chunks of days
+qtotal, maxmelt, fluxes = rad.SnowEnergyBalance(radadj, tavg, td, wind, cc, pfc, snowalbedo, tsnow, components=True)
+rl, qs, ql = fluxes['longwave'], fluxes['sensible'], fluxes['latent']
 swe, actmelt = precip.ModelSWE_2d(snow, maxmelt)
 pptin = rain+actmelt
 
 #recalculate albedo and radiation after swe calculated
-snowalbedo = rad.SnowAlbedo(snowage, swe)
-radadj = rad.DirectSolarRadiation_Adjustment(radobs, pfc, snowalbedo)
-qtotal = radadj + rl + qs + ql + rad.HEAT_FROM_GROUND
-qtotal = np.where(qtotal>0.0, qtotal, 0.0)
+np.copyto(snowalbedo, 0.0, where=(swe <= 0.0) & (snowage > 0.0)) #aged snow that has melted out
+qtotal = rad.SnowEnergyBalance(radobs, tavg, td, wind, cc, pfc, snowalbedo, tsnow, melt=False, out=qtotal)
+radadj = rad.DirectSolarRadiation_Adjustment(radobs, pfc, snowalbedo) #net shortwave after swe, plotted below
 pet = et.PET_Hargreaves1985(tmax, tmin, tavg, qtotal/rad.LATENT_HEAT_VAPORIZATION)/1000.0 # m/day
 
-#initiate arrays for variables
-s = np.zeros((ndays, nrow, ncol))
-r = np.zeros((ndays, nrow, ncol))
-ra = np.zeros((ndays, nrow, ncol))  # accumulated runoff
-hwt = np.zeros((ndays, nrow, ncol))
-qlat_out = np.zeros((ndays, nrow, ncol))
-qlat_in = np.zeros((ndays, nrow, ncol))
-perc = np.zeros((ndays, nrow, ncol))
-sb = np.zeros((ndays, nrow, ncol))
-bf = np.zeros((ndays, nrow, ncol))
-q = np.zeros((ndays, nrow, ncol))
-
-#set initial values
-r[0, :, :] = 0.0  # set initial runoff m
-ra[0, :, :] = 0.0
-s[0, :, :] = 0.3  # set initial storage (i.e water content) m
-sb[0, :, :] = 0.0  # set initial aquifer storage (baseflow source) m
+#soil parameters
 soildepth = np.full((nrow, ncol), 2.0)  # depth of soil profile m
-
-# Set initial and constant/preset values for simulation
-lat = np.full((nrow, ncol), 41.97)
-pfc = np.full((nrow, ncol), 80.0)
-
-#set initial values
-aet = np.zeros((ndays, nrow, ncol))
 ksat = np.full((nrow, ncol), 10.0) # m/day
 por = np.full((nrow, ncol), 0.5)
 fc = np.full((nrow, ncol), 0.3)
 wp = np.full((nrow, ncol), 0.1)
 ksub = np.full((nrow, ncol), 0.001) # m/day
 alpha = 0.02 # baseflow recession coefficient
-porl = np.multiply(por, soildepth)
-fcl = np.multiply(fc, soildepth)
-wpl = np.multiply(wp, soildepth)
-smax = porl
-qlat_nr = np.zeros(ndays)
-
-fprop = fr.FlowProportions(demfil)
-
-for i in range(1, ppt.shape[0]):
-    s[i, :, :] = s[i - 1, :, :] + ppt[i, :, :]
-    hwt[i, :, :] = gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], soildepth), soildepth)
-    qlat_out[i, :, :] = gw.LateralFlow_Darcy_2d(ksat, slpnp / 100.0, hwt[i, :, :], geot[1], geot[1])
-    qlat_in[i, :, :], qlat_nr[i] = fr.RouteFlow(fprop, qlat_out[i, :, :])
-    s[i, :, :] = s[i, :, :] + qlat_in[i, :, :] - qlat_out[i, :, :]
-    aet[i, :, :] = et.ET_theta_2d(pet[i, :, :], fcl, wpl, s[i - 1, :, :])
-    s[i, :, :] = s[i, :, :] - aet[i, :, :]
-    perc[i, :, :] = gw.Percolation_2d(ksub, gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], 1.0), soildepth))
-    s[i, :, :] = s[i, :, :] - perc[i, :, :]
-    r[i, :, :] = np.where(s[i, :, :] > (soildepth * por), (s[i, :, :] - (soildepth * por)), 0.0)
-    ra[i, :, :] = rd.FlowAccumulation(rd.LoadGDAL(dempath), method='Dinf', weights=r[i, :, :])
-    s[i, :, :] = np.where(s[i, :, :] > (soildepth * por), (soildepth * por), s[i, :, :])
+
+#run soil moisture routing model, initial storage (i.e water content) 0.3 m
+grid = smr.SMRGrid(demfil, slpnp, geot)
+params = smr.SMRParameters(soildepth, por, fc, wp, ksat, ksub, alpha)
+model = smr.SMRModel(grid, params, {'ppt': ppt, 'pet': pet}, storage=0.3, start=1)
+#day 0 of the forcing is the initial state and the model steps from day 1, as the original daily loop
+simindex = dayindex[model.start:]
 
 #basin outlet
 outletrow = 130
@@ -154,12 +105,23 @@ outletcol = 34
 outrow = 13
 outcol = 17
 
-plt.plot(dayindex, qlat_in[:, outrow, outcol], 'b', dayindex, qlat_out[:, outrow, outcol], 'r')
+#record only the series that are plotted
+point = prb.PointProbe(outrow, outcol, names=('qlat_in', 'qlat_out', 'hwt', 'aet'))
+outlet = prb.PointProbe(outletrow, outletcol, names=('qlat_in', 'qlat_out', 'ra'))
+discharge = prb.OutletProbe(outletrow, outletcol)
+#monthly maps of evapotranspiration, runoff and percolation, aggregated as the model runs
+monthly = agg.Aggregator(('aet', 'r', 'perc'), ('sum',), 'month', dates=dt)
+#daily grids of soil water and discharge saved to disk for post-processing (read with sto.OutputStore)
+daily = sto.OutputWriter('output/smr', ('s', 'q'), dates=dt, overwrite=True)
+model.run(record=(), probes=(point, outlet, discharge, monthly, daily))
+qlat_in, qlat_out, hwt, aet = (point.values[name] for name in ('qlat_in', 'qlat_out', 'hwt', 'aet'))
+
+plt.plot(simindex, qlat_in, 'b', simindex, qlat_out, 'r')
 plt.show()
 
-plt.plot(dayindex, hwt[:, outrow, outcol], 'b')
+plt.plot(simindex, hwt, 'b')
 plt.show()
-plt.plot(dayindex, pet[:, outrow, outcol], 'r', dayindex, aet[:, outrow, outcol], 'g')
+plt.plot(dayindex, pet[:, outrow, outcol], 'r', simindex, aet, 'g')
 plt.show()
 
 plt.plot(dayindex, radadj[:, outrow, outcol], 'r',
@@ -170,12 +132,25 @@ plt.plot(dayindex, radadj[:, outrow, outcol], 'r',
          dayindex, radobs[:, outrow, outcol], 'k')
 plt.show()
 
-plt.plot(dayindex, qlat_in[:, outletrow, outletcol]-qlat_out[:, outletrow, outletcol], 'g',
-         dayindex, ra[:, outletrow, outletcol], 'c',
-         dayindex, (ra[:, outletrow, outletcol]+(qlat_in[:, outletrow, outletcol]-qlat_out[:, outletrow, outletcol])), 'b')
+qlat_net = outlet.values['qlat_in'] - outlet.values['qlat_out']
+plt.plot(simindex, qlat_net, 'g',
+         simindex, outlet.values['ra'], 'c',
+         simindex, outlet.values['ra'] + qlat_net, 'b')
 plt.show()
 
-flow = ((ra[:, outletrow, outletcol]+(qlat_in[:, outletrow, outletcol]-qlat_out[:, outletrow, outletcol]))
-        *geot[1]*np.abs(geot[5]))/(3600*24) #cms
-plt.plot(dt, flow, 'b')
+flow = discharge.discharge #cms
+plt.plot(dt[model.start:], flow, 'b')
+plt.show()
+
+#peak snow water equivalent of each water year
+peakswe = agg.Aggregator(('swe',), ('max', 'maxdate'), 'water_year', dates=dt)
+for date, sweday in zip(dt.values, swe):
+    peakswe.update(date, {'swe': sweday})
+peakswe.close()
+
+start, end, aetmap = monthly.results[-1]
+plt.imshow(aetmap['aet_sum'])
+plt.title('evapotranspiration (m) ' + str(start) + ' to ' + str(end))
+plt.show()
+plt.imshow(peakswe.results[-1][2]['swe_max'])
 plt.show()
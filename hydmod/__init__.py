@@ -1,7 +1,21 @@
+from hydmod.aggregate import *
+from hydmod.calibration import *
+from hydmod.climate import *
 from hydmod.conversions import *
+from hydmod.domain import *
+from hydmod.ensemble import *
 from hydmod.et import *
+from hydmod.filecache import *
 from hydmod.flow_routing import *
+from hydmod.forcing import *
 from hydmod.groundwater import *
+from hydmod.horizon import *
+from hydmod.point import *
 from hydmod.precip import *
+from hydmod.probes import *
 from hydmod.radiation import *
-from hydmod.stats import *
\ No newline at end of file
+from hydmod.raster import *
+from hydmod.smr import *
+from hydmod.stats import *
+from hydmod.store import *
+from hydmod.terrain import *
\ No newline at end of file
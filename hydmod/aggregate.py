@@ -0,0 +1,200 @@
+import numpy as np
+from hydmod.probes import Probe
+
+# calendar periods to aggregate over: calendar months, calendar years, water years (October to September, labelled by
+# the year they end in) or the whole run
+PERIODS = ('month', 'year', 'water_year', 'run')
+# statistics of daily values over a period: total, mean, maximum and the first date of the maximum
+STATISTICS = ('sum', 'mean', 'max', 'maxdate')
+
+
+class Aggregator(Probe):
+    """
+    Statistics of daily grids over calendar periods, updated online as a model runs (see smr.SMRModel.run), so
+    monthly or annual maps (e.g. evapotranspiration, runoff, percolation or peak snow water equivalent) take memory
+    in proportion to the grid only, not to the length of the run. A period is emitted as soon as it closes: after its
+    last day when the next date of the run falls in another period, or at the end of the run. Periods cut by the
+    start or end of a run are emitted with the days they have, see the 'days' count. Daily values may also be given
+    without a model with update, e.g. snow water equivalent from precip.ModelSWE_2d.
+
+    Args:
+        names: state variables (or names of values given to update) to aggregate
+        statistics: statistics of each variable, see STATISTICS (default: ('sum',))
+        period: calendar period, see PERIODS (default: 'month')
+        dates: dates of the days of the forcing (default: None, the dates of the forcing of the model)
+        emit: optional function emit(start, end, values) called when a period closes (default: None)
+        keep: keep closed periods in results (default: True)
+
+    Attributes:
+        results: list of (start, end, values) of closed periods, where start and end are the first and last dates
+            (datetime64[D]) aggregated and values is a dictionary of grids named variable_statistic (e.g. 'aet_sum')
+            with nan (NaT for dates) outside the mask of a masked grid, plus the number of days aggregated ('days')
+
+    """
+
+    def __init__(self, names, statistics=('sum',), period='month', dates=None, emit=None, keep=True):
+        if period not in PERIODS:
+            raise ValueError('period must be one of ' + str(PERIODS) + ', not ' + repr(period))
+        for statistic in statistics:
+            if statistic not in STATISTICS:
+                raise ValueError('statistic must be one of ' + str(STATISTICS) + ', not ' + repr(statistic))
+        self.names = tuple(names)
+        self.statistics = tuple(statistics)
+        self.period = period
+        self.dates = None if dates is None else _Dates(dates)
+        self.emit = emit
+        self.keep = keep
+        self.results = []
+        self._cells = None
+        self._key = None
+        self._sum = {}
+        self._max = {}
+        self._greater = {}
+        self._maxdate = {}
+
+    def start(self, model, ndays):
+        if self.dates is None:
+            if model.forcing.dates is None:
+                raise ValueError('dates are needed to aggregate over periods, the forcing has none')
+            self.dates = _Dates(model.forcing.dates)
+        if self.dates.size < model.ndays:
+            raise ValueError('aggregator has ' + str(self.dates.size) + ' dates, the forcing has ' +
+                             str(model.ndays) + ' days')
+        self._keys = PeriodKeys(self.dates, self.period)
+        self._cells = model.grid.cells
+        self._ndays = ndays
+        # a period left open by values given with update is dropped, and statistics are allocated for the new grid
+        self._key = None
+        self._sum = {}
+        self._max = {}
+        self._greater = {}
+        self._maxdate = {}
+
+    def record(self, model, i):
+        day = model.day - 1
+        self.update(self.dates[day], {name: model.state[name] for name in self.names}, self._keys[day])
+        if i == self._ndays - 1 or model.day >= model.ndays or self._keys[model.day] != self._key:
+            self.close()
+
+    def update(self, date, values, key=None):
+        """
+        Add the values of a day, closing the open period first if the day falls in another period
+
+        Args:
+            date: date of the day (datetime64 or datetime)
+            values: dictionary of grids of the day for each variable
+            key: period of the day (default: None, see PeriodKeys)
+
+        """
+        date = np.datetime64(date, 'D')
+        if key is None:
+            key = PeriodKeys(np.array([date]), self.period)[0]
+        if self._key is not None and key != self._key:
+            self.close()
+        if self._key is None:
+            self._Open(key, date, values)
+        self._end = date
+        self._days += 1
+        for name in self.names:
+            value = values[name]
+            if name in self._sum:
+                np.add(self._sum[name], value, out=self._sum[name])
+            if name in self._max:
+                greater = np.greater(value, self._max[name], out=self._greater[name])
+                np.copyto(self._max[name], value, where=greater)
+                if name in self._maxdate:
+                    np.copyto(self._maxdate[name], date, where=greater)
+
+    def close(self):
+        """
+        Emit the open period, if any, e.g. a partial period at the end of values given with update
+
+        Returns:
+            (start, end, values) of the period, or None if no period is open
+
+        """
+        if self._key is None:
+            return None
+        values = {'days': self._days}
+        for name in self.names:
+            for statistic in self.statistics:
+                if statistic == 'sum':
+                    value = self._sum[name].copy()
+                elif statistic == 'mean':
+                    value = self._sum[name]/self._days
+                elif statistic == 'max':
+                    value = np.where(self._max[name] == -np.inf, np.nan, self._max[name])
+                else:
+                    value = self._maxdate[name].copy()
+                values[name + '_' + statistic] = self._Unpack(value)
+        result = (self._start, self._end, values)
+        self._key = None
+        if self.keep:
+            self.results.append(result)
+        if self.emit is not None:
+            self.emit(*result)
+        return result
+
+    def _Open(self, key, date, values):
+        """
+        Start a period, allocating the running statistics at the first period
+        """
+        self._key = key
+        self._start = date
+        self._days = 0
+        for name in self.names:
+            shape = np.shape(values[name])
+            if 'sum' in self.statistics or 'mean' in self.statistics:
+                if name not in self._sum:
+                    self._sum[name] = np.zeros(shape)
+                self._sum[name].fill(0.0)
+            if 'max' in self.statistics or 'maxdate' in self.statistics:
+                if name not in self._max:
+                    self._max[name] = np.zeros(shape, dtype=np.result_type(values[name], np.float32))
+                    self._greater[name] = np.zeros(shape, dtype=bool)
+                self._max[name].fill(-np.inf)
+            if 'maxdate' in self.statistics:
+                if name not in self._maxdate:
+                    self._maxdate[name] = np.zeros(shape, dtype='datetime64[D]')
+                self._maxdate[name].fill(np.datetime64('NaT'))
+
+    def _Unpack(self, value):
+        """
+        Statistic on the grid, for the packed state of a masked grid
+        """
+        if self._cells is None:
+            return value
+        fill = np.datetime64('NaT') if np.issubdtype(value.dtype, np.datetime64) else np.nan
+        return self._cells.unpack(value, fill)
+
+
+def PeriodKeys(dates, period):
+    """
+    Calendar period of each date
+
+    Args:
+        dates: dates (datetime64 or datetime)
+        period: calendar period, see PERIODS
+
+    Returns:
+        integer key of the period of each date, equal for dates in the same period
+
+    """
+    dates = _Dates(dates)
+    if period == 'month':
+        return dates.astype('datetime64[M]').astype(np.int64)
+    if period == 'year':
+        return dates.astype('datetime64[Y]').astype(np.int64)
+    if period == 'water_year':
+        # October to December belong to the water year of the next calendar year
+        return (dates.astype('datetime64[M]') + np.timedelta64(3, 'M')).astype('datetime64[Y]').astype(np.int64)
+    if period == 'run':
+        return np.zeros(dates.size, dtype=np.int64)
+    raise ValueError('period must be one of ' + str(PERIODS) + ', not ' + repr(period))
+
+
+def _Dates(dates):
+    """
+    Dates as a datetime64[D] array (from datetime64, datetime or pandas.DatetimeIndex)
+    """
+    return np.asarray(dates).astype('datetime64[D]').ravel()
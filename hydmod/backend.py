@@ -0,0 +1,146 @@
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('auto', 'numba', 'numpy')
+
+# backend for time-stepping kernels: 'numba' compiles them, 'numpy' uses the NumPy implementations and 'auto' (default)
+# compiles when numba is installed. Set with SetBackend or the HYDMOD_BACKEND environment variable.
+backend = os.environ.get('HYDMOD_BACKEND', 'auto').lower()
+if backend not in BACKENDS:
+    raise ValueError('HYDMOD_BACKEND must be one of ' + str(BACKENDS) + ', not ' + repr(backend))
+
+# compiled kernels by python function, compiled on first use
+_compiled = {}
+
+
+def Compiled(kernel):
+    """
+    Compiled version of a kernel for the active backend. Kernels are compiled on first use and cached on disk
+    (numba cache=True), so later processes load them instead of compiling again.
+
+    Args:
+        kernel: python function written for numba nopython mode
+
+    Returns:
+        compiled function, or None when the NumPy implementation should be used
+
+    """
+    if not UseCompiled():
+        return None
+    if kernel not in _compiled:
+        _compiled[kernel] = numba.njit(cache=True)(kernel)
+    return _compiled[kernel]
+
+def RunTimeScan(kernel, inputs, outputs):
+    """
+    Run a compiled time scan kernel on arrays of any shape with time on the first axis, by flattening all other axes
+    to one. The kernel is called as kernel(*inputs, *outputs) with 2d (time, points) arrays.
+
+    Args:
+        kernel: compiled kernel
+        inputs: arrays read by the kernel
+        outputs: arrays written by the kernel
+
+    """
+    n = inputs[0].shape[0]
+    flat_in = [np.ascontiguousarray(x).reshape(n, -1) for x in inputs]
+    flat_out = [np.ascontiguousarray(x).reshape(n, -1) for x in outputs]
+    kernel(*flat_in, *flat_out)
+    # copy back outputs that could not be flattened without a copy
+    for flat, x in zip(flat_out, outputs):
+        if not np.shares_memory(flat, x):
+            x[...] = flat.reshape(x.shape)
+
+def SetBackend(name):
+    """
+    Select the backend for time-stepping kernels
+
+    Args:
+        name: 'auto', 'numba' or 'numpy'
+
+    """
+    global backend
+    name = name.lower()
+    if name not in BACKENDS:
+        raise ValueError('backend must be one of ' + str(BACKENDS) + ', not ' + repr(name))
+    if name == 'numba' and numba is None:
+        raise ImportError('the numba backend requires numba')
+    backend = name
+
+def UseCompiled():
+    """
+    Whether kernels are compiled with the active backend
+    """
+    if backend == 'numba' and numba is None:
+        raise ImportError('the numba backend requires numba')
+    return backend != 'numpy' and numba is not None
+
+
+def DaysSinceEvent_Kernel(events, reset, out):
+    """
+    Scalar time scan for DaysSinceEvent on 2d (time, points) arrays
+    """
+    for j in range(events.shape[1]):
+        out[0, j] = 0
+    for i in range(1, events.shape[0]):
+        for j in range(events.shape[1]):
+            if events[i, j] or reset[i, j]:
+                out[i, j] = 0
+            else:
+                out[i, j] = out[i-1, j] + 1
+
+def ModelSWE_Kernel(ppt_snow, swe_melt, swe_cum, act_melt):
+    """
+    Scalar time scan for ModelSWE on 2d (time, points) arrays
+    """
+    for i in range(1, ppt_snow.shape[0]):
+        for j in range(ppt_snow.shape[1]):
+            swe_inc = swe_cum[i-1, j] + ppt_snow[i, j] - swe_melt[i, j]
+            if swe_inc > 0.0:
+                swe_cum[i, j] = swe_inc
+                act_melt[i, j] = swe_melt[i, j]
+            else:
+                swe_cum[i, j] = 0.0
+                act_melt[i, j] = swe_cum[i-1, j]
+
+def PointWaterBalance_Kernel(ppt_in, pet, params, s, et, hwt, perc, sb, bf, qlat, qlatin, r, q):
+    """
+    Daily water balance of a single soil column (see point.SMRPoint). params holds soildepth, smax, por, fc, fcl, wpl,
+    ksat, slope, length, ksub and alpha; all other arguments are 1d series, the last ten are written. s[0] and sb[0]
+    hold the initial soil and aquifer storage.
+    """
+    soildepth, smax, por, fc, fcl, wpl, ksat, slope, length, ksub, alpha = params
+    for i in range(ppt_in.shape[0]):
+        # evapotranspiration from the water content of the previous day, as in et.ET_theta
+        wc = s[i-1] if i > 0 else s[0]
+        factor = 1.0
+        if wc < 0.8*fcl and wc > wpl:
+            factor = 1.0-((0.8*fcl - wc)/(0.8*fcl - wpl))
+        elif wc <= wpl:
+            factor = 0.0
+        et[i] = pet[i]*factor
+        if i == 0:
+            s[0] = s[0] + ppt_in[0] - et[0]
+            continue
+        theta = s[i-1]/soildepth
+        if theta < fc:
+            hwt[i] = 0.0
+        elif theta >= por:
+            hwt[i] = soildepth
+        else:
+            hwt[i] = soildepth*((theta-fc)/(por-fc))
+        perc[i] = ksub if hwt[i] > 0.0 else 0.0
+        bf[i] = alpha*sb[i-1]
+        sb[i] = sb[i-1] + perc[i] - bf[i]
+        qlat[i] = (ksat*slope*hwt[i])/length
+        qlatin[i] = 1.0*qlat[i]
+        s[i] = s[i-1] + ppt_in[i] - et[i] - qlat[i] + qlatin[i] - perc[i]
+        if s[i] > smax:
+            r[i] = s[i] - smax
+            s[i] = smax
+        q[i] = r[i] + qlat[i] + bf[i]
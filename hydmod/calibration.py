@@ -0,0 +1,214 @@
+import os
+import pickle
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from hydmod import stats
+from hydmod.precip import MeltDegreeDay_USACE, ModelSWE, PrecipPhase
+
+# objectives as losses to minimize
+OBJECTIVES = {
+    'KGE': lambda modeled, observed: 1.0 - stats.KGE(modeled, observed),
+    'NSE': lambda modeled, observed: 1.0 - stats.NSE(modeled, observed),
+    'RMSE': lambda modeled, observed: stats.RMSE(modeled, observed),
+    'MeanDifference': lambda modeled, observed: np.abs(stats.MeanDifference(modeled, observed)),
+}
+
+# data shared by all evaluations in a worker process, set once by _InitWorker
+_worker = {}
+
+
+class Calibration(object):
+    """
+    Calibrate model parameters against an observed series (e.g. SNOTEL SWE or outlet discharge) with differential
+    evolution (Storn and Price 1997). Candidate parameter sets of each generation are evaluated in a process pool;
+    terrain and forcing are loaded once per worker process. Progress is written to an optional checkpoint after every
+    generation so an interrupted calibration can be resumed.
+
+    Args:
+        simulate: function simulate(data, **params) returning the modeled series; must be defined at module level so
+            it can be sent to worker processes
+        observed: observed values (numpy array), pairs with missing (nan) observations are ignored
+        bounds: dictionary of (lower, upper) bounds for each parameter
+        objective: 'NSE', 'KGE', 'RMSE', 'MeanDifference' or a function loss(modeled, observed) to minimize
+            (default: 'NSE')
+        load: function returning the data passed to simulate (terrain, forcing), called once per worker process
+            (default: None, data is None)
+        load_args: arguments for load (default: ())
+        workers: number of worker processes, 1 evaluates in this process (default: None, number of processors)
+        seed: seed for the random number generator (default: None)
+        checkpoint: path of a file to save progress to and resume from (default: None)
+
+    """
+
+    def __init__(self, simulate, observed, bounds, objective='NSE', load=None, load_args=(), workers=None, seed=None,
+                 checkpoint=None):
+        self.simulate = simulate
+        self.observed = np.asarray(observed)
+        self.names = list(bounds.keys())
+        self.lower = np.array([bounds[name][0] for name in self.names], dtype=float)
+        self.upper = np.array([bounds[name][1] for name in self.names], dtype=float)
+        if np.any(self.lower > self.upper):
+            raise ValueError('lower bounds must not exceed upper bounds')
+        self.objective = objective
+        self.load = load
+        self.load_args = tuple(load_args)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.seed = seed
+        self.checkpoint = checkpoint
+        self.rng = np.random.default_rng(seed)
+        self.generation = 0
+        self.population = None
+        self.loss = None
+        self.history = []
+
+    def best(self):
+        """
+        Best parameter set found so far
+
+        Returns:
+            dictionary of parameter values and the loss of the parameter set
+
+        """
+        i = np.argmin(self.loss)
+        return dict(zip(self.names, self.population[i].tolist())), self.loss[i]
+
+    def run(self, generations=100, popsize=15, mutation=0.8, crossover=0.7, tol=0.01):
+        """
+        Run differential evolution (rand/1/bin), resuming from the checkpoint if it exists
+
+        Args:
+            generations: maximum number of generations (default: 100)
+            popsize: population size as a multiple of the number of parameters (default: 15)
+            mutation: differential weight (default: 0.8)
+            crossover: crossover probability (default: 0.7)
+            tol: stop when the standard deviation of the population loss is below tol times its mean
+                (default: 0.01)
+
+        Returns:
+            dictionary of best parameter values and the loss of the parameter set
+
+        """
+        self._Restore()
+        nparam = len(self.names)
+        npop = max(popsize*nparam, 4)
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(self.workers, initializer=_InitWorker,
+                                       initargs=(self.load, self.load_args, self.simulate, self.observed,
+                                                 self.objective))
+        else:
+            pool = None
+            _InitWorker(self.load, self.load_args, self.simulate, self.observed, self.objective)
+        try:
+            if self.population is None:
+                self.population = self.lower + self.rng.random((npop, nparam))*(self.upper - self.lower)
+                self.loss = self._Evaluate(pool, self.population)
+                self.history.append(np.min(self.loss))
+                self._Save()
+            npop = self.population.shape[0]
+            rows = np.arange(npop)
+            while self.generation < generations and not self._Converged(tol):
+                # three distinct members other than the target for each mutant
+                donors = np.argsort(self.rng.random((npop, npop - 1)), axis=1)[:, :3]
+                donors += donors >= rows[:, np.newaxis]
+                a, b, c = self.population[donors[:, 0]], self.population[donors[:, 1]], self.population[donors[:, 2]]
+                mutant = np.clip(a + mutation*(b - c), self.lower, self.upper)
+                cross = self.rng.random((npop, nparam)) < crossover
+                cross[rows, self.rng.integers(nparam, size=npop)] = True
+                trial = np.where(cross, mutant, self.population)
+                trial_loss = self._Evaluate(pool, trial)
+                better = trial_loss <= self.loss
+                self.population[better] = trial[better]
+                self.loss[better] = trial_loss[better]
+                self.generation += 1
+                self.history.append(np.min(self.loss))
+                self._Save()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return self.best()
+
+    def _Converged(self, tol):
+        loss = self.loss[np.isfinite(self.loss)]
+        return loss.size == self.loss.size and np.std(loss) <= tol*np.abs(np.mean(loss))
+
+    def _Evaluate(self, pool, population):
+        params = [dict(zip(self.names, values.tolist())) for values in population]
+        if pool is None:
+            loss = [_Evaluate(p) for p in params]
+        else:
+            chunksize = max(1, len(params)//(4*self.workers))
+            loss = list(pool.map(_Evaluate, params, chunksize=chunksize))
+        return np.array(loss, dtype=float)
+
+    def _Restore(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint, 'rb') as f:
+            saved = pickle.load(f)
+        if saved['names'] != self.names:
+            raise ValueError('checkpoint ' + str(self.checkpoint) + ' is for parameters ' + str(saved['names']))
+        self.population = saved['population']
+        self.loss = saved['loss']
+        self.generation = saved['generation']
+        self.history = saved['history']
+        self.rng.bit_generator.state = saved['rng']
+
+    def _Save(self):
+        if self.checkpoint is None:
+            return
+        saved = {'names': self.names, 'population': self.population, 'loss': self.loss,
+                 'generation': self.generation, 'history': self.history, 'rng': self.rng.bit_generator.state}
+        # write to a temporary file first so an interruption never leaves a partial checkpoint
+        tmp = str(self.checkpoint) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(saved, f)
+        os.replace(tmp, self.checkpoint)
+
+
+def Objective(objective):
+    """
+    Loss function for an objective
+
+    Args:
+        objective: 'NSE', 'KGE', 'RMSE', 'MeanDifference' or a function loss(modeled, observed) to minimize
+
+    Returns:
+        function loss(modeled, observed), nan losses are returned as infinity
+
+    """
+    func = OBJECTIVES[objective] if isinstance(objective, str) else objective
+
+    def loss(modeled, observed):
+        value = func(modeled, observed)
+        return value if np.isfinite(value) else np.inf
+    return loss
+
+def SimulateSWE(data, k, tbase, train, tsnow):
+    """
+    Snow water equivalent from the degree day snow model, for calibration against SNOTEL SWE
+
+    Args:
+        data: dictionary with precipitation ('ppt') and average temperature ('tavg')
+        k: melt coefficient
+        tbase: base temperature for melt (C)
+        train: temperature above which all precipitation is rain (C)
+        tsnow: temperature below which all precipitation is snow (C)
+
+    Returns:
+        modeled snow water equivalent
+
+    """
+    swe_melt = MeltDegreeDay_USACE(data['tavg'], k, tbase)
+    ppt_snow, ppt_rain = PrecipPhase(data['ppt'], data['tavg'], train, tsnow)
+    swe, melt = ModelSWE(ppt_snow, swe_melt)
+    return swe
+
+def _Evaluate(params):
+    modeled = np.asarray(_worker['simulate'](_worker['data'], **params))
+    return _worker['loss'](modeled, _worker['observed'])
+
+def _InitWorker(load, load_args, simulate, observed, objective):
+    _worker['data'] = None if load is None else load(*load_args)
+    _worker['simulate'] = simulate
+    _worker['observed'] = observed
+    _worker['loss'] = Objective(objective)
@@ -0,0 +1,191 @@
+import re
+import numpy as np
+from hydmod.conversions import DayOfYear, FahrenheitToCelsius, InchesToMeters, LangleyTokJsqm
+from hydmod.filecache import CachedColumns
+
+# daily columns of a WEPP (CLIGEN) climate file, after the header
+CLI_COLUMNS = ('day', 'month', 'year', 'ppt', 'duration', 'tp', 'ip', 'tmax', 'tmin', 'radobs', 'wind', 'wind_dir',
+               'td')
+CLI_HEADER_LINES = 15
+# bytes of text parsed at a time, bounds the memory of the conversion
+CLI_BLOCK_BYTES = 1 << 20
+# increase when ParseCLI changes its output, so cached files are parsed again
+CLI_VERSION = 1
+# columns of a daily SNOTEL report after the date (m/d/Y): snow water equivalent, precipitation accumulation (in),
+# maximum, minimum and average air temperature (F) and precipitation increment (in)
+SNOTEL_COLUMNS = ('swe', 'ppt_acc', 'tmax', 'tmin', 'tavg', 'ppt')
+SNOTEL_VERSION = 1
+
+
+def ParseCLI(path):
+    """
+    Parse the daily records of a WEPP (CLIGEN) climate file without breakpoints, see ReadCLI
+
+    Args:
+        path: path of the .cli file
+
+    Returns:
+        dictionary of daily arrays
+
+    """
+    what = ('a daily WEPP climate file with ' + str(len(CLI_COLUMNS)) +
+            ' columns (breakpoint files are not supported)')
+    blocks = []
+    line = CLI_HEADER_LINES + 1
+    with open(path, 'rb') as f:
+        for i in range(CLI_HEADER_LINES):
+            f.readline()
+        while True:
+            lines = f.readlines(CLI_BLOCK_BYTES)
+            if not lines:
+                break
+            blocks.append(_ParseLines(path, what, lines, line, len(CLI_COLUMNS)))
+            line += len(lines)
+    values = np.concatenate(blocks) if blocks else np.empty((0, len(CLI_COLUMNS)))
+    day, month, year = (values[:, i].astype(np.int32) for i in range(3))
+    date, doy = _Dates(day, month, year)
+    return {
+        'date': date,
+        'doy': doy,
+        'day': day,
+        'month': month,
+        'year': year,
+        'ppt': InchesToMeters(values[:, 3]), # m
+        'duration': values[:, 4], # h
+        'tp': values[:, 5],
+        'ip': values[:, 6],
+        'tmax': values[:, 7], # C
+        'tmin': values[:, 8], # C
+        'radobs': LangleyTokJsqm(values[:, 9]), # kJ/m^2
+        'wind': values[:, 10], # m/s
+        'wind_dir': values[:, 11], # degrees
+        'td': values[:, 12], # C
+    }
+
+def ParseSNOTEL(path):
+    """
+    Parse a daily SNOTEL report (CSV), see ReadSNOTEL
+
+    Args:
+        path: path of the .csv file
+
+    Returns:
+        dictionary of daily arrays
+
+    """
+    with open(path, 'rb') as f:
+        text = f.read().replace(b'\r', b'')
+    # number of each line of the file, then drop comment and blank lines and the header
+    lines = text.split(b'\n')
+    numbers = [n for n, line in enumerate(lines, 1) if line.strip() and not line.startswith(b'#')][1:]
+    # parse dates and values as one table with the parts of m/d/Y as separate columns and missing values as nan
+    text = re.sub(rb'(?<=[,\n])(?=[,\n]|\Z)', b'nan', b'\n'.join(lines[n - 1] for n in numbers).replace(b'/', b','))
+    what = 'a daily SNOTEL report with a m/d/Y date and ' + str(len(SNOTEL_COLUMNS)) + ' value columns'
+    values = _ParseLines(path, what, text.split(b'\n') if numbers else [], numbers, 3 + len(SNOTEL_COLUMNS), b',')
+    month, day, year = (values[:, i].astype(np.int32) for i in range(3))
+    date, doy = _Dates(day, month, year)
+    return {
+        'date': date,
+        'doy': doy,
+        'swe': InchesToMeters(values[:, 3]), # m
+        'ppt_acc': InchesToMeters(values[:, 4]), # m
+        'tmax': FahrenheitToCelsius(values[:, 5]), # C
+        'tmin': FahrenheitToCelsius(values[:, 6]), # C
+        'tavg': FahrenheitToCelsius(values[:, 7]), # C
+        'ppt': InchesToMeters(values[:, 8]), # m
+    }
+
+def ReadCLI(path, yearoffset=0, cache=True):
+    """
+    Daily records of a WEPP (CLIGEN) climate file. The file is parsed in blocks of lines and the result is cached
+    next to it as memory-mapped columns (see filecache.CachedColumns), so later reads of an unchanged file only map
+    the cache.
+
+    Args:
+        path: path of the .cli file
+        yearoffset: added to the years of the file, e.g. 2000 to place CLIGEN simulation years 1, 2, ... in the
+            calendar (default: 0)
+        cache: read and write the binary cache (default: True)
+
+    Returns:
+        dictionary of daily arrays: 'date' (datetime64[D]), 'doy' (day of year), 'day', 'month', 'year',
+        'ppt' (m), 'duration' (h),
+        'tp' and 'ip' (relative time and intensity of peak precipitation), 'tmax', 'tmin' and 'td' (dewpoint) (C),
+        'radobs' (kJ/m^2), 'wind' (m/s) and 'wind_dir' (degrees)
+
+    """
+    columns = CachedColumns(path, ParseCLI, CLI_VERSION, cache)
+    if yearoffset:
+        columns = dict(columns)
+        columns['year'] = columns['year'] + yearoffset
+        columns['date'], columns['doy'] = _Dates(columns['day'], columns['month'], columns['year'])
+    return columns
+
+def ReadSNOTEL(path, cache=True):
+    """
+    Daily records of a SNOTEL station report (CSV with one header line and optional # comment lines, dates as m/d/Y,
+    see SNOTEL_COLUMNS). The file is parsed in one vectorized pass and cached next to it as memory-mapped columns
+    (see filecache.CachedColumns), so reloading many stations (e.g. for calibration) only maps the caches.
+
+    Args:
+        path: path of the .csv file
+        cache: read and write the binary cache (default: True)
+
+    Returns:
+        dictionary of daily arrays: 'date' (datetime64[D]), 'doy' (day of year), 'swe', 'ppt_acc' and 'ppt' (m),
+        'tmax', 'tmin' and 'tavg' (C); missing values are nan
+
+    """
+    return CachedColumns(path, ParseSNOTEL, SNOTEL_VERSION, cache)
+
+
+def _ParseLines(path, what, lines, numbers, ncol, sep=None):
+    """
+    Table of numbers from lines of text, raising a ValueError that names the first line of the file that does not
+    hold ncol numbers
+
+    Args:
+        path: path of the file, for errors
+        what: description of the expected file, for errors
+        lines: lines of text (bytes), blank lines are skipped
+        numbers: line number of the first line in the file, or of each line
+        ncol: number of values on each line
+        sep: separator of the values (default: None, whitespace)
+
+    Returns:
+        (lines, ncol) numpy array
+
+    """
+    # no lines or only blank ones, e.g. a block of a file that ends in blank lines (np.loadtxt finds no columns)
+    if not any(line.strip() for line in lines):
+        return np.empty((0, ncol))
+    try:
+        values = np.loadtxt(lines, dtype=np.float64, delimiter=sep, comments=None, ndmin=2)
+    except ValueError:
+        values = None
+    if values is not None and values.shape[1] == ncol:
+        return values
+    if np.isscalar(numbers):
+        numbers = range(numbers, numbers + len(lines))
+    for n, line in zip(numbers, lines):
+        values = line.split(sep)
+        if not values or not line.strip():
+            continue
+        if len(values) != ncol:
+            raise ValueError(str(path) + ' is not ' + what + ': line ' + str(n) + ' has ' + str(len(values)) +
+                             ' values, expected ' + str(ncol))
+        for value in values:
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(str(path) + ' is not ' + what + ': line ' + str(n) + ' has a value that is not a '
+                                 'number (' + value.decode('ascii', 'replace').strip() + ')') from None
+    raise ValueError(str(path) + ' is not ' + what)
+
+def _Dates(day, month, year):
+    """
+    Dates (datetime64[D]) and days of year from day, month and year arrays
+    """
+    date = ((year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]')).astype('datetime64[D]')
+    date += (day - 1).astype('timedelta64[D]')
+    return date, DayOfYear(month, day, year)
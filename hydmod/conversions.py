@@ -65,6 +65,33 @@ def DegreesToRadians(deg):
     rad = deg * (PI/180.0)
     return rad
 
+def FahrenheitToCelsius(tf):
+    """
+    Convert degrees Fahrenheit to degrees Celsius
+
+    Args:
+        tf: temperature in Fahrenheit
+
+    Returns:
+        temperature in Celsius
+
+    """
+    tc = np.multiply(np.subtract(tf, 32.0), 5.0/9.0)
+    return tc
+
+def InchesToMeters(inches):
+    """
+    Convert inches to meters
+
+    Args:
+        inches: Value in inches
+
+    Returns:
+        Value in meters
+
+    """
+    return np.multiply(inches, 0.0254)
+
 def KelvinToCelsius(tk):
     """
     Convert Kelvin to degrees Celsius
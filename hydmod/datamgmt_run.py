@@ -3,6 +3,8 @@ from et import *
 from stats import *
 from conversions import *
 from groundwater import *
+from point import SMRPoint
+from climate import ReadSNOTEL
 from datetime import datetime
 import pandas as pd
 #import richdem
@@ -11,25 +13,20 @@ import matplotlib.pyplot as plt
 
 fn = "C:/Users/khafe/Desktop/Classes/WR_502_EnviroHydroModeling/data/snotel_klondike_0918.csv"
 #read data
-str2date = lambda x: datetime.strptime(x.decode("utf-8"), '%m/%d/%Y')
-indate = pd.DatetimeIndex(
-    np.genfromtxt(fn, delimiter=",", skip_header=1, converters={0: str2date}, usecols=(0)))
-indat = np.genfromtxt(fn, delimiter=",", skip_header=1, usecols=(1,2,3,4,5,6))
-
-doy = DayOfYear(indate.month.values, indate.day.values, indate.year.values)
+snotel = ReadSNOTEL(fn)
 
 #convert to mm
-ndays = math.ceil(365*2.25)#indat.shape[0]
-swe = indat[1:ndays,0]*25.4
-ppt = indat[:ndays-1,5]*25.4
+ndays = math.ceil(365*2.25) #len(snotel['date'])
+swe = snotel['swe'][1:ndays]*1000.0
+ppt = snotel['ppt'][:ndays-1]*1000.0
 
-#convert to degrees C
-tmin = np.multiply(np.subtract(indat[:ndays-1,3],32.0), (5.0/9.0))
-tmax = np.multiply(np.subtract(indat[:ndays-1,2],32.0), (5.0/9.0))
-tavg = np.multiply(np.subtract(indat[:ndays-1,4],32.0), (5.0/9.0))
+#degrees C
+tmin = snotel['tmin'][:ndays-1]
+tmax = snotel['tmax'][:ndays-1]
+tavg = snotel['tavg'][:ndays-1]
 
-doy = doy[:ndays-1]
-date = indate[:ndays-1]
+doy = snotel['doy'][:ndays-1]
+date = pd.DatetimeIndex(snotel['date'][:ndays-1])
 
 def RunModel(swe, ppt, tmin, tmax, tavg, doy):
 
@@ -54,24 +51,9 @@ def RunModel(swe, ppt, tmin, tmax, tavg, doy):
     print("precip", np.sum(ppt))
     print("rain + snow", np.sum(ppt_rain) + np.sum(ppt_snow))
 
-    #Storage and runoff
-    s = np.zeros(ppt_in.shape)
-    r = np.zeros(ppt_in.shape)
-    hwt = np.zeros(ppt_in.shape)
-    qlat = np.zeros(ppt_in.shape)
-    qlatin = np.zeros(ppt_in.shape)
-    perc = np.zeros(ppt_in.shape)
-    sb = np.zeros(ppt_in.shape)
-    bf = np.zeros(ppt_in.shape)
-    q = np.zeros(ppt_in.shape)
-    r[0] = 0 #set initial runoff
-    s[0] = 0 #set initial storage (i.e water content)
-    sb[0] = 0 #set initial aquifer storage (baseflow source)
+    #Soil info and ET info
     soildepth = 1000 #mm
     ponddepth = 1000-soildepth #mm
-
-    #Soil info and ET info
-    et = np.zeros(ppt_in.shape)
     ksat = 1000.0 #mm/day
     slope = 0.1
     por = 0.5
@@ -80,28 +62,13 @@ def RunModel(swe, ppt, tmin, tmax, tavg, doy):
     ksub = 1.0 #mm/day
     alpha = 0.02
     porl = por*soildepth
-    fcl = fc*soildepth
-    wpl = wp*soildepth
     smax = porl + ponddepth #mm
     print("smax", smax)
 
-    et[0] = ET_theta(pet[0], fcl, wpl, s[0])
-    s[0] = s[0] + ppt_in[0] - et[0]
-    for i in range(1, ppt_in.shape[0], 1):
-        et[i]= ET_theta(pet[i], fcl, wpl, s[i-1])
-
-        hwt[i] = WaterTableHeight(por, fc, (s[i-1]/1000.0), soildepth)
-        if hwt[i] > 0:
-            perc[i] = Percolation(ksub)
-        bf[i] = Baseflow(alpha, sb[i-1])
-        sb[i] = sb[i-1] + perc[i] - bf[i]
-        qlat[i] = LateralFlow_Darcy(ksat, slope, hwt[i], length=10000.0)
-        qlatin[i] = 1.0*qlat[i]
-        s[i] = s[i-1] + ppt_in[i] - et[i] - qlat[i] + qlatin[i] - perc[i]
-        if s[i] > smax:
-            r[i] = s[i] - smax
-            s[i] = smax
-        q[i] = r[i] + qlat[i] + bf[i]
+    #Storage and runoff, daily loop runs in the compiled backend when available
+    wb = SMRPoint(ppt_in, pet, soildepth, por, fc, wp, ksat, slope, ksub, alpha, ponddepth, length=10000.0)
+    s, r, hwt, perc, sb, bf, q = wb['s'], wb['r'], wb['hwt'], wb['perc'], wb['sb'], wb['bf'], wb['q']
+    et, qlat, qlatin = wb['aet'], wb['qlat_out'], wb['qlat_in']
 
     #pond depth
     p = np.where(s>porl, s-porl, 0.0)
@@ -0,0 +1,110 @@
+import numpy as np
+from hydmod.flow_routing import FlowNetwork, _TopologicalLevels
+
+
+class ActiveCells(object):
+    """
+    Cells of a grid inside a watershed mask, packed into a 1d vector so models store state and run kernels only for
+    cells that are simulated. Cells are packed in routing order (upslope to downslope levels of a flow network, row
+    major within a level) when a network is given, so gathers and scatters of flow routing walk memory mostly
+    forward. Values are packed once per input and scattered back to the grid only for output.
+
+    Args:
+        mask: boolean grid, True for active cells
+        network: optional flow network of the grid (flow_routing.FlowNetwork) to order cells by (default: None,
+            row major order)
+
+    """
+
+    def __init__(self, mask, network=None):
+        mask = np.asarray(mask, dtype=bool)
+        self.shape = mask.shape
+        index = np.flatnonzero(mask)
+        if network is not None:
+            inside = mask.ravel()[network.donor] & mask.ravel()[network.receiver]
+            level = _TopologicalLevels(network.donor[inside], network.receiver[inside], mask.size)
+            index = index[np.argsort(level[index], kind='stable')]
+        itype = np.int32 if mask.size < np.iinfo(np.int32).max else np.int64
+        self.index = index.astype(itype)
+        self.size = self.index.size
+        # packed position of every cell of the grid, -1 outside the mask
+        self.position = np.full(mask.size, -1, dtype=itype)
+        self.position[self.index] = np.arange(self.size, dtype=itype)
+        # native indices, so np.take gathers into out without converting them first
+        self._gather = self.index.astype(np.intp)
+
+    def mask(self):
+        """
+        Boolean grid of the active cells
+        """
+        mask = np.zeros(self.shape, dtype=bool)
+        mask.ravel()[self.index] = True
+        return mask
+
+    def pack(self, values, out=None):
+        """
+        Values of the active cells
+
+        Args:
+            values: scalar, grid (rows, cols) or stack of grids (..., rows, cols); grids broadcast from a single value
+                (e.g. station forcing) are not expanded
+            out: optional array (..., cells) to write packed values to (default: None)
+
+        Returns:
+            packed values (..., cells), or (..., 1) for broadcast grids and values unchanged for scalars
+
+        """
+        values = np.asarray(values)
+        if values.ndim < 2:
+            return values
+        if values.shape[-2:] != self.shape:
+            if values.shape[-2:] == (1, 1):
+                return values.reshape(values.shape[:-2] + (1,))
+            raise ValueError('values of shape ' + str(values.shape) + ' are not on the grid ' + str(self.shape))
+        if values.strides[-1] == 0 and values.strides[-2] == 0:
+            return values[..., :1, 0]
+        flat = values.reshape(values.shape[:-2] + (-1,))
+        if out is None:
+            return np.take(flat, self.index, axis=-1)
+        # the indices are within the grid, clip skips the bounds check that buffers out
+        np.take(flat, self._gather, axis=-1, out=out, mode='clip')
+        return out
+
+    def pack_network(self, network):
+        """
+        Flow network between active cells with packed indices. Edges leaving the active cells are dropped, so their
+        flow leaves the domain.
+
+        Args:
+            network: flow network of the grid (flow_routing.FlowNetwork)
+
+        Returns:
+            FlowNetwork of shape (cells,)
+
+        """
+        donor = self.position[network.donor]
+        receiver = self.position[network.receiver]
+        inside = (donor >= 0) & (receiver >= 0)
+        return FlowNetwork(donor[inside], receiver[inside], network.proportion[inside], (self.size,))
+
+    def unpack(self, values, fill=np.nan, out=None):
+        """
+        Scatter packed values back onto the grid
+
+        Args:
+            values: packed values (..., cells)
+            fill: value of cells outside the mask (default: nan)
+            out: optional array (..., rows, cols) to write to, cells outside the mask are not changed (default: None)
+
+        Returns:
+            grid or stack of grids (..., rows, cols)
+
+        """
+        values = np.asarray(values)
+        if out is None:
+            out = np.full(values.shape[:-1] + self.shape, fill, dtype=np.result_type(values, fill))
+        flat = out.reshape(out.shape[:-2] + (-1,))
+        flat[..., self.index] = values
+        if not np.shares_memory(flat, out):
+            out[...] = flat.reshape(out.shape)
+        return out
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def EnsembleParameter(values, ndim=0):
+    """
+    Put a set of parameter values on a leading ensemble axis, so N parameter sets broadcast against shared forcing
+    and terrain and are simulated in one vectorized pass. Results of functions given ensemble parameters have the
+    ensemble on their first axis.
+
+    Args:
+        values: parameter value for each ensemble member (1d numpy array)
+        ndim: number of dimensions of the arrays the parameter is combined with, e.g. 1 for a time series, 2 for a
+            grid and 3 for a (days, rows, cols) stack (default: 0)
+
+    Returns:
+        parameter values with shape (members, 1, ..., 1)
+
+    """
+    values = np.asarray(values)
+    if values.ndim != 1:
+        raise ValueError('ensemble parameter values must be 1 dimensional')
+    return values.reshape(values.shape + (1,) * ndim)
+
+def EnsembleSize(*params):
+    """
+    Number of ensemble members of a set of parameters
+
+    Args:
+        *params: parameters, scalars or arrays with a leading ensemble axis
+
+    Returns:
+        number of ensemble members (1 if no parameter has an ensemble axis)
+
+    """
+    sizes = set(np.shape(p)[0] for p in params if np.ndim(p) > 0 and np.shape(p)[0] > 1)
+    if len(sizes) > 1:
+        raise ValueError('parameters have different numbers of ensemble members: ' + str(sorted(sizes)))
+    return sizes.pop() if sizes else 1
@@ -1,5 +1,6 @@
 import numpy as np
 from hydmod.radiation import *
+from hydmod.precision import FloatType
 
 def ET_theta(pet, fc, wp, wc):
     """
@@ -23,7 +24,7 @@ def ET_theta(pet, fc, wp, wc):
     #print("wc", wc, "fc", 0.8*fc, "wp", wp, "theta", theta)
     return pet*theta
 
-def ET_theta_2d(pet, fc, wp, wc):
+def ET_theta_2d(pet, fc, wp, wc, out=None):
     """
     Model evapotranspiration, multiply potential ET by factor based on soil water content
     Args:
@@ -31,20 +32,25 @@ def ET_theta_2d(pet, fc, wp, wc):
         fc: Field capacity
         wp: Wilting point
         wc: Water content
+        out: Optional array to write results to (default: None, new array of the floating type of pet and wc)
 
     Returns:
         ET estimate
 
     """
-    #theta = np.ones(pet.shape)
-    theta = np.where(np.greater(wc, wp), np.where(np.less(wc, (0.8*fc)) & np.greater(wc, wp),
-                                                  np.subtract(1.0, np.divide(np.subtract(0.8*fc, wc),np.subtract(0.8*fc,wp))), 1.0), 0.0)
-    outrow = 6
-    outcol = 12
-    print('theta', theta[outrow,outcol], 'wc', wc[outrow,outcol], 'wp', wp[outrow,outcol], 'fc', fc[outrow,outcol])
-    aet= pet*theta
-    print('aet', aet[outrow, outcol], 'pet', pet[outrow,outcol])
-    return aet
+    # theta increases linearly from 0 at the wilting point to 1 at 80% of field capacity; where 80% of field capacity
+    # is not above the wilting point, theta is 1 above the wilting point and 0 otherwise
+    if out is None:
+        out = np.empty(np.broadcast_shapes(np.shape(pet), np.shape(fc), np.shape(wp), np.shape(wc)),
+                       dtype=FloatType(pet, wc))
+    denom = np.subtract(np.multiply(0.8, fc), wp)
+    linear = np.greater(denom, 0.0)
+    np.subtract(wc, wp, out=out)
+    np.divide(out, denom, out=out, where=linear)
+    np.copyto(out, np.greater(out, 0.0), where=np.logical_not(linear))
+    np.clip(out, 0.0, 1.0, out=out)
+    np.multiply(out, pet, out=out)
+    return out
 
 def PET_Hargreaves1985(tmax, tmin, tmean, Ra):
     """
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import shutil
+import numpy as np
+
+# bytes read at a time when hashing source files
+HASH_BLOCK = 1 << 20
+
+
+def CachedColumns(path, parse, version=1, cache=True):
+    """
+    Columns parsed from a text file, cached next to the file as a directory of .npy arrays (one per column) that are
+    memory-mapped on later loads. The cache is keyed by a hash of the file contents and the parser version, so an
+    edited file or a changed parser is parsed again; caches of older contents are removed when a new one is written.
+    If the cache cannot be written (e.g. a read-only directory), the parsed columns are returned without caching.
+
+    Args:
+        path: path of the source file
+        parse: function parse(path) returning a dictionary of 1d numpy arrays
+        version: version of the parser, increase it when parse changes its output (default: 1)
+        cache: read and write the cache (default: True)
+
+    Returns:
+        dictionary of numpy arrays, read-only memory maps when loaded from the cache
+
+    """
+    if not cache:
+        return parse(path)
+    key = FileHash(path) + '-v' + str(version)
+    cachedir = str(path) + '.' + key + '.npycache'
+    if os.path.isdir(cachedir):
+        return _LoadColumns(cachedir)
+    columns = parse(path)
+    try:
+        _SaveColumns(columns, cachedir)
+    except OSError:
+        return columns
+    _RemoveStale(path, cachedir)
+    return _LoadColumns(cachedir)
+
+def FileHash(path):
+    """
+    Hash of the contents of a file
+
+    Args:
+        path: path of the file
+
+    Returns:
+        hexadecimal digest (str)
+
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _LoadColumns(cachedir):
+    columns = {}
+    with open(os.path.join(cachedir, 'columns.txt')) as f:
+        names = f.read().split()
+    for name in names:
+        columns[name] = np.load(os.path.join(cachedir, name + '.npy'), mmap_mode='r')
+    return columns
+
+def _RemoveStale(path, cachedir):
+    """
+    Remove caches of earlier contents of a file
+    """
+    folder, base = os.path.split(os.path.abspath(path))
+    for name in os.listdir(folder):
+        stale = os.path.join(folder, name)
+        if (name.startswith(base + '.') and name.endswith('.npycache') and
+                os.path.abspath(stale) != os.path.abspath(cachedir)):
+            shutil.rmtree(stale, ignore_errors=True)
+
+def _SaveColumns(columns, cachedir):
+    """
+    Write columns to a temporary directory first and rename it, so readers never see a partial cache
+    """
+    tmp = cachedir + '.' + str(os.getpid()) + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(values), allow_pickle=False)
+        with open(os.path.join(tmp, 'columns.txt'), 'w') as f:
+            f.write('\n'.join(columns.keys()))
+        os.replace(tmp, cachedir)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another process may have written the same cache first
+        if not os.path.isdir(cachedir):
+            raise
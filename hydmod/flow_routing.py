@@ -1,6 +1,182 @@
 import numpy as np
-import richdem as rd
-from osgeo import gdal
+from hydmod.precision import Precision
+
+try:
+    import richdem as rd
+except ImportError:
+    rd = None
+
+# row and column offsets of the richdem neighbour numbering (1-8 clockwise from the west, 0 is the cell itself)
+RD_NEIGHBOUR_ROW = np.array([0, 0, -1, -1, -1, 0, 1, 1, 1])
+RD_NEIGHBOUR_COL = np.array([0, -1, -1, 0, 1, 1, 1, 0, -1])
+# row offset, column offset and distance (in cells) of the directions used by FlowProportions, east then clockwise
+FLOW_DIRECTIONS = ((0, 1, 1.0), (1, 1, np.sqrt(2.0)), (1, 0, 1.0), (1, -1, np.sqrt(2.0)),
+                   (0, -1, 1.0), (-1, -1, np.sqrt(2.0)), (-1, 0, 1.0), (-1, 1, np.sqrt(2.0)))
+
+
+class FlowNetwork(object):
+    """
+    Cell to cell flow proportions stored as a list of edges grouped in topological (upslope to downslope) order.
+    Built once from a DEM, it accumulates flow with one pass over the edges instead of rebuilding the flow graph.
+
+    Args:
+        donor: flat index of the cell each edge drains (1d numpy array)
+        receiver: flat index of the cell each edge drains to (1d numpy array)
+        proportion: proportion of the donor's flow passed along each edge (1d numpy array)
+        shape: shape of the grid the flat indices refer to
+
+    """
+
+    def __init__(self, donor, receiver, proportion, shape):
+        self.shape = tuple(shape)
+        self.ncell = int(np.prod(self.shape))
+        itype = np.int32 if self.ncell < np.iinfo(np.int32).max else np.int64
+        self.donor = np.asarray(donor, dtype=itype)
+        self.receiver = np.asarray(receiver, dtype=itype)
+        proportion = np.asarray(proportion)
+        self.proportion = proportion.astype(np.result_type(proportion, np.float16), copy=False)
+        self.level = None
+        self._routing = None
+        self._buffers = {}
+
+    def _PrepareAccumulation(self):
+        """
+        Sort edges by the level of their donor, then by receiver so edges into the same cell are contiguous. Done on
+        first use, routing alone does not need the topological order.
+
+        """
+        itype = self.donor.dtype
+        self.level = _TopologicalLevels(self.donor, self.receiver, self.ncell)
+        self.nlevel = int(self.level.max()) + 1 if self.ncell > 0 else 0
+        edgelevel = self.level[self.donor]
+        order = np.lexsort((self.receiver, edgelevel))
+        self.donor = self.donor[order]
+        self.receiver = self.receiver[order]
+        self.proportion = self.proportion[order]
+        edgelevel = edgelevel[order]
+        newseg = np.ones(edgelevel.size, dtype=bool)
+        newseg[1:] = (edgelevel[1:] != edgelevel[:-1]) | (self.receiver[1:] != self.receiver[:-1])
+        self._segstart = np.flatnonzero(newseg).astype(itype)
+        self._segreceiver = self.receiver[self._segstart]
+        levels = np.arange(self.nlevel + 1)
+        self._edgeptr = np.searchsorted(edgelevel, levels)
+        self._segptr = np.searchsorted(edgelevel[self._segstart], levels)
+
+    def _PrepareRouting(self):
+        """
+        Copy of the edges sorted by receiver, so the flow into each cell is a contiguous segment summed with reduceat.
+        Kept apart from the topological order of accumulate, which sorts edges within levels.
+
+        """
+        order = np.argsort(self.receiver, kind='stable')
+        receiver = self.receiver[order]
+        newseg = np.ones(receiver.size, dtype=bool)
+        newseg[1:] = receiver[1:] != receiver[:-1]
+        segstart = np.flatnonzero(newseg)
+        # intp indices, so np.take and the scatter of the segment sums do not convert them on every call
+        self._routing = (self.donor[order].astype(np.intp), self.proportion[order], segstart,
+                         receiver[segstart].astype(np.intp))
+
+    def accumulate(self, weights, out=None):
+        """
+        Weighted flow accumulation, each cell's value plus everything that drains to it
+
+        Args:
+            weights: amount of flow in each cell, shape of the grid or a stack of grids, e.g. (days, rows, cols)
+            out: optional array to write accumulated values to (default: None)
+
+        Returns:
+            accumulated flow (same shape as weights)
+
+        """
+        if self.level is None:
+            self._PrepareAccumulation()
+        weights = np.asarray(weights)
+        nstack = weights.size // max(self.ncell, 1)
+        # cells on the first axis so each level gathers and scatters whole rows
+        acc = np.array(weights.reshape(nstack, self.ncell).T, dtype=np.result_type(weights, Precision()), order='C')
+        for i in range(self.nlevel):
+            e0, e1 = self._edgeptr[i], self._edgeptr[i+1]
+            if e0 == e1:
+                continue
+            s0, s1 = self._segptr[i], self._segptr[i+1]
+            flow = acc[self.donor[e0:e1]] * self.proportion[e0:e1, np.newaxis]
+            acc[self._segreceiver[s0:s1]] += np.add.reduceat(flow, self._segstart[s0:s1] - e0, axis=0)
+        if out is None:
+            return acc.T.reshape(weights.shape)
+        np.copyto(out, acc.T.reshape(weights.shape))
+        return out
+
+    def route(self, flow, out=None, residual=False):
+        """
+        Routes flow to adjacent cells based on flow proportion, a sparse matrix-vector product equivalent to RouteFlow.
+        Edge flow is gathered into buffers kept between calls, so routing into out allocates no arrays.
+
+        Args:
+            flow: amount of flow to route, shape of the grid or a stack of grids
+            out: optional array to write routed flow to (default: None)
+            residual: also return the flow that was not routed, a mass balance check (default: False)
+
+        Returns:
+            routed flow (same shape as flow), and the flow that was not routed if residual is True
+
+        """
+        flow = np.asarray(flow)
+        if out is None:
+            out = np.empty(flow.shape, dtype=np.result_type(flow, Precision()))
+        if self._routing is None:
+            self._PrepareRouting()
+        donor, proportion, segstart, segreceiver = self._routing
+        nstack = flow.size // max(self.ncell, 1)
+        # edge flow is computed in the type of flow and proportions, in buffers kept for the next call
+        dtype = np.result_type(flow, proportion)
+        flat = flow.reshape(nstack, self.ncell).astype(dtype, copy=False)
+        if dtype not in self._buffers:
+            # proportions in the same type, so the product needs no casting buffers (e.g. float64 flow on float32
+            # proportions)
+            self._buffers[dtype] = (np.empty(donor.size, dtype=dtype), np.empty(segstart.size, dtype=dtype),
+                                    proportion.astype(dtype, copy=False))
+        edgeflow, cellflow, proportion = self._buffers[dtype]
+        outflat = out.reshape(nstack, self.ncell)
+        outflat.fill(0.0)
+        for i in range(nstack):
+            if donor.size == 0:
+                break
+            # indices are in range, and np.take buffers out in its default 'raise' mode
+            np.take(flat[i], donor, out=edgeflow, mode='clip')
+            np.multiply(edgeflow, proportion, out=edgeflow)
+            np.add.reduceat(edgeflow, segstart, out=cellflow)
+            outflat[i][segreceiver] = cellflow
+        if not np.shares_memory(outflat, out):
+            out[...] = outflat.reshape(out.shape)
+        if residual:
+            # totals are accumulated in float64 so the check holds for float32 flow
+            return out, np.sum(flow, dtype=np.float64) - np.sum(out, dtype=np.float64)
+        return out
+
+def FlowNetwork_rd(dem, method='Dinf'):
+    """
+    Build a flow network from richdem flow proportions
+
+    Args:
+        dem: depression filled digital elevation model (richdem rdarray)
+        method: richdem routing method (default: 'Dinf')
+
+    Returns:
+        FlowNetwork
+
+    """
+    if rd is None:
+        raise ImportError('FlowNetwork_rd requires richdem')
+    rdprop = np.asarray(rd.FlowProportions(dem, method=method))
+    nrow, ncol = rdprop.shape[0], rdprop.shape[1]
+    rows, cols, nbr = np.nonzero(rdprop[:, :, 1:] > 0.0)
+    proportion = rdprop[rows, cols, nbr + 1]
+    nrows = rows + RD_NEIGHBOUR_ROW[nbr + 1]
+    ncols = cols + RD_NEIGHBOUR_COL[nbr + 1]
+    inside = (nrows >= 0) & (nrows < nrow) & (ncols >= 0) & (ncols < ncol)
+    return FlowNetwork(rows[inside]*ncol + cols[inside], nrows[inside]*ncol + ncols[inside], proportion[inside],
+                       (nrow, ncol))
 
 def FlowProportions(dem, nodata=-9999):
     """
@@ -15,7 +191,7 @@ def FlowProportions(dem, nodata=-9999):
 
     """
     # elevation drop per distance, assumes cells are square
-    eprop = np.zeros((8, dem.shape[0], dem.shape[1]))
+    eprop = np.zeros((8, dem.shape[0], dem.shape[1]), dtype=Precision())
     eprop[0, :, 0:-1] = (dem[:, 0:-1] - dem[:, 1:]) # to east
     eprop[1, 0:-1, 0:-1] = (dem[0:-1, 0:-1] - dem[1:, 1:])/np.sqrt(2.0)# to southeast
     eprop[2, 0:-1, :] = (dem[0:-1, :] - dem[1:, :]) # to south
@@ -32,39 +208,70 @@ def FlowProportions(dem, nodata=-9999):
 
     return fprop
 
-def RouteFlow(flowprop, flow):
+def FlowProportions_Sparse(dem, nodata=-9999, dtype=None):
+    """
+    Proportions flow to all adjacent, downhill cells based on slope, same as FlowProportions but stored as a sparse
+    FlowNetwork instead of a dense (8, rows, cols) array.
+
+    Args:
+        dem: digital elevation model
+        nodata: no data value for dem (default: -9999)
+        dtype: data type of the stored proportions (default: None, the precision.Precision type)
+
+    Returns:
+        FlowNetwork
+
+    """
+    dem = np.asarray(dem)
+    nrow, ncol = dem.shape
+    index = np.arange(nrow*ncol).reshape(nrow, ncol)
+    # elevation drop per distance to each neighbour, assumes cells are square
+    esum = np.zeros(dem.shape)
+    for drow, dcol, dist in FLOW_DIRECTIONS:
+        src, dst = _NeighbourSlices(drow, dcol)
+        esum[src] += np.maximum((dem[src] - dem[dst]) / dist, 0.0)
+
+    donor = []
+    receiver = []
+    proportion = []
+    for drow, dcol, dist in FLOW_DIRECTIONS:
+        src, dst = _NeighbourSlices(drow, dcol)
+        drop = (dem[src] - dem[dst]) / dist
+        downhill = (drop > 0.0) & (esum[src] > 0.0)
+        donor.append(index[src][downhill])
+        receiver.append(index[dst][downhill])
+        proportion.append((drop[downhill] / esum[src][downhill]).astype(Precision(dtype)))
+    return FlowNetwork(np.concatenate(donor), np.concatenate(receiver), np.concatenate(proportion), dem.shape)
+
+def RouteFlow(flowprop, flow, out=None):
     """
     Routes flow to adjacent cells based on flow proportion.
 
     Args:
         flowprop: flow proportions
         flow: amount of flow route
+        out: optional array to write routed flow to (default: None)
 
     Returns:
-        routed flow
+        routed flow, and flow that was not routed (mass balance check)
 
     """
-    rflow = np.zeros((flowprop.shape[1], flowprop.shape[2])) #routed flow
-    flowdec = flow.copy() #decrement the total flow, this is a mass balance check
-
-    rflow[:, 1:] = rflow[:, 1:] + flowprop[0, :, 0:-1] * flow[:, 0:-1]  # flow from west
-    flowdec[:, 0:-1] = flowdec[:, 0:-1] - flowprop[0, :, 0:-1] * flow[:, 0:-1]
-    rflow[1:, 1:] = rflow[1:, 1:] + flowprop[1, 0:-1, 0:-1] * flow[0:-1, 0:-1]  # flow from northwest
-    flowdec[0:-1, 0:-1] = flowdec[:-1, 0:-1] - flowprop[1, 0:-1, 0:-1] * flow[0:-1, 0:-1]
-    rflow[1:, :] = rflow[1:, :] + flowprop[2, 0:-1, :] * flow[0:-1, :]  # flow from north
-    flowdec[0:-1, :] = flowdec[0:-1, :] - flowprop[2, 0:-1, :] * flow[0:-1, :]
-    rflow[1:, 0:-1] = rflow[1:, 0:-1] + flowprop[3, 0:-1, 1:] * flow[0:-1, 1:]  # flow from northeast
-    flowdec[0:-1, 1:] = flowdec[0:-1, 1:] - flowprop[3, 0:-1, 1:] * flow[0:-1, 1:]
-    rflow[:, 0:-1] = rflow[:, 0:-1] + flowprop[4, :, 1:] * flow[:, 1:]  # flow from east
-    flowdec[:, 1:] = flowdec[:, 1:] - flowprop[4, :, 1:] * flow[:, 1:]
-    rflow[0:-1, 0:-1] = rflow[0:-1, 0:-1] + flowprop[5, 1:, 1:] * flow[1:, 1:]  # flow from southeast
-    flowdec[1:, 1:] = flowdec[1:, 1:] - flowprop[5, 1:, 1:] * flow[1:, 1:]
-    rflow[0:-1, :] = rflow[0:-1, :] + flowprop[6, 1:, :] * flow[1:, :]  # flow from south
-    flowdec[1:, :] = flowdec[1:, :] - flowprop[6, 1:, :] * flow[1:, :]
-    rflow[0:-1, 1:] = rflow[0:-1, 1:] + flowprop[7, 1:, 0:-1] * flow[1:, 0:-1]  # flow from southwest
-    flowdec[1:, 0:-1] = flowdec[1:, 0:-1] - flowprop[7, 1:, 0:-1] * flow[1:, 0:-1]
-
-    return rflow, np.sum(flowdec)
+    if out is None:
+        out = np.zeros((flowprop.shape[1], flowprop.shape[2]), dtype=flowprop.dtype) #routed flow
+    else:
+        out[...] = 0.0
+
+    out[:, 1:] += flowprop[0, :, 0:-1] * flow[:, 0:-1]  # flow from west
+    out[1:, 1:] += flowprop[1, 0:-1, 0:-1] * flow[0:-1, 0:-1]  # flow from northwest
+    out[1:, :] += flowprop[2, 0:-1, :] * flow[0:-1, :]  # flow from north
+    out[1:, 0:-1] += flowprop[3, 0:-1, 1:] * flow[0:-1, 1:]  # flow from northeast
+    out[:, 0:-1] += flowprop[4, :, 1:] * flow[:, 1:]  # flow from east
+    out[0:-1, 0:-1] += flowprop[5, 1:, 1:] * flow[1:, 1:]  # flow from southeast
+    out[0:-1, :] += flowprop[6, 1:, :] * flow[1:, :]  # flow from south
+    out[0:-1, 1:] += flowprop[7, 1:, 0:-1] * flow[1:, 0:-1]  # flow from southwest
+
+    # proportions out of a cell sum to one or zero, so flow that is not routed is the difference of the totals
+    return out, np.sum(flow, dtype=np.float64) - np.sum(out, dtype=np.float64)
 
 def RouteFlow_rd(dempath, flow, method='Dinf'):
     """
@@ -78,7 +285,48 @@ def RouteFlow_rd(dempath, flow, method='Dinf'):
         routed flow
 
     """
-    rdprop = rd.FlowProportions(rd.LoadGDAL(dempath), method=method)
+    if rd is None:
+        raise ImportError('RouteFlow_rd requires richdem')
+    return FlowNetwork_rd(rd.LoadGDAL(dempath), method).route(flow)
+
+def _TopologicalLevels(donor, receiver, ncell):
+    """
+    Level of each cell in a flow graph, cells without donors are level 0 and every other cell is one level below its
+    last donor to be processed (Kahn's algorithm, one level at a time).
 
+    """
+    order = np.argsort(donor, kind='stable')
+    dreceiver = receiver[order]
+    edgeptr = np.zeros(ncell + 1, dtype=np.int64)
+    np.cumsum(np.bincount(donor, minlength=ncell), out=edgeptr[1:])
+    indegree = np.bincount(receiver, minlength=ncell)
+    level = np.full(ncell, -1, dtype=np.int32)
+    frontier = np.flatnonzero(indegree == 0)
+    i = 0
+    while frontier.size > 0:
+        level[frontier] = i
+        # all edges leaving the frontier
+        count = edgeptr[frontier + 1] - edgeptr[frontier]
+        start = np.repeat(edgeptr[frontier] - np.cumsum(count) + count, count)
+        targets = dreceiver[start + np.arange(start.size)]
+        np.subtract.at(indegree, targets, 1)
+        frontier = np.unique(targets[indegree[targets] == 0])
+        i += 1
+    if np.any(level < 0):
+        raise ValueError('flow network contains cycles')
+    return level
 
+def _NeighbourSlices(drow, dcol):
+    """
+    Slices of a grid for cells and their neighbours at the given row and column offset
 
+    """
+    def _Slice(offset):
+        if offset > 0:
+            return slice(0, -offset), slice(offset, None)
+        elif offset < 0:
+            return slice(-offset, None), slice(0, offset)
+        return slice(None), slice(None)
+    rsrc, rdst = _Slice(drow)
+    csrc, cdst = _Slice(dcol)
+    return (rsrc, csrc), (rdst, cdst)
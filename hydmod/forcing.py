@@ -0,0 +1,151 @@
+import numpy as np
+from hydmod.precision import Precision
+
+
+class Forcing(object):
+    """
+    Daily meteorological forcing for a grid. Station series are stored once as 1D arrays and exposed as read-only
+    views broadcast onto the grid, so identical values are not copied to every cell. Full (days, rows, cols) stacks
+    may be added as well.
+
+    Args:
+        shape: shape of the grid (rows, cols)
+        dates: optional dates of each day (default: None)
+        dtype: floating point type values are stored in, e.g. np.float32 (default: None, values are stored as given)
+        **variables: forcing variables, each a station series (days), a stack of grids (days, rows, cols) or an
+            ensemble of stacks (members, days, rows, cols)
+
+    """
+
+    def __init__(self, shape, dates=None, dtype=None, **variables):
+        self.shape = tuple(shape)
+        self.dates = dates
+        self.dtype = None if dtype is None else Precision(dtype)
+        self.ndays = None
+        self._values = {}
+        self._scale = {}
+        self._offset = {}
+        self._buffers = {}
+        for name, values in variables.items():
+            self.add(name, values)
+
+    def add(self, name, values, scale=None, offset=None):
+        """
+        Add a forcing variable, optionally with a per-cell adjustment value*scale + offset (e.g. a lapse rate)
+
+        Args:
+            name: name of the variable
+            values: station series (days), stack of grids (days, rows, cols) or an ensemble of stacks
+                (members, days, rows, cols), e.g. water input from an ensemble of snow parameters
+            scale: optional multiplier, scalar or grid (default: None)
+            offset: optional value added after scaling, scalar or grid (default: None)
+
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        if values.ndim == len(self.shape):
+            raise ValueError('forcing ' + name + ' is a single grid, give a series (days) or a stack of grids with '
+                             'shape (days,) + ' + str(self.shape))
+        if values.ndim != 1 and values.shape[-len(self.shape):] != self.shape:
+            raise ValueError('forcing ' + name + ' must be a series or have shape (days,) + ' + str(self.shape))
+        if values.ndim > len(self.shape) + 2:
+            raise ValueError('forcing ' + name + ' has too many dimensions')
+        ndays = values.shape[values.ndim - len(self.shape) - 1] if values.ndim > 1 else values.shape[0]
+        if self.ndays is None:
+            self.ndays = ndays
+        elif ndays != self.ndays:
+            raise ValueError('forcing ' + name + ' has ' + str(ndays) + ' days, expected ' + str(self.ndays))
+        self._values[name] = values
+        self._scale[name] = scale
+        self._offset[name] = offset
+        self._buffers.pop(name, None)
+
+    def day(self, name, i, out=None):
+        """
+        Values of a variable on the grid for one day
+
+        Args:
+            name: name of the variable
+            i: index of the day
+            out: optional array to write adjusted values to (default: None, a buffer reused for every day)
+
+        Returns:
+            grid of values, a read-only view when the variable is not adjusted
+
+        """
+        values = self._values[name]
+        if values.ndim == 1:
+            grid = np.broadcast_to(values[i], self.shape)
+        elif values.ndim == len(self.shape) + 2:
+            grid = values[:, i]
+        else:
+            grid = values[i]
+        scale = self._scale[name]
+        offset = self._offset[name]
+        if scale is None and offset is None:
+            return grid
+        if out is None:
+            if name not in self._buffers:
+                self._buffers[name] = np.empty(np.broadcast_shapes(grid.shape, np.shape(scale), np.shape(offset)),
+                                               dtype=np.result_type(values, np.float16))
+            out = self._buffers[name]
+        np.copyto(out, grid)
+        if scale is not None:
+            np.multiply(out, scale, out=out)
+        if offset is not None:
+            np.add(out, offset, out=out)
+        return out
+
+    def station(self, name):
+        """
+        Station series of a variable
+
+        Args:
+            name: name of the variable
+
+        Returns:
+            unadjusted values (days) for station series, or the full stack of grids
+
+        """
+        return self._values[name]
+
+    def keys(self):
+        return self._values.keys()
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __getitem__(self, name):
+        """
+        Values of a variable for all days on the grid (days, rows, cols), with a leading ensemble axis for ensemble
+        stacks. Station series without adjustment are returned as read-only broadcast views; adjusted variables are
+        expanded to a full array.
+
+        """
+        values = self._values[name]
+        scale = self._scale[name]
+        offset = self._offset[name]
+        if values.ndim == 1:
+            values = values[(slice(None),) + (np.newaxis,) * len(self.shape)]
+        if scale is not None:
+            values = np.multiply(values, scale)
+        if offset is not None:
+            values = np.add(values, offset)
+        if values.ndim == len(self.shape) + 2:
+            return np.broadcast_to(values, values.shape)
+        return np.broadcast_to(values, (self.ndays,) + self.shape)
+
+
+def LapseRateOffset(dem, elevation, lapse=-0.0065):
+    """
+    Offset to adjust a station value (e.g. temperature) to the elevation of each cell
+
+    Args:
+        dem: digital elevation model (m)
+        elevation: elevation of the station (m)
+        lapse: change in value per meter of elevation (default: -0.0065, C/m for air temperature)
+
+    Returns:
+        offset for each cell
+
+    """
+    return np.multiply(lapse, np.subtract(dem, elevation))
@@ -1,10 +1,27 @@
 import numpy as np
 
-def Baseflow(alpha, storage, beta=1):
-    return alpha*storage**beta
+def Baseflow(alpha, storage, beta=1, out=None):
+    """
+    Baseflow from aquifer storage
+
+    Args:
+        alpha: baseflow recession coefficient
+        storage: aquifer storage
+        beta: storage exponent (default: 1)
+        out: optional array to write results to (default: None)
+
+    Returns:
+        baseflow
+
+    """
+    if out is None:
+        return alpha*storage**beta
+    np.power(storage, beta, out=out)
+    np.multiply(out, alpha, out=out)
+    return out
 
 
-def LateralFlow_Darcy_2d(ksat, slope, hwt, length=1, width=1, convf=1.0):
+def LateralFlow_Darcy_2d(ksat, slope, hwt, length=1, width=1, convf=1.0, out=None):
     """
     2-dimensional darcy flow
 
@@ -15,13 +32,20 @@ def LateralFlow_Darcy_2d(ksat, slope, hwt, length=1, width=1, convf=1.0):
         length: distance from one cell to another
         width: cell width
         convf: unit conversion factor to convert width and length to units of hwt and ksat (default: 1.0)
+        out: optional array to write results to (default: None)
 
     Returns:
 
     """
-    qlat = np.divide(np.multiply(ksat, np.multiply(slope, np.multiply(hwt, np.multiply(width, convf)))),
-                     np.multiply(np.multiply(width, convf), np.multiply(length, convf)))
-    return qlat
+    if out is None:
+        qlat = np.divide(np.multiply(ksat, np.multiply(slope, np.multiply(hwt, np.multiply(width, convf)))),
+                         np.multiply(np.multiply(width, convf), np.multiply(length, convf)))
+        return qlat
+    np.multiply(ksat, slope, out=out)
+    np.multiply(out, hwt, out=out)
+    np.multiply(out, np.multiply(width, convf), out=out)
+    np.divide(out, np.multiply(np.multiply(width, convf), np.multiply(length, convf)), out=out)
+    return out
 
 
 def LateralFlow_Darcy(ksat, slope, hwt, length=1, width=1):
@@ -33,9 +57,23 @@ def Percolation(ksub):
     return ksub
 
 
-def Percolation_2d(ksub, hwt):
-    perc = np.where(hwt > 0.0, ksub, 0.0)
-    return perc
+def Percolation_2d(ksub, hwt, out=None):
+    """
+    Percolation from the soil profile where a water table is present
+
+    Args:
+        ksub: hydraulic conductivity of the substratum
+        hwt: height of the water table
+        out: optional array to write results to (default: None)
+
+    Returns:
+        percolation
+
+    """
+    if out is None:
+        return np.where(hwt > 0.0, ksub, 0.0)
+    np.multiply(np.greater(hwt, 0.0), ksub, out=out)
+    return out
 
 # def WaterTableHeight(por, fc, theta, depth):
 #     if (theta < fc):
@@ -46,7 +84,7 @@ def Percolation_2d(ksub, hwt):
 #         hwt = depth*((theta-fc)/(por-fc))
 #     return hwt
 
-def WaterTableHeight(por, fc, theta, depth):
+def WaterTableHeight(por, fc, theta, depth, out=None):
     """
 
     Args:
@@ -54,10 +92,18 @@ def WaterTableHeight(por, fc, theta, depth):
         fc: soil field capacity
         theta: soil moisture content
         depth: depth of soil profile
+        out: optional array to write results to, may be theta (default: None)
 
     Returns:
 
     """
+    if out is not None:
+        # same as below, the saturated fraction of the profile above field capacity clipped to [0, 1]
+        np.subtract(theta, fc, out=out)
+        np.divide(out, np.subtract(por, fc), out=out)
+        np.clip(out, 0.0, 1.0, out=out)
+        np.multiply(out, depth, out=out)
+        return out
     # where water content is less than field capacity no water table, set water table height to depth of the
     # soil profile everywhere else
     hwt = np.where(theta < fc, 0.0, depth)
@@ -0,0 +1,135 @@
+import numpy as np
+from hydmod.flow_routing import _NeighbourSlices
+
+
+class HorizonIndex(object):
+    """
+    Horizon angles of every cell for a fixed set of azimuth sectors, used to shade direct solar radiation by
+    surrounding terrain. Angles are computed once from the DEM by sweeping each sector direction with whole-grid
+    shifts: for increasing distances along the direction, the DEM is shifted by the rounded cell offset and the
+    running maximum of the elevation gradient is kept. Offsets are spaced every cell close by and geometrically
+    further away, so the number of shifts per sector grows with the log of the search distance. Angles are stored
+    as uint8 codes (0 to 90 degrees in 255 steps) or float16 radians.
+
+    Args:
+        dem: digital elevation model (2d numpy array)
+        cellsize: size of cells (m), scalar or (x, y) sizes
+        sectors: number of azimuth sectors, clockwise from north (default: 16)
+        maxdist: maximum search distance (m) (default: None, the extent of the dem)
+        nodata: no data value for dem, these cells do not block the horizon (default: None)
+        dtype: np.uint8 (default) or np.float16
+
+    """
+
+    def __init__(self, dem, cellsize, sectors=16, maxdist=None, nodata=None, dtype=np.uint8):
+        dem = np.asarray(dem, dtype=np.float32)
+        if nodata is not None:
+            dem = np.where(dem == nodata, -np.inf, dem).astype(np.float32)
+        csx, csy = np.broadcast_to(np.abs(np.asarray(cellsize, dtype=float)), (2,))
+        if maxdist is None:
+            maxdist = np.hypot(dem.shape[0]*csy, dem.shape[1]*csx)
+        if np.dtype(dtype) not in (np.dtype(np.uint8), np.dtype(np.float16)):
+            raise ValueError('dtype must be np.uint8 or np.float16')
+        self.shape = dem.shape
+        self.sectors = sectors
+        self.dtype = np.dtype(dtype)
+        self.angles = np.empty((sectors,) + dem.shape, dtype=self.dtype)
+        tangent = np.empty(dem.shape, dtype=np.float32)
+        work = np.empty(dem.shape, dtype=np.float32)
+        for sector in range(sectors):
+            tangent.fill(0.0)
+            for drow, dcol, dist in _SectorOffsets(self.azimuth(sector), csx, csy, maxdist, dem.shape):
+                cell, neighbour = _NeighbourSlices(drow, dcol)
+                gradient = work[cell]
+                np.subtract(dem[neighbour], dem[cell], out=gradient)
+                np.multiply(gradient, 1.0/dist, out=gradient)
+                # fmax ignores nan from no data cells
+                np.fmax(tangent[cell], gradient, out=tangent[cell])
+            self.angles[sector] = self._Encode(np.arctan(tangent))
+
+    def azimuth(self, sector):
+        """
+        Azimuth of the centre of a sector (radians clockwise from north)
+        """
+        return np.multiply(sector, 2*np.pi/self.sectors)
+
+    def sector(self, azimuth):
+        """
+        Sector containing an azimuth (radians clockwise from north)
+        """
+        return np.mod(np.rint(np.divide(azimuth, 2*np.pi/self.sectors)).astype(np.intp), self.sectors)
+
+    def angle(self, sector):
+        """
+        Horizon angle (radians) of every cell for a sector
+        """
+        angles = self.angles[sector]
+        if self.dtype == np.uint8:
+            return angles.astype(np.float32)*np.float32(0.5*np.pi/255.0)
+        return angles.astype(np.float32)
+
+    def shaded(self, elevation, azimuth, out=None):
+        """
+        Cells where the sun is below the terrain horizon
+
+        Args:
+            elevation: solar elevation angle (radians), for one day (scalar), per day (days,) or per cell and day
+                (days, rows, cols)
+            azimuth: solar azimuth angle (radians clockwise from north), same shape as elevation
+            out: optional boolean array to write results to (default: None)
+
+        Returns:
+            boolean array (rows, cols) for one day or (days, rows, cols), True where the cell is shaded
+
+        """
+        elevation = np.asarray(elevation)
+        days = elevation.shape if elevation.ndim <= 1 else elevation.shape[:1]
+        elevation, azimuth = np.atleast_1d(elevation, azimuth)
+        sector = self.sector(azimuth)
+        if out is None:
+            out = np.empty(days + self.shape, dtype=bool)
+        # a view with the day axis, also for a single day
+        stack = out[np.newaxis] if out.ndim == len(self.shape) else out
+        if elevation.ndim == 1:
+            # one sun position per day: compare stored codes against the encoded elevation
+            elevation = np.broadcast_to(elevation, sector.shape)
+            threshold = self._Encode(np.maximum(elevation, 0.0))
+            for i in range(sector.size):
+                if elevation[i] <= 0.0:
+                    stack[i] = True
+                else:
+                    np.greater(self.angles[sector[i]], threshold[i], out=stack[i])
+            return out
+        rows, cols = np.indices(self.shape, sparse=True)
+        for i in range(sector.shape[0]):
+            np.greater(self.angles[sector[i], rows, cols], self._Encode(np.maximum(elevation[i], 0.0)), out=stack[i])
+            stack[i] |= elevation[i] <= 0.0
+        return out
+
+    def _Encode(self, angle):
+        if self.dtype == np.uint8:
+            return np.rint(np.clip(angle, 0.0, 0.5*np.pi)*(255.0/(0.5*np.pi))).astype(np.uint8)
+        return np.asarray(angle).astype(np.float16)
+
+
+def _SectorOffsets(azimuth, csx, csy, maxdist, shape):
+    """
+    Unique (row, col) cell offsets along a direction with their distances (m), every cell for the first 16 cells and
+    increasing by 5% beyond
+    """
+    steps = list(range(1, 16))
+    t = 16.0
+    while t*min(csx, csy) <= maxdist:
+        steps.append(t)
+        t *= 1.05
+    offsets = []
+    seen = set()
+    for t in steps:
+        drow = int(np.rint(-np.cos(azimuth)*t))
+        dcol = int(np.rint(np.sin(azimuth)*t))
+        dist = np.hypot(drow*csy, dcol*csx)
+        if (drow, dcol) in seen or dist == 0.0 or dist > maxdist or abs(drow) >= shape[0] or abs(dcol) >= shape[1]:
+            continue
+        seen.add((drow, dcol))
+        offsets.append((drow, dcol, dist))
+    return offsets
@@ -0,0 +1,43 @@
+import numpy as np
+from hydmod.backend import Compiled, PointWaterBalance_Kernel
+
+
+def SMRPoint(ppt_in, pet, soildepth, por, fc, wp, ksat, slope, ksub, alpha=0.02, ponddepth=0.0, length=1.0,
+             storage=0.0, aquifer=0.0):
+    """
+    Daily water balance of a single soil column with the soil moisture routing (SMR) processes, where lateral inflow
+    equals lateral outflow. The daily loop is compiled when the backend (see backend.SetBackend) allows it and runs
+    in Python otherwise, with identical results.
+
+    Args:
+        ppt_in: water input, rain plus snowmelt (1d numpy array)
+        pet: potential evapotranspiration (1d numpy array)
+        soildepth: depth of soil profile
+        por: soil porosity
+        fc: soil field capacity
+        wp: soil wilting point
+        ksat: saturated hydraulic conductivity
+        slope: slope of land surface (fraction)
+        ksub: hydraulic conductivity of the substratum
+        alpha: baseflow recession coefficient (default: 0.02)
+        ponddepth: depth of ponding above the soil profile (default: 0.0)
+        length: flow length for lateral flow (default: 1.0)
+        storage: initial soil water storage (default: 0.0)
+        aquifer: initial aquifer storage (default: 0.0)
+
+    Returns:
+        dictionary of daily series for 's', 'aet', 'hwt', 'perc', 'sb', 'bf', 'qlat_out', 'qlat_in', 'r' and 'q'
+
+    """
+    ppt_in = np.asarray(ppt_in, dtype=np.float64)
+    pet = np.ascontiguousarray(np.broadcast_to(pet, ppt_in.shape), dtype=np.float64)
+    out = {name: np.zeros(ppt_in.shape) for name in ('s', 'aet', 'hwt', 'perc', 'sb', 'bf', 'qlat_out', 'qlat_in',
+                                                     'r', 'q')}
+    out['s'][0] = storage
+    out['sb'][0] = aquifer
+    params = np.array([soildepth, por*soildepth + ponddepth, por, fc, fc*soildepth, wp*soildepth, ksat, slope, length,
+                       ksub, alpha], dtype=np.float64)
+    kernel = Compiled(PointWaterBalance_Kernel) or PointWaterBalance_Kernel
+    kernel(ppt_in, pet, params, out['s'], out['aet'], out['hwt'], out['perc'], out['sb'], out['bf'], out['qlat_out'],
+           out['qlat_in'], out['r'], out['q'])
+    return out
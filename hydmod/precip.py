@@ -1,6 +1,53 @@
 import numpy as np
+from hydmod.backend import Compiled, DaysSinceEvent_Kernel, ModelSWE_Kernel, RunTimeScan
+from hydmod.precision import FloatType, Precision
 
 
+def DaysSinceEvent(events, reset=None, out=None, axis=0):
+    """
+    Number of time steps since the last nonzero value along the time axis, for any other (e.g. spatial or ensemble)
+    axes. The first time step is always treated as an event.
+
+    Args:
+        events: Event values, nonzero where an event occurred (numpy array)
+        reset: Optional boolean array (broadcastable to events) of time steps that also reset the count (default: None)
+        out: Optional array to write results to (default: None, new array of the precision.Precision type)
+        axis: Time axis (default: 0)
+
+    Returns:
+        Time steps since the last event (numpy array)
+
+    """
+    events = np.asarray(events)
+    if events.ndim == 0:
+        raise ValueError('events must have a time axis')
+    if out is None:
+        out = np.empty(events.shape, dtype=Precision())
+    if reset is not None:
+        reset = np.moveaxis(np.broadcast_to(reset, events.shape), axis, 0)
+    result = out
+    events = np.moveaxis(events, axis, 0)
+    out = np.moveaxis(out, axis, 0)
+    kernel = Compiled(DaysSinceEvent_Kernel)
+    if kernel is not None:
+        if reset is None:
+            reset = np.broadcast_to(False, events.shape)
+        RunTimeScan(kernel, (events.astype(bool, copy=False), reset), (out,))
+        return result
+    n = events.shape[0]
+    itype = np.int32 if n < np.iinfo(np.int32).max else np.int64
+    index = np.arange(n, dtype=itype).reshape((n,) + (1,) * (events.ndim - 1))
+
+    # index of the most recent event is the running maximum of the event indices
+    last = np.zeros(events.shape, dtype=itype)
+    np.copyto(last, index, where=events.astype(bool, copy=False))
+    if reset is not None:
+        np.copyto(last, index, where=reset)
+    last[0, ...] = 0
+    np.maximum.accumulate(last, axis=0, out=last)
+    np.subtract(index, last, out=out)
+    return result
+
 def MeltDegreeDay_USACE(temp, k, tbase=0.0):
     """
     Degree day snowmelt with US Army Corps of Engineers empirical model
@@ -18,55 +65,77 @@ def MeltDegreeDay_USACE(temp, k, tbase=0.0):
     melt[melt < 0.0] = 0.0
     return melt
 
-def ModelSWE(ppt_snow, swe_melt):
+def ModelSWE(ppt_snow, swe_melt, out=None, axis=0, dtype=None):
     """
-    Change in snow water equivalent when accounting for melt
+    Change in snow water equivalent when accounting for melt. Steps through time once and updates every point of the
+    other axes at each step, so point (1D), gridded (3D) and ensemble inputs share the same code path. A compiled
+    kernel is used when the backend (see backend.SetBackend) allows it.
 
     Args:
         ppt_snow: Precipitation that falls as snow
-        swe_melt: Snowmelt
+        swe_melt: Snowmelt (broadcastable with ppt_snow, e.g. an ensemble of melt parameters)
+        out: Optional tuple of (swe_cum, act_melt) arrays to write results to (default: None, new arrays of the
+            floating type of the inputs, see precision.FloatType)
+        axis: Time axis (default: 0)
+        dtype: Optional floating point type of new output arrays (default: None)
 
     Returns:
         Cumulative snow water equivalent (SWE), and the actual amount of snow that melted
 
     """
-    swe_cum = np.zeros(ppt_snow.shape, dtype=np.float32)
-    act_melt = np.zeros(swe_melt.shape, dtype=np.float32)
-    for i in range(1,ppt_snow.shape[0]):
-        swe_inc = swe_cum[i-1] + ppt_snow[i] - swe_melt[i]
-        if swe_inc > 0.0:
-            swe_cum[i] = swe_inc
-            act_melt[i] = swe_melt[i]
-        else:
-            act_melt[i] = swe_cum[i-1]
-
-    return swe_cum, act_melt
+    ppt_snow, swe_melt = np.broadcast_arrays(np.asarray(ppt_snow), np.asarray(swe_melt))
+    if out is None:
+        dtype = FloatType(ppt_snow, swe_melt, dtype=dtype)
+        out = (np.zeros(ppt_snow.shape, dtype=dtype), np.zeros(ppt_snow.shape, dtype=dtype))
+    ppt_snow = np.moveaxis(ppt_snow, axis, 0)
+    swe_melt = np.moveaxis(swe_melt, axis, 0)
+    swe_cum = np.moveaxis(out[0], axis, 0)
+    act_melt = np.moveaxis(out[1], axis, 0)
+    swe_cum[0, ...] = 0.0
+    act_melt[0, ...] = 0.0
+    if ppt_snow.shape[0] < 2:
+        return out
+
+    kernel = Compiled(ModelSWE_Kernel)
+    if kernel is not None:
+        RunTimeScan(kernel, (ppt_snow, swe_melt), (swe_cum, act_melt))
+    else:
+        _ModelSWE_Numpy(ppt_snow, swe_melt, swe_cum, act_melt)
+    return out
 
-def ModelSWE_2d(ppt_snow, swe_melt):
+def ModelSWE_2d(ppt_snow, swe_melt, out=None):
     """
-        Change in snow water equivalent when accounting for melt
+    Change in snow water equivalent when accounting for melt, see ModelSWE
 
-        Args:
-            ppt_snow: Precipitation that falls as snow
-            swe_melt: Snowmelt
+    Args:
+        ppt_snow: Precipitation that falls as snow (3d numpy array)
+        swe_melt: Snowmelt (3d numpy array)
+        out: Optional tuple of (swe_cum, act_melt) arrays to write results to (default: None)
 
-        Returns:
-            Cumulative snow water equivalent (SWE), and the actual amount of snow that melted
+    Returns:
+        Cumulative snow water equivalent (SWE), and the actual amount of snow that melted
+
+    """
+    return ModelSWE(ppt_snow, swe_melt, out)
 
-        """
-    swe_cum = np.zeros(ppt_snow.shape, dtype=np.float32)
-    act_melt = np.zeros(swe_melt.shape, dtype=np.float32)
-    for i in range(0, ppt_snow.shape[1]):
-        for j in range(0, ppt_snow.shape[2]):
-            for k in range(1, ppt_snow.shape[0]):
-                swe_inc = swe_cum[k-1, i, j] + ppt_snow[k, i, j] - swe_melt[k, i, j]
-                if swe_inc > 0.0:
-                    swe_cum[k, i, j] = swe_inc
-                    act_melt[k, i, j] = swe_melt[k, i, j]
-                else:
-                    act_melt[k, i, j] = swe_cum[k-1, i, j]
+def _ModelSWE_Numpy(ppt_snow, swe_melt, swe_cum, act_melt):
+    """
+    Time scan for ModelSWE, each step updates all points at once. Results are written to swe_cum and act_melt.
 
-    return swe_cum, act_melt
+    """
+    # the increment is evaluated in the input precision and only rounded when stored, as in the scalar model
+    swe_inc = np.empty(ppt_snow.shape[1:], dtype=np.result_type(swe_cum, ppt_snow, swe_melt))
+    melted = np.empty(ppt_snow.shape[1:], dtype=bool)
+    for i in range(1, ppt_snow.shape[0]):
+        np.add(swe_cum[i-1, ...], ppt_snow[i, ...], out=swe_inc)
+        np.subtract(swe_inc, swe_melt[i, ...], out=swe_inc)
+        np.greater(swe_inc, 0.0, out=melted)
+        np.copyto(swe_cum[i, ...], swe_inc)
+        np.copyto(act_melt[i, ...], swe_melt[i, ...])
+        # all remaining snow melts where the increment is not positive
+        np.logical_not(melted, out=melted)
+        np.copyto(act_melt[i, ...], swe_cum[i-1, ...], where=melted)
+        np.copyto(swe_cum[i, ...], 0.0, where=melted)
 
 def PrecipDaily(acprecip):
     """
@@ -99,66 +168,76 @@ def PrecipInput(ppt_rain, swe, swe_melt):
     ppt_in = np.add(melt, ppt_rain)
     return ppt_in
 
-def PrecipPhase(precip, temp, train=3.0, tsnow=0.0):
+def PrecipPhase(precip, temp, train=3.0, tsnow=0.0, out=None, dtype=None):
     """
-    Determine the amount of precipitation falling as snow
+    Determine the amount of precipitation falling as snow. All arguments are broadcast against each other, so gridded
+    inputs and spatially variable thresholds (e.g. elevation dependent) are handled in one pass.
 
     Args:
         precip: Daily precipitation (numpy array)
         temp: Daily mean (or min or max) air temperature (numpy array)
         train: Temperature at which all precipitation becomes rain (default = 3.0 C)
         tsnow: Temperature at which all precipitation becomes snow (default = 0.0 C)
+        out: Optional tuple of (snow, rain) arrays to write results to (default: None, new arrays of the floating
+            type of precip, see precision.FloatType)
+        dtype: Optional floating point type of new output arrays (default: None)
 
     Returns:
-        Daily precipitation falling as snow
+        Daily precipitation falling as snow, and daily precipitation falling as rain
 
     """
-    snow = np.where(temp < train, np.where(temp>tsnow, np.multiply(precip, np.divide(np.subtract(temp,tsnow),
-                                                                                     (train-tsnow))), precip), 0.0)
-    rain = np.subtract(precip, snow)
+    precip = np.asarray(precip)
+    temp = np.asarray(temp)
+    if out is None:
+        shape = np.broadcast_shapes(precip.shape, temp.shape, np.shape(train), np.shape(tsnow))
+        dtype = FloatType(precip, dtype=dtype)
+        snow = np.empty(shape, dtype=dtype)
+        rain = np.empty(shape, dtype=dtype)
+    else:
+        snow, rain = out
+
+    # proportional snow between thresholds, all snow at or below tsnow, no snow at or above train
+    np.subtract(temp, tsnow, out=snow)
+    np.divide(snow, np.subtract(train, tsnow), out=snow)
+    np.multiply(snow, precip, out=snow)
+    np.copyto(snow, precip, where=np.less_equal(temp, tsnow), casting='same_kind')
+    np.copyto(snow, 0.0, where=np.logical_not(np.less(temp, train)))
+    np.subtract(precip, snow, out=rain)
     return snow, rain
 
-def PrecipPhase_2d(precip, temp, train=3.0, tsnow=0.0):
+def PrecipPhase_2d(precip, temp, train=3.0, tsnow=0.0, out=None):
     """
-    Determine the amount of precipitation falling as snow
+    Determine the amount of precipitation falling as snow, see PrecipPhase
 
     Args:
         precip: Daily precipitation (3d numpy array)
         temp: Daily mean (or min or max) air temperature (3d numpy array)
-        train: Temperature at which all precipitation becomes rain (default = 3.0 C)
-        tsnow: Temperature at which all precipitation becomes snow (default = 0.0 C)
+        train: Temperature at which all precipitation becomes rain, scalar or 2d grid (default = 3.0 C)
+        tsnow: Temperature at which all precipitation becomes snow, scalar or 2d grid (default = 0.0 C)
+        out: Optional tuple of (snow, rain) arrays to write results to (default: None)
 
     Returns:
-        Daily precipitation falling as snow
+        Daily precipitation falling as snow, and daily precipitation falling as rain
 
     """
-    snow = np.zeros(precip.shape)
-    for i in np.arange(0, precip.shape[1]):
-        for j in np.arange(0, precip.shape[2]):
-            snow[:, i, j] = np.where(temp[:, i, j] < train, np.where(temp[:, i, j] > tsnow,
-                                                          np.multiply(precip[:, i, j],
-                                                                      np.divide(np.subtract(temp[:, i, j], tsnow),
-                                                                                (train-tsnow))), precip[:, i, j]), 0.0)
-    rain = np.subtract(precip, snow)
-    return snow, rain
-
-def SnowAge(snowfall):
-    age = np.zeros(snowfall.shape)
-    if len(snowfall.shape) == 1:
-        for i in range(1, snowfall.shape[0]):
-            age[i] = np.where(snowfall[i] > 0, 0, age[i-1]+1)
-        return age
-
-    elif len(snowfall.shape) == 3:
-        for i in range(1, snowfall.shape[0]):
-            age[i,:,:] = np.where(snowfall[i,:,:] > 0, 0, age[i-1,:,:]+1)
-        return age
-
-    else:
-        print('ERROR: snowfall array not of acceptable shape, must have 1 or 3 dimensions')
-        return
-
+    return PrecipPhase(precip, temp, train, tsnow, out)
 
+def SnowAge(snowfall, swe=None, out=None, axis=0):
+    """
+    Days since last snowfall
 
+    Args:
+        snowfall: Precipitation falling as snow (numpy array)
+        swe: Optional snow water equivalent (same shape as snowfall). If given, age is reset to zero on days without a
+            snowpack, i.e. after the snow melts out (default: None, assumes snow never melts)
+        out: Optional array to write results to (default: None)
+        axis: Time axis (default: 0)
 
+    Returns:
+        Days since last snowfall (numpy array)
 
+    """
+    reset = None
+    if swe is not None:
+        reset = np.less_equal(swe, 0.0)
+    return DaysSinceEvent(np.greater(snowfall, 0.0), reset, out, axis)
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+
+PRECISIONS = ('float32', 'float64')
+
+# floating point type of arrays allocated by hydmod kernels and models, from the HYDMOD_PRECISION environment variable
+# (default: float64). A run can override it with the dtype argument of the model, e.g. SMRModel(..., dtype=np.float32).
+precision = np.dtype(os.environ.get('HYDMOD_PRECISION', 'float64'))
+if precision.name not in PRECISIONS:
+    raise ValueError('HYDMOD_PRECISION must be one of ' + str(PRECISIONS) + ', not ' + repr(precision.name))
+
+
+class CompensatedSum(object):
+    """
+    Running total in float64 with Neumaier compensation, for mass balance terms accumulated over many time steps.
+    Each added array is summed pairwise in float64 first, so float32 state still gives a trustworthy balance.
+
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.compensation = 0.0
+
+    def add(self, values):
+        """
+        Add the sum of an array (or a scalar) to the total
+
+        Args:
+            values: values to add
+
+        """
+        value = float(np.sum(values, dtype=np.float64))
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+
+    @property
+    def value(self):
+        return self.total + self.compensation
+
+
+def FloatType(*values, dtype=None):
+    """
+    Floating point type of results computed from input values: floating inputs keep their type (e.g. float32 stays
+    float32), and the global precision is used only for inputs without one (e.g. integers or booleans)
+
+    Args:
+        *values: input arrays or scalars
+        dtype: type requested by the caller, overrides the inputs (default: None)
+
+    Returns:
+        numpy dtype
+
+    """
+    if dtype is not None:
+        return Precision(dtype)
+    floats = [x for x in values if np.issubdtype(np.asarray(x).dtype, np.floating)]
+    return np.result_type(*floats) if floats else precision
+
+def Precision(dtype=None):
+    """
+    Floating point type for a run
+
+    Args:
+        dtype: per-run type, overrides the global precision (default: None, the global precision)
+
+    Returns:
+        numpy dtype
+
+    """
+    if dtype is None:
+        return precision
+    dtype = np.dtype(dtype)
+    if dtype.name not in PRECISIONS:
+        raise ValueError('precision must be one of ' + str(PRECISIONS) + ', not ' + repr(dtype.name))
+    return dtype
+
+def SetPrecision(dtype):
+    """
+    Set the global floating point type of arrays allocated by hydmod
+
+    Args:
+        dtype: np.float32 or np.float64
+
+    """
+    global precision
+    precision = Precision(dtype)
+
+def Total(values):
+    """
+    Sum of all values accumulated in float64, e.g. for mass balance checks on float32 arrays
+
+    Args:
+        values: values to sum (numpy array)
+
+    Returns:
+        total (float)
+
+    """
+    return float(np.sum(values, dtype=np.float64))
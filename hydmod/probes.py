@@ -0,0 +1,175 @@
+import numpy as np
+
+# seconds per model time step (one day)
+SECONDS_PER_DAY = 86400.0
+
+
+class Probe(object):
+    """
+    Output of a model run that is updated after every step (see smr.SMRModel.run), so only the values a user needs
+    are kept instead of daily grids of every state variable. Subclasses allocate their outputs in start and update
+    them in record.
+    """
+
+    def start(self, model, ndays):
+        """
+        Allocate outputs for a run
+
+        Args:
+            model: model to record (smr.SMRModel)
+            ndays: number of days of the run
+
+        """
+        raise NotImplementedError
+
+    def record(self, model, i):
+        """
+        Record the state of the model after a step
+
+        Args:
+            model: model to record (smr.SMRModel)
+            i: day of the run (0 is the first day of the run)
+
+        """
+        raise NotImplementedError
+
+
+class PointProbe(Probe):
+    """
+    Daily series of state variables at cells of the grid, e.g. at a gauge or a soil moisture sensor
+
+    Args:
+        rows, cols: row and column of the cells on the full grid, scalars or arrays of the same shape
+        names: state variables to record (default: ('q',))
+
+    Attributes:
+        values: dictionary of (days, ...) arrays for each variable, (days, members, ...) for an ensemble, where ... is
+            the shape of rows and cols
+
+    """
+
+    def __init__(self, rows, cols, names=('q',)):
+        self.rows = rows
+        self.cols = cols
+        self.names = tuple(names)
+        self.values = {}
+
+    def start(self, model, ndays):
+        self._index = _CellIndex(model.grid, self.rows, self.cols)
+        lead = _LeadingShape(model)
+        self.values = {name: np.zeros((ndays,) + lead + np.shape(self._index), dtype=model.dtype)
+                       for name in self.names}
+
+    def record(self, model, i):
+        for name in self.names:
+            self.values[name][i] = _Cells(model, model.state[name], self._index)
+
+
+class OutletProbe(PointProbe):
+    """
+    Daily discharge (m^3/s) at outlet cells: accumulated runoff plus net lateral flow (state variable q) times the
+    cell area
+
+    Args:
+        rows, cols: row and column of the outlets on the full grid, scalars or arrays of the same shape
+        cellarea: area of a cell (m^2, default: None, from the geotransform of the grid)
+
+    Attributes:
+        discharge: (days, ...) array of discharge (m^3/s), (days, members, ...) for an ensemble
+
+    """
+
+    def __init__(self, rows, cols, cellarea=None):
+        PointProbe.__init__(self, rows, cols, names=('q',))
+        self.cellarea = cellarea
+
+    def start(self, model, ndays):
+        PointProbe.start(self, model, ndays)
+        geot = model.grid.geot
+        cellarea = abs(geot[1]*geot[5]) if self.cellarea is None else self.cellarea
+        self._scale = cellarea/SECONDS_PER_DAY
+        self.discharge = self.values['q']
+
+    def record(self, model, i):
+        self.discharge[i] = _Cells(model, model.state['q'], self._index)
+        self.discharge[i] *= self._scale
+
+
+class SnapshotProbe(Probe):
+    """
+    Full grids of state variables on selected days
+
+    Args:
+        days: days of the forcing to keep (0 is the first day of forcing), or dates (datetime64) when the forcing has
+            dates
+        names: state variables to record (default: ('s',))
+
+    Attributes:
+        days: recorded days of the forcing
+        values: dictionary of (snapshots, rows, cols) arrays for each variable, (snapshots, members, rows, cols) for
+            an ensemble, with nan outside the mask of a masked grid; days outside a run stay nan
+
+    """
+
+    def __init__(self, days, names=('s',)):
+        self.days = days
+        self.names = tuple(names)
+        self.values = {}
+
+    def start(self, model, ndays):
+        days = np.atleast_1d(self.days)
+        if np.issubdtype(days.dtype, np.datetime64):
+            if model.forcing.dates is None:
+                raise ValueError('forcing has no dates to select snapshots by')
+            dates = np.asarray(model.forcing.dates, dtype='datetime64[D]')
+            index = np.searchsorted(dates, days.astype('datetime64[D]'))
+            if np.any(index >= dates.size) or np.any(dates[np.minimum(index, dates.size - 1)] != days):
+                raise ValueError('snapshot dates are not in the forcing dates')
+            days = index
+        self.days = days.astype(int)
+        # snapshot of each day of the run, -1 when it is not kept
+        self._snapshot = np.full(ndays, -1, dtype=int)
+        run = self.days - model.day
+        inside = (run >= 0) & (run < ndays)
+        self._snapshot[run[inside]] = np.flatnonzero(inside)
+        shape = (self.days.size,) + _LeadingShape(model) + model.grid.shape
+        self.values = {name: np.full(shape, np.nan, dtype=model.dtype) for name in self.names}
+
+    def record(self, model, i):
+        k = self._snapshot[i]
+        if k < 0:
+            return
+        for name in self.names:
+            if model.grid.cells is None:
+                np.copyto(self.values[name][k], model.state[name])
+            else:
+                model.grid.cells.unpack(model.state[name], out=self.values[name][k])
+
+
+def _CellIndex(grid, rows, cols):
+    """
+    Index of cells in the flattened state of a grid (packed positions for a masked grid)
+    """
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    nrow, ncol = grid.shape
+    if np.any((rows < 0) | (rows >= nrow) | (cols < 0) | (cols >= ncol)):
+        raise ValueError('cells are outside the grid ' + str(grid.shape))
+    index = rows*ncol + cols
+    if grid.cells is not None:
+        index = grid.cells.position[index]
+        if np.any(index < 0):
+            raise ValueError('cells are outside the mask of the grid')
+    return index
+
+def _Cells(model, values, index):
+    """
+    Values of state at cells, with the leading (ensemble) axes kept
+    """
+    return values.reshape(_LeadingShape(model) + (-1,))[..., index]
+
+def _LeadingShape(model):
+    """
+    Axes of the model state before the grid (or packed cells), e.g. (members,) for an ensemble
+    """
+    return model.shape[:len(model.shape) - len(model.grid.state_shape)]
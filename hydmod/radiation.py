@@ -1,5 +1,8 @@
+from collections import OrderedDict
 from hydmod.conversions import *
 from hydmod.atmosphere import *
+from hydmod.precip import SnowAge
+from hydmod.precision import FloatType, Precision
 
 SOLAR_CONSTANT_MIN = 0.0820 # MJ m^-2 min^-1
 SOLAR_CONSTANT_DAY = 118.1 # MJ m^-2 day^-1
@@ -13,6 +16,13 @@ HEAT_CAPACITY_AIR = 1.0 # KJ/kg/C
 HEAT_FROM_GROUND = 173 # kJ/m^2/day
 STEFAN_BOLTZMANN_CONSTANT = 5.6697 * 10.0 ** (-8.0) # kW m^-2 K^-4
 
+# values of SolarGeometryCache, all functions of latitude and day of year only
+#   delta: solar declination, dr: inverse relative Earth-Sun distance, omegas: sunset hour angle, phi: solar elevation
+#   angle at solar noon, azs: solar azimuth angle at solar noon, ra: extraterrestrial radiation (kJ/m^2/day)
+SOLAR_GEOMETRY_FIELDS = ('delta', 'dr', 'omegas', 'phi', 'azs', 'sinphi', 'cosphi', 'sinazs', 'cosazs', 'ra')
+# energy fluxes summed by SnowEnergyBalance besides the heat from the ground (kJ/m^2)
+ENERGY_COMPONENTS = ('shortwave', 'longwave', 'sensible', 'latent')
+
 def ClearSkyRadiation(qo, transmissivity=0.75):
     """
     Predicted radiation at earth's surface
@@ -48,7 +58,8 @@ def DirectSolarRadiation_Adjustment(qin, pfc=0.0, snowAlbedo=0.0, cc=0.0):
 
 def DirectSolarRadiation_SlopingSurface(lat, doy, qin, slope, aspect, units='radians'):
     """
-    Direct solar radiation incident on a sloping surface (MJ/m^2)
+    Direct solar radiation incident on a sloping surface (MJ/m^2). For repeated calls on the same terrain build a
+    TerrainIllumination once and use its radiation method.
 
     Args:
         lat: latitude
@@ -62,19 +73,7 @@ def DirectSolarRadiation_SlopingSurface(lat, doy, qin, slope, aspect, units='rad
         direct solar radiation (kJ/m^2)
 
     """
-    lat = ConvertToRadians(lat, units)
-    aspect = ConvertToRadians(aspect, units)
-    delta = SolarDeclination(doy) #solar declination angle
-    phi = SolarElevationAngle(lat, delta) #solar elevation angle
-    azs = SolarAzimuthAngle(phi, lat, delta) #solar azimuth angle
-    i = SolarIncidenceAngle_2d(slope, aspect, azs, phi) #angle sun's rays make with sloping surface
-    pt1 = np.divide(np.sin(i), np.sin(phi))
-    pt1 = np.where(pt1 <= 0.0, 0.0, pt1) #[pt1 <= 0.0] = 0.0
-    #pt2 = np.multiply((qcs), np.multiply(np.subtract(1.0, np.divide(pfc, 100.0)), np.subtract(1.0, snowAlbedo)))
-    #qs = np.multiply(pt1, pt2)
-    qs = np.multiply(pt1, qin)
-    qs = np.where(qs < 0.1, 0.1, qs) #[qs < 0.1] = 0.1
-    return qs #kJ/m^2
+    return TerrainIllumination(slope, aspect, units).radiation(lat, doy, qin, units) #kJ/m^2
 
 def EarthSunIRD(doy):
     """
@@ -155,17 +154,8 @@ def ExtraterrestrialRadiation_2d(lat, doy, units='radians'):
     """
     if units == 'degrees':
         lat = DegreesToRadians(lat)
-
-    dr = EarthSunIRD(doy)
-    delta = SolarDeclination(doy)
-    omegas = SunsetHourAngle(lat[np.newaxis, :, :], delta[:, np.newaxis, np.newaxis])
-
-    pt1 = np.multiply(((24.0*60.0)/PI)*SOLAR_CONSTANT_MIN, dr)
-    pt2 = np.multiply(np.multiply(omegas, np.sin(lat)[np.newaxis, :, :]), np.sin(delta)[:, np.newaxis, np.newaxis])
-    pt3 = np.multiply(np.multiply(np.cos(lat)[np.newaxis, :, :], np.cos(delta)[:, np.newaxis, np.newaxis]), np.sin(omegas))
-    Ra = np.multiply(pt1[:, np.newaxis, np.newaxis], np.add(pt2, pt3))
-
-    return Ra*1000 # kJ/m^2/day
+    # values are looked up per (latitude, day of year) and copied so callers may modify them
+    return np.array(SOLAR_GEOMETRY.lookup(lat, doy, ('ra',))['ra']) # kJ/m^2/day
 
 def HalfDayLength(lat, delta):
     """
@@ -212,7 +202,7 @@ def SensibleRadiation(tavg, windr):
     qsens = np.multiply(HEAT_CAPACITY_AIR, np.multiply(DENSITY_AIR, np.divide(tavg, np.divide(windr, 3600.0*24.0))))
     return qsens # KJ/m^2
 
-def SnowAlbedo(snowage, swe=0.0, exponent=-0.1908):
+def SnowAlbedo(snowage, swe=0.0, exponent=-0.1908, out=None):
     """
     Albedo value for snow as a function of days since last snowfall (snowage)
 
@@ -220,16 +210,110 @@ def SnowAlbedo(snowage, swe=0.0, exponent=-0.1908):
         snowage: days since last snowfall (days)
         swe: snow water equivalent (default: 0.0)
         exponent: exponential decay parameter (default: -0.1908)
+        out: optional array to write results to (default: None)
 
     Returns:
         snow albedo value (alpha)
 
     """
+    snowage = np.asarray(snowage)
+    if out is None:
+        out = np.zeros(np.broadcast_shapes(snowage.shape, np.shape(swe)), dtype=Precision())
+    else:
+        out[...] = 0.0
+    # decay is only evaluated for aged snow on the ground
+    aged = np.not_equal(snowage, 0.0) & np.greater(swe, 0.0)
+    np.power(snowage, exponent, out=out, where=aged)
+    np.multiply(out, 0.738, out=out, where=aged)
+    np.copyto(out, 0.738, where=np.equal(snowage, 0.0))
+    return out
+
+def SnowAlbedo_Snowfall(snowfall, swe, exponent=-0.1908, reset=True, out=None):
+    """
+    Albedo value for snow computed directly from snowfall and snow water equivalent
+
+    Args:
+        snowfall: precipitation falling as snow (numpy array, time on first axis)
+        swe: snow water equivalent (same shape as snowfall)
+        exponent: exponential decay parameter (default: -0.1908)
+        reset: reset snow age when the snowpack melts out (default: True)
+        out: optional array to write results to (default: None)
 
-    alpha = np.where(snowage == 0.0, 0.738, 0.0)
-    alpha = np.where((alpha == 0.0) & (swe > 0.0), np.multiply(0.738, np.power(snowage, exponent)), alpha)
+    Returns:
+        snow albedo value (alpha), zero where there is no snow
+
+    """
+    snowage = SnowAge(snowfall, swe if reset else None)
+    alpha = SnowAlbedo(snowage, swe, exponent, out)
+    np.copyto(alpha, 0.0, where=np.less_equal(swe, 0.0) & np.less_equal(snowfall, 0.0))
     return alpha
 
+def SnowEnergyBalance(qin, tavg, td, wind, cc, pfc=0.0, snowalbedo=0.0, tsnow=0.0, chunk=32, melt=True, out=None,
+                      components=False):
+    """
+    Energy available for snowmelt, fusing net shortwave (DirectSolarRadiation_Adjustment), longwave
+    (LongwaveRadiation), sensible (SensibleRadiation) and latent (LatentRadiation) heat and heat from the ground into
+    one pass. Days are processed in chunks, and inputs broadcast onto the grid (e.g. station series from a Forcing)
+    are evaluated once per day rather than per cell, so temporaries are bounded by the chunk size.
+
+    Args:
+        qin: incoming solar radiation on the surface (kJ/m^2), days on the first axis
+        tavg: average daily air temperature (C)
+        td: dewpoint temperature (C)
+        wind: wind speed (m/s)
+        cc: fraction of cloud cover
+        pfc: percent forest cover (default: 0.0)
+        snowalbedo: snow albedo (default: 0.0)
+        tsnow: temperature of the snow surface (C, default: 0.0)
+        chunk: number of days processed at a time (default: 32)
+        melt: also return the maximum melt (default: True)
+        out: optional array to write the total energy to (default: None, the floating type of the inputs, see
+            precision.FloatType)
+        components: also return the energy fluxes before they are summed, see ENERGY_COMPONENTS (default: False)
+
+    Returns:
+        total energy (kJ/m^2, at least 0), if melt the maximum melt it can produce (m), and if components a
+        dictionary of the flux components (kJ/m^2)
+
+    """
+    inputs = (qin, tavg, td, wind, cc, pfc, snowalbedo, tsnow)
+    shape = np.broadcast_shapes(*(np.shape(x) for x in inputs))
+    if out is None:
+        out = np.empty(shape, dtype=FloatType(*inputs))
+    maxmelt = np.empty(shape, dtype=out.dtype) if melt else None
+    fluxes = {name: np.empty(shape, dtype=out.dtype) for name in ENERGY_COMPONENTS} if components else None
+    views = [np.broadcast_to(x, shape) for x in inputs]
+    for start in range(0, shape[0], chunk):
+        days = slice(start, start + chunk)
+        qin, tavg, td, wind, cc, pfc, snowalbedo, tsnow = (_Compact(x[days]) for x in views)
+        q = out[days]
+        np.multiply(qin, np.multiply(np.subtract(1.0, np.divide(pfc, 100.0)), np.subtract(1.0, snowalbedo)), out=q)
+        if components:
+            fluxes['shortwave'][days] = q
+        longwave = LongwaveRadiation(tavg, pfc, cc)
+        q += longwave
+        # sensible and latent heat share the wind roughness (s/m), converted to days
+        wr = np.divide(3600.0*24.0, WindRoughness(wind, pfc))
+        sensible = np.multiply(HEAT_CAPACITY_AIR*DENSITY_AIR, np.multiply(tavg, wr))
+        q += sensible
+        vd = np.subtract(VaporDensity(VaporPressure(td), td), VaporDensity(VaporPressure(tsnow), tsnow))
+        latent = np.multiply(LATENT_HEAT_VAPORIZATION, np.multiply(vd, wr))
+        q += latent
+        if components:
+            fluxes['longwave'][days] = longwave
+            fluxes['sensible'][days] = sensible
+            fluxes['latent'][days] = latent
+        q += HEAT_FROM_GROUND
+        np.maximum(q, 0.0, out=q)
+        if melt:
+            np.divide(q, LATENT_HEAT_FUSION*DENSITY_WATER, out=maxmelt[days])
+    result = (out,) # kJ/m^2
+    if melt:
+        result += (maxmelt,) # m
+    if components:
+        result += (fluxes,) # kJ/m^2
+    return result[0] if len(result) == 1 else result
+
 def SolarAzimuthAngle(phi, lat, delta, tod=12, tsn=12, units='radians'):
     """
     Horizontal angle between due south and the sun
@@ -309,8 +393,9 @@ def SolarIncidenceAngle_2d(slope, aspect, az, phi):
 
     """
 
-    i_pt1 = np.multiply(np.sin(np.arctan(slope/100.0)), np.multiply(np.cos(phi), np.cos(np.subtract(az, aspect))))
-    i_pt2 = np.multiply(np.cos(np.arctan(slope/100.0)), np.sin(phi))
+    beta = np.arctan(np.divide(slope, 100.0))
+    i_pt1 = np.multiply(np.sin(beta), np.multiply(np.cos(phi), np.cos(np.subtract(az, aspect))))
+    i_pt2 = np.multiply(np.cos(beta), np.sin(phi))
     i = np.arcsin(np.add(i_pt1, i_pt2))
     # print(i)
     i = np.where(i>0.0, i, 0.0)
@@ -340,3 +425,343 @@ def SunsetHourAngle(phi, delta, units='radians'):
         return RadiansToDegrees(value)
     else:
         return value
+
+
+class SolarGeometryCache(object):
+    """
+    Solar geometry for each unique (latitude, day of year) pair, computed once and gathered onto grids of latitude and
+    series of days. Grids usually have a few unique latitudes (at most one per row) and runs at most 366 days of year,
+    so multi-year runs evaluate the trigonometry only once per pair. Each latitude keeps its days of year as a sorted
+    array, so a lookup loops over unique latitudes only, gathers the cached days with a vectorized search and computes
+    all missing pairs in one batch. Latitudes are kept in least recently used order and the oldest are evicted when
+    more than maxsize pairs are kept. A cache shared by all runs in a process is available as SOLAR_GEOMETRY.
+
+    Args:
+        maxsize: maximum number of (latitude, day of year) pairs to keep (default: 65536)
+
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        # latitude -> (sorted days of year, values of SOLAR_GEOMETRY_FIELDS for each day)
+        self._values = OrderedDict()
+
+    def clear(self):
+        self._values.clear()
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+
+    def lookup(self, lat, doy, fields=SOLAR_GEOMETRY_FIELDS):
+        """
+        Solar geometry for every day and latitude
+
+        Args:
+            lat: latitude (radians), scalar or grid
+            doy: day of year, scalar or series
+            fields: names of values to return (default: SOLAR_GEOMETRY_FIELDS)
+
+        Returns:
+            dictionary of arrays with shape doy.shape + lat.shape, read-only views broadcast over the grid when the
+            latitude is uniform
+
+        """
+        lat = np.asarray(lat, dtype=float)
+        doy = np.asarray(doy)
+        ulat, ilat = np.unique(lat, return_inverse=True)
+        udoy, idoy = np.unique(doy, return_inverse=True)
+        table = np.empty((udoy.size, ulat.size, len(SOLAR_GEOMETRY_FIELDS)))
+        # days of year (indices into udoy) missing for each latitude
+        missing = []
+        for j, l in enumerate(ulat.tolist()):
+            cached = self._values.get(l)
+            if cached is None:
+                missing.append((j, np.arange(udoy.size)))
+                continue
+            self._values.move_to_end(l)
+            days, values = cached
+            k = np.minimum(np.searchsorted(days, udoy), days.size - 1)
+            found = days[k] == udoy
+            table[found, j] = values[k[found]]
+            if not found.all():
+                missing.append((j, np.flatnonzero(~found)))
+        nmissing = sum(mi.size for j, mi in missing)
+        self.hits += udoy.size*ulat.size - nmissing
+        self.misses += nmissing
+        if missing:
+            mi = np.concatenate([mi for j, mi in missing])
+            mj = np.concatenate([np.full(mi.size, j) for j, mi in missing])
+            computed = _SolarGeometry(ulat[mj], udoy[mi])
+            table[mi, mj] = computed
+            start = 0
+            for j, mi in missing:
+                l = ulat[j].item()
+                days, values = self._values.pop(l, (udoy[:0], computed[:0]))
+                days = np.concatenate([days, udoy[mi]])
+                values = np.concatenate([values, computed[start:start + mi.size]])
+                order = np.argsort(days, kind='stable')
+                self._values[l] = (days[order], values[order])
+                self.size += mi.size
+                start += mi.size
+            while self.size > self.maxsize:
+                days, values = self._values.popitem(last=False)[1]
+                self.size -= days.size
+
+        idoy = idoy.reshape(doy.shape + (1,)*lat.ndim)
+        ilat = ilat.reshape(lat.shape)
+        shape = doy.shape + lat.shape
+        out = {}
+        for name in fields:
+            values = table[..., SOLAR_GEOMETRY_FIELDS.index(name)]
+            if ulat.size == 1:
+                out[name] = np.broadcast_to(values[idoy, 0], shape)
+            else:
+                out[name] = values[idoy, ilat]
+        return out
+
+
+class TerrainIllumination(object):
+    """
+    Static terrain factors for direct solar radiation on sloping surfaces. With the slope angle beta, the sine of the
+    solar incidence angle expands to
+
+        sin(i) = cos(phi)*cos(azs)*sin(beta)*cos(aspect) + cos(phi)*sin(azs)*sin(beta)*sin(aspect) + sin(phi)*cos(beta)
+
+    so the sines and cosines of slope and aspect are computed once, and each day needs only three multiply-adds per
+    cell with coefficients from the solar geometry cache. Optionally slope and aspect are quantized into bins and the
+    illumination factor is tabulated per (bin, day of year), reducing a day to a gather. With a horizon index, cells
+    shaded by surrounding terrain receive no direct radiation.
+
+    By default the factor is evaluated at solar noon. With steps, incidence is integrated over that many hour angles
+    between sunrise and sunset and divided by the integral on a horizontal surface, which captures the morning and
+    afternoon sun on east and west (and north) facing slopes. Sub-daily terms are summed chunk by chunk of days so a
+    (days, steps, rows, cols) array is never created; with bins and no horizon the hour axis only touches the lookup
+    table.
+
+    Args:
+        slope: slope of land surface (percent)
+        aspect: aspect of land surface
+        units: units for aspect; one of 'radians' (default) or 'degrees'
+        bins: optional number of (slope, aspect) bins to quantize terrain into, e.g. (32, 72), plus a bin of flat
+            cells (default: None, exact)
+        horizon: optional horizon angles of the terrain (horizon.HorizonIndex) (default: None, no shading)
+        steps: optional number of sub-daily steps to integrate over (default: None, solar noon only)
+        chunk: number of days integrated at a time when steps is given (default: 32)
+
+    """
+
+    def __init__(self, slope, aspect, units='radians', bins=None, horizon=None, steps=None, chunk=32):
+        beta = np.arctan(np.divide(slope, 100.0))
+        aspect = np.mod(ConvertToRadians(np.asarray(aspect, dtype=float), units), 2*np.pi)
+        beta, aspect = np.broadcast_arrays(beta, aspect)
+        self.shape = beta.shape
+        self.bins = bins
+        self.horizon = horizon
+        self.steps = steps
+        self.chunk = chunk
+        if bins is None:
+            self.index = None
+        else:
+            nslope, naspect = bins
+            # bin centres, slope angles between 0 and 90 degrees after bin 0 of flat cells, so horizontal ground
+            # keeps a factor of exactly 1 whatever its aspect
+            flat = beta == 0.0
+            sbin = np.where(flat, 0, np.minimum((beta/(0.5*np.pi)*nslope).astype(np.intp), nslope - 1) + 1)
+            abin = np.where(flat, 0, np.minimum((aspect/(2*np.pi)*naspect).astype(np.intp), naspect - 1))
+            used, index = np.unique(sbin*naspect + abin, return_inverse=True)
+            self.index = index.reshape(self.shape)
+            beta = np.where(used < naspect, 0.0, (used//naspect - 0.5)*(0.5*np.pi)/nslope)
+            aspect = (used % naspect + 0.5)*(2*np.pi)/naspect
+        # terrain factors are stored in the precision of the run, daily coefficients stay float64
+        self.sinbeta_cosaspect = (np.sin(beta)*np.cos(aspect)).astype(Precision())
+        self.sinbeta_sinaspect = (np.sin(beta)*np.sin(aspect)).astype(Precision())
+        self.cosbeta = np.cos(beta).astype(Precision())
+
+    def factor(self, lat, doy, units='radians', out=None):
+        """
+        Ratio of direct radiation on the sloping surface to radiation on a horizontal surface, at solar noon or
+        integrated over the day
+
+        Args:
+            lat: latitude, scalar or grid
+            doy: day of year, scalar or series
+            units: units for lat; one of 'radians' (default) or 'degrees'
+            out: optional array to write results to (default: None)
+
+        Returns:
+            illumination factor (doy.shape + grid shape)
+
+        """
+        lat = ConvertToRadians(np.asarray(lat, dtype=float), units)
+        doy = np.asarray(doy)
+        ulat, ilat = np.unique(lat, return_inverse=True)
+        if ulat.size > 1 and lat.shape != self.shape:
+            raise ValueError('latitude must be a scalar or have the shape of the terrain ' + str(self.shape))
+        udoy, idoy = np.unique(doy, return_inverse=True)
+        if self.steps is not None:
+            return self._Integrate(ulat, ilat, udoy, idoy, doy.shape, out)
+        geom = SOLAR_GEOMETRY.lookup(ulat, udoy, ('phi', 'azs', 'sinphi', 'cosphi', 'sinazs', 'cosazs'))
+        # coefficients per (day, latitude), divided by sin(phi) and zero when the sun stays below the horizon
+        sinphi = geom['sinphi']
+        up = sinphi > 0.0
+        ka = np.divide(geom['cosphi']*geom['cosazs'], sinphi, out=np.zeros(sinphi.shape), where=up)
+        kb = np.divide(geom['cosphi']*geom['sinazs'], sinphi, out=np.zeros(sinphi.shape), where=up)
+        kc = up.astype(float)
+        shape = doy.shape + self.shape
+        if out is None:
+            out = np.empty(shape, dtype=self.cosbeta.dtype)
+        if self.index is not None:
+            # factor for every (day, latitude, bin), then gathered onto the grid
+            lut = (ka[..., np.newaxis]*self.sinbeta_cosaspect + kb[..., np.newaxis]*self.sinbeta_sinaspect +
+                   kc[..., np.newaxis]*self.cosbeta)
+            np.maximum(lut, 0.0, out=lut)
+            if ulat.size == 1:
+                np.take(lut[idoy.ravel(), 0], self.index, axis=1, out=out.reshape((-1,) + self.shape))
+            else:
+                out[...] = lut[idoy.reshape(doy.shape + (1,)*len(self.shape)), ilat.reshape(self.shape), self.index]
+            return self._Shade(out, geom, idoy, ilat, ulat.size)
+        if ulat.size == 1:
+            # one latitude: per-day coefficients broadcast over the terrain grids
+            ex = doy.shape + (1,)*len(self.shape)
+            ka, kb, kc = ka[idoy, 0].reshape(ex), kb[idoy, 0].reshape(ex), kc[idoy, 0].reshape(ex)
+        else:
+            ex = idoy.reshape(doy.shape + (1,)*len(self.shape)), ilat.reshape(self.shape)
+            ka, kb, kc = ka[ex], kb[ex], kc[ex]
+        np.multiply(ka, self.sinbeta_cosaspect, out=out)
+        out += kb*self.sinbeta_sinaspect
+        out += kc*self.cosbeta
+        np.maximum(out, 0.0, out=out)
+        return self._Shade(out, geom, idoy, ilat, ulat.size)
+
+    def radiation(self, lat, doy, qin, units='radians', out=None):
+        """
+        Direct solar radiation incident on the sloping surface
+
+        Args:
+            lat: latitude, scalar or grid
+            doy: day of year, scalar or series
+            qin: input solar radiation (kJ/m^2), broadcastable to doy.shape + grid shape
+            units: units for lat; one of 'radians' (default) or 'degrees'
+            out: optional array to write results to (default: None)
+
+        Returns:
+            direct solar radiation (kJ/m^2), at least 0.1
+
+        """
+        out = self.factor(lat, doy, units, out)
+        np.multiply(out, qin, out=out)
+        np.maximum(out, 0.1, out=out)
+        return out #kJ/m^2
+
+    def _Integrate(self, ulat, ilat, udoy, idoy, doyshape, out):
+        """
+        Illumination factor integrated over sub-daily steps between sunrise and sunset
+        """
+        delta = SOLAR_GEOMETRY.lookup(ulat, udoy, ('delta',))['delta'][..., np.newaxis]
+        lat = ulat[np.newaxis, :, np.newaxis]
+        # hour angles at the middle of each step, per (day, latitude, step)
+        omegas = np.arccos(np.clip(-np.tan(lat)*np.tan(delta), -1.0, 1.0))
+        omega = omegas*((np.arange(self.steps) + 0.5)*(2.0/self.steps) - 1.0)
+        # direction of the sun as (north, east, up) components
+        up = np.sin(lat)*np.sin(delta) + np.cos(lat)*np.cos(delta)*np.cos(omega)
+        east = -np.cos(delta)*np.sin(omega)
+        north = np.cos(lat)*np.sin(delta) - np.sin(lat)*np.cos(delta)*np.cos(omega)
+        total = np.sum(np.maximum(up, 0.0), axis=-1, keepdims=True)
+        kn = np.divide(north, total, out=np.zeros(north.shape), where=total > 0.0)
+        ke = np.divide(east, total, out=np.zeros(east.shape), where=total > 0.0)
+        ku = np.divide(up, total, out=np.zeros(up.shape), where=total > 0.0)
+
+        shape = doyshape + self.shape
+        if out is None:
+            out = np.zeros(shape, dtype=self.cosbeta.dtype)
+        else:
+            out.fill(0.0)
+        stack = out.reshape((-1,) + self.shape)
+        days = idoy.ravel()
+        ex = (Ellipsis,) + (np.newaxis,)*len(self.shape)
+        if self.index is not None and self.horizon is None:
+            lut = np.zeros(kn.shape[:2] + self.cosbeta.shape)
+            for k in range(self.steps):
+                lut += np.maximum(kn[..., k, np.newaxis]*self.sinbeta_cosaspect +
+                                  ke[..., k, np.newaxis]*self.sinbeta_sinaspect + ku[..., k, np.newaxis]*self.cosbeta, 0.0)
+            if ulat.size == 1:
+                np.take(lut[days, 0], self.index, axis=1, out=stack)
+            else:
+                stack[...] = lut[days[ex], ilat.reshape(self.shape), self.index]
+            return out
+
+        if self.index is not None:
+            a, b, c = (self.sinbeta_cosaspect[self.index], self.sinbeta_sinaspect[self.index],
+                       self.cosbeta[self.index])
+        else:
+            a, b, c = self.sinbeta_cosaspect, self.sinbeta_sinaspect, self.cosbeta
+        if self.horizon is not None:
+            elevation = np.arcsin(np.clip(up, -1.0, 1.0))
+            azimuth = np.mod(np.arctan2(east, north), 2*np.pi)
+        if ulat.size > 1:
+            ilat = ilat.reshape(self.shape)
+        term = np.empty((min(self.chunk, days.size),) + self.shape, dtype=out.dtype)
+        for start in range(0, days.size, self.chunk):
+            d = days[start:start + self.chunk]
+            block = stack[start:start + self.chunk]
+            work = term[:d.size]
+            for k in range(self.steps):
+                if ulat.size == 1:
+                    sel = (d, 0, k)
+                    cn, ce, cu = kn[sel][ex], ke[sel][ex], ku[sel][ex]
+                else:
+                    sel = (d[ex], ilat, k)
+                    cn, ce, cu = kn[sel], ke[sel], ku[sel]
+                np.multiply(cn, a, out=work)
+                work += ce*b
+                work += cu*c
+                np.maximum(work, 0.0, out=work)
+                if self.horizon is not None:
+                    np.copyto(work, 0.0, where=self.horizon.shaded(elevation[sel], azimuth[sel]))
+                block += work
+        return out
+
+    def _Shade(self, out, geom, idoy, ilat, nlat):
+        """
+        Zero the factor of cells below the terrain horizon
+        """
+        if self.horizon is None:
+            return out
+        if nlat == 1:
+            phi, azs = geom['phi'][idoy, 0], geom['azs'][idoy, 0]
+        else:
+            ex = idoy.reshape(-1, *(1,)*len(self.shape)), ilat.reshape(self.shape)
+            phi, azs = geom['phi'][ex], geom['azs'][ex]
+        shaded = self.horizon.shaded(phi, azs)
+        np.copyto(out, 0.0, where=shaded.reshape(out.shape))
+        return out
+
+
+def _Compact(a):
+    """
+    View of an array with broadcast (zero stride) axes reduced to length 1
+    """
+    return a[tuple(slice(0, 1) if stride == 0 else slice(None) for stride in a.strides)]
+
+def _SolarGeometry(lat, doy):
+    """
+    Solar geometry for pairs of latitude (radians) and day of year, with the values of SOLAR_GEOMETRY_FIELDS on the
+    last axis
+    """
+    dr = EarthSunIRD(doy)
+    delta = SolarDeclination(doy)
+    omegas = SunsetHourAngle(lat, delta)
+    phi = SolarElevationAngle(lat, delta)
+    azs = SolarAzimuthAngle(phi, lat, delta)
+    pt1 = np.multiply(((24.0*60.0)/PI)*SOLAR_CONSTANT_MIN, dr)
+    pt2 = np.multiply(np.multiply(omegas, np.sin(lat)), np.sin(delta))
+    pt3 = np.multiply(np.multiply(np.cos(lat), np.cos(delta)), np.sin(omegas))
+    ra = np.multiply(pt1, np.add(pt2, pt3))*1000
+    return np.stack([delta, dr, omegas, phi, azs, np.sin(phi), np.cos(phi), np.sin(azs), np.cos(azs), ra], axis=-1)
+
+
+# solar geometry shared by all model runs in this process
+SOLAR_GEOMETRY = SolarGeometryCache()
@@ -0,0 +1,248 @@
+import numpy as np
+from hydmod.precision import FloatType
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+
+class RasterInputs(object):
+    """
+    Input rasters of a model (e.g. dem, slope and aspect), each opened once and kept open. All rasters must have the
+    size and geotransform of the first one, so their cells line up without resampling. Values are read by window
+    (row, col, rows, cols), and windows can be aligned to the GDAL block size of the first raster so every block is
+    decoded once. A large basin can then be loaded as the bounding window of the watershed only, or processed in
+    tiles. Nodata cells are taken from the GDAL mask band of each raster (nodata value, nan or alpha) and can be
+    combined into one mask for all inputs.
+
+    Args:
+        paths: dictionary of raster paths by name, the first raster defines the grid
+        band: band to read from each raster (default: 1)
+
+    """
+
+    def __init__(self, paths, band=1):
+        if gdal is None:
+            raise ImportError('RasterInputs requires GDAL (osgeo)')
+        self.paths = dict(paths)
+        self.datasets = {}
+        self.bands = {}
+        self.nodata = {}
+        for name, path in self.paths.items():
+            ds = gdal.Open(str(path), gdal.GA_ReadOnly)
+            if ds is None:
+                raise IOError('could not open raster ' + str(path))
+            shape = (ds.RasterYSize, ds.RasterXSize)
+            geot = tuple(ds.GetGeoTransform())
+            if not self.datasets:
+                self.shape = shape
+                self.geot = geot
+                self.projection = ds.GetProjection()
+                xblock, yblock = ds.GetRasterBand(band).GetBlockSize()
+                self.blocksize = (yblock, xblock)
+            elif shape != self.shape:
+                raise ValueError('raster ' + name + ' has shape ' + str(shape) + ', expected ' + str(self.shape))
+            elif not np.allclose(geot, self.geot, rtol=1e-9, atol=1e-6*abs(self.geot[1])):
+                raise ValueError('raster ' + name + ' has geotransform ' + str(geot) + ', expected ' + str(self.geot))
+            self.datasets[name] = ds
+            self.bands[name] = ds.GetRasterBand(band)
+            self.nodata[name] = self.bands[name].GetNoDataValue()
+
+    def close(self):
+        """
+        Close all datasets
+        """
+        self.bands = {}
+        self.datasets = {}
+
+    def geotransform(self, window=None):
+        """
+        Geotransform of a window
+
+        Args:
+            window: (row, col, rows, cols) (default: None, the full grid)
+
+        Returns:
+            GDAL geotransform
+
+        """
+        return self.geot if window is None else WindowGeoTransform(self.geot, window)
+
+    def mask(self, window=None, names=None):
+        """
+        Cells with data in every raster
+
+        Args:
+            window: (row, col, rows, cols) (default: None, the full grid)
+            names: rasters to combine (default: None, all rasters)
+
+        Returns:
+            boolean array, True where all rasters have data
+
+        """
+        row, col, nrows, ncols = self._Window(window)
+        valid = np.ones((nrows, ncols), dtype=bool)
+        for name in self.bands.keys() if names is None else names:
+            valid &= self.bands[name].GetMaskBand().ReadAsArray(col, row, ncols, nrows) > 0
+        return valid
+
+    def read(self, name, window=None, dtype=None, fill=None):
+        """
+        Values of a raster in a window
+
+        Args:
+            name: name of the raster
+            window: (row, col, rows, cols) (default: None, the full grid)
+            dtype: optional type to convert values to, e.g. np.float32 (default: None, the type of the raster)
+            fill: optional value to set nodata cells to, e.g. np.nan (default: None, nodata cells are not changed);
+                values of integer rasters are converted to floating point (see precision.FloatType) for a fill that
+                is not an integer
+
+        Returns:
+            numpy array (rows, cols)
+
+        """
+        row, col, nrows, ncols = self._Window(window)
+        values = self.bands[name].ReadAsArray(col, row, ncols, nrows)
+        if dtype is not None:
+            values = values.astype(dtype, copy=False)
+        if fill is not None and not np.issubdtype(values.dtype, np.inexact) and not float(fill).is_integer():
+            # nan has no integer value, so the fill of e.g. a 16 bit dem needs floating point values
+            if dtype is not None:
+                raise ValueError('fill ' + str(fill) + ' cannot be stored in values of type ' + str(values.dtype))
+            values = values.astype(FloatType(values))
+        if fill is not None:
+            values[self.bands[name].GetMaskBand().ReadAsArray(col, row, ncols, nrows) == 0] = fill
+        return values
+
+    def tiles(self, window=None, size=None):
+        """
+        Windows covering a window in tiles aligned to the block grid of the rasters
+
+        Args:
+            window: (row, col, rows, cols) to cover (default: None, the full grid)
+            size: (rows, cols) of the tiles, rounded up to whole blocks (default: None, one block)
+
+        Returns:
+            generator of (row, col, rows, cols) windows, clipped to window
+
+        """
+        row, col, nrows, ncols = self._Window(window)
+        yblock, xblock = self.blocksize
+        if size is None:
+            size = self.blocksize
+        ytile = -(-size[0]//yblock)*yblock
+        xtile = -(-size[1]//xblock)*xblock
+        for r0 in range(row - row % ytile, row + nrows, ytile):
+            r1 = min(r0 + ytile, row + nrows)
+            r0 = max(r0, row)
+            for c0 in range(col - col % xtile, col + ncols, xtile):
+                c1 = min(c0 + xtile, col + ncols)
+                c0 = max(c0, col)
+                yield (r0, c0, r1 - r0, c1 - c0)
+
+    def window(self, xmin, ymin, xmax, ymax, align=True):
+        """
+        Window of the cells intersecting a bounding box in map coordinates, e.g. the extent of a watershed
+
+        Args:
+            xmin, ymin, xmax, ymax: bounding box in the coordinates of the rasters
+            align: expand the window to whole blocks (default: True)
+
+        Returns:
+            (row, col, rows, cols)
+
+        """
+        x0, dx, rx, y0, ry, dy = self.geot
+        if rx != 0.0 or ry != 0.0:
+            raise ValueError('rotated geotransforms are not supported')
+        cols = np.sort([(xmin - x0)/dx, (xmax - x0)/dx])
+        rows = np.sort([(ymin - y0)/dy, (ymax - y0)/dy])
+        row0 = max(int(np.floor(rows[0])), 0)
+        col0 = max(int(np.floor(cols[0])), 0)
+        row1 = min(int(np.ceil(rows[1])), self.shape[0])
+        col1 = min(int(np.ceil(cols[1])), self.shape[1])
+        if row1 <= row0 or col1 <= col0:
+            raise ValueError('bounding box does not intersect the rasters')
+        window = (row0, col0, row1 - row0, col1 - col0)
+        return AlignWindow(window, self.blocksize, self.shape) if align else window
+
+    def _Window(self, window):
+        if window is None:
+            return (0, 0) + self.shape
+        row, col, nrows, ncols = (int(x) for x in window)
+        if row < 0 or col < 0 or row + nrows > self.shape[0] or col + ncols > self.shape[1]:
+            raise ValueError('window ' + str(window) + ' is outside the rasters ' + str(self.shape))
+        return row, col, nrows, ncols
+
+
+def AlignWindow(window, blocksize, shape):
+    """
+    Expand a window to whole blocks, clipped to the grid
+
+    Args:
+        window: (row, col, rows, cols)
+        blocksize: (rows, cols) of a block
+        shape: (rows, cols) of the grid
+
+    Returns:
+        (row, col, rows, cols)
+
+    """
+    row, col, nrows, ncols = window
+    row0 = row - row % blocksize[0]
+    col0 = col - col % blocksize[1]
+    row1 = min(-(-(row + nrows)//blocksize[0])*blocksize[0], shape[0])
+    col1 = min(-(-(col + ncols)//blocksize[1])*blocksize[1], shape[1])
+    return (row0, col0, row1 - row0, col1 - col0)
+
+def BoundingWindow(mask, blocksize=None):
+    """
+    Smallest window containing all True cells of a mask, e.g. the cells of a watershed
+
+    Args:
+        mask: boolean grid
+        blocksize: optional (rows, cols) of a block to align the window to (default: None)
+
+    Returns:
+        (row, col, rows, cols)
+
+    """
+    mask = np.asarray(mask, dtype=bool)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        raise ValueError('mask has no cells')
+    window = (int(rows[0]), int(cols[0]), int(rows[-1] - rows[0] + 1), int(cols[-1] - cols[0] + 1))
+    return window if blocksize is None else AlignWindow(window, blocksize, mask.shape)
+
+def WindowGeoTransform(geot, window):
+    """
+    Geotransform of a window of a grid
+
+    Args:
+        geot: GDAL geotransform of the grid
+        window: (row, col, rows, cols)
+
+    Returns:
+        GDAL geotransform of the window
+
+    """
+    row, col = window[0], window[1]
+    return (geot[0] + col*geot[1] + row*geot[2], geot[1], geot[2],
+            geot[3] + col*geot[4] + row*geot[5], geot[4], geot[5])
+
+def WindowSlices(window):
+    """
+    Slices selecting a window from a grid array
+
+    Args:
+        window: (row, col, rows, cols)
+
+    Returns:
+        (row slice, column slice)
+
+    """
+    row, col, nrows, ncols = window
+    return slice(row, row + nrows), slice(col, col + ncols)
@@ -0,0 +1,342 @@
+import numpy as np
+from hydmod.domain import ActiveCells
+from hydmod.et import ET_theta_2d
+from hydmod.forcing import Forcing
+from hydmod.flow_routing import FlowNetwork_rd, FlowProportions_Sparse
+from hydmod.groundwater import Baseflow, LateralFlow_Darcy_2d, Percolation_2d, WaterTableHeight
+from hydmod.point import SMRPoint # moved to hydmod.point, still importable from here
+from hydmod.precision import CompensatedSum, Precision, Total
+
+try:
+    import richdem as rd
+except ImportError:
+    rd = None
+
+# state variables of the soil moisture routing model, all in m/day (storages in m)
+#   s: soil water storage, hwt: water table height, qlat_out: lateral flow out of a cell, qlat_in: lateral flow into
+#   a cell, aet: actual evapotranspiration, perc: percolation, r: saturation excess runoff, ra: accumulated runoff,
+#   sb: aquifer storage, bf: baseflow, q: discharge (accumulated runoff plus net lateral flow)
+STATE_VARIABLES = ('s', 'hwt', 'qlat_out', 'qlat_in', 'aet', 'perc', 'r', 'ra', 'sb', 'bf', 'q')
+# storages carried from one day to the next, kept in two slots (previous and current day)
+STORAGES = ('s', 'sb')
+# fluxes into (+1) and out of (-1) the soil and aquifer storage of the model domain, summed for the mass balance
+BALANCE_TERMS = (('ppt', 1.0), ('qlat_in', 1.0), ('qlat_out', -1.0), ('aet', -1.0), ('r', -1.0), ('bf', -1.0))
+
+
+class SMRGrid(object):
+    """
+    Terrain for the soil moisture routing (SMR) model. With a mask (e.g. the watershed), only cells inside it are
+    simulated: terrain, flow networks and model state are packed into 1d vectors of the active cells in routing order
+    (see domain.ActiveCells), and flow leaving the mask leaves the model domain.
+
+    Args:
+        dem: depression filled digital elevation model (2d numpy array)
+        slope: slope of land surface (percent)
+        geot: GDAL geotransform of the dem
+        nodata: no data value for dem (default: -9999)
+        dtype: floating point type of slope and flow proportions (default: None, see precision.Precision)
+        mask: optional boolean grid of the cells to simulate (default: None, all cells)
+        network: optional runoff routing graph of the full grid (flow_routing.FlowNetwork) (default: None, the
+            D-infinity network of the dem from richdem)
+
+    """
+
+    def __init__(self, dem, slope, geot, nodata=-9999, dtype=None, mask=None, network=None):
+        self.dem = np.asarray(dem)
+        self.shape = self.dem.shape
+        self.slope = np.divide(slope, 100.0).astype(Precision(dtype))
+        self.geot = geot
+        self.cellsize = geot[1]
+        self.nodata = nodata
+        # lateral flow proportions to downhill neighbours
+        self.lateral = FlowProportions_Sparse(self.dem, nodata, dtype)
+        if network is None:
+            if rd is None:
+                raise ImportError('SMRGrid requires richdem to build the runoff routing network, or a network')
+            rddem = rd.rdarray(self.dem, no_data=nodata)
+            rddem.geotransform = geot
+            # runoff routing graph, built once since the dem does not change
+            network = FlowNetwork_rd(rddem, method='Dinf')
+        elif network.shape != self.shape:
+            raise ValueError('network of shape ' + str(network.shape) + ' does not match the dem ' + str(self.shape))
+        self.network = network
+        self.cells = None
+        if mask is not None:
+            self.cells = ActiveCells(mask, self.network)
+            self.slope = self.cells.pack(self.slope)
+            self.lateral = self.cells.pack_network(self.lateral)
+            self.network = self.cells.pack_network(self.network)
+        # shape of state grids, (cells,) when packed
+        self.state_shape = self.shape if self.cells is None else (self.cells.size,)
+
+    def accumulate(self, weights, out=None):
+        """
+        Weighted D-infinity flow accumulation
+
+        Args:
+            weights: amount of water in each cell, a grid or a stack of grids (packed cells with a mask)
+            out: optional array to write accumulated values to (default: None)
+
+        Returns:
+            accumulated values
+
+        """
+        return self.network.accumulate(weights, out)
+
+
+class SMRParameters(object):
+    """
+    Soil and aquifer parameters for the soil moisture routing (SMR) model. Each parameter is a scalar or a grid, or
+    has a leading ensemble axis (see ensemble.EnsembleParameter) to simulate several parameter sets at once.
+
+    Args:
+        soildepth: depth of soil profile (m)
+        por: soil porosity
+        fc: soil field capacity
+        wp: soil wilting point
+        ksat: saturated hydraulic conductivity (m/day)
+        ksub: hydraulic conductivity of the substratum (m/day)
+        alpha: baseflow recession coefficient (default: 0.02)
+        dtype: floating point type of the parameters (default: None, see precision.Precision)
+
+    """
+
+    def __init__(self, soildepth, por, fc, wp, ksat, ksub, alpha=0.02, dtype=None):
+        dtype = Precision(dtype)
+        self.dtype = dtype
+        self.soildepth = np.asarray(soildepth, dtype=dtype)
+        self.por = np.asarray(por, dtype=dtype)
+        self.fc = np.asarray(fc, dtype=dtype)
+        self.wp = np.asarray(wp, dtype=dtype)
+        self.ksat = np.asarray(ksat, dtype=dtype)
+        self.ksub = np.asarray(ksub, dtype=dtype)
+        self.alpha = np.asarray(alpha, dtype=dtype)
+        # water contents as depths of water in the soil profile
+        self.smax = self.por*self.soildepth
+        self.fcl = self.fc*self.soildepth
+        self.wpl = self.wp*self.soildepth
+        self.shape = np.broadcast_shapes(self.soildepth.shape, self.por.shape, self.fc.shape, self.wp.shape,
+                                         self.ksat.shape, self.ksub.shape, self.alpha.shape)
+
+    def pack(self, cells):
+        """
+        Parameters at the active cells of a grid
+
+        Args:
+            cells: active cells (domain.ActiveCells)
+
+        Returns:
+            SMRParameters with grids packed to (..., cells)
+
+        """
+        return SMRParameters(cells.pack(self.soildepth), cells.pack(self.por), cells.pack(self.fc), cells.pack(self.wp),
+                             cells.pack(self.ksat), cells.pack(self.ksub), cells.pack(self.alpha), self.dtype)
+
+
+class SMRModel(object):
+    """
+    Soil moisture routing (SMR) model (Frankenberger et al. 1999). State is held in preallocated grids that are
+    updated in place each day. If parameters have an ensemble axis, state grids have shape (members, rows, cols) and
+    all members are simulated together over the shared forcing and terrain. State may be held in float32 (dtype or
+    precision.SetPrecision); the fluxes in and out of the domain are still totalled in float64 with compensated
+    summation, so the mass balance (see mass_balance) stays exact to float64 rounding. On a masked grid (see SMRGrid)
+    state is packed to the active cells, and parameters and forcing are packed as they are read.
+
+    Args:
+        grid: terrain (SMRGrid)
+        params: soil and aquifer parameters (SMRParameters)
+        forcing: daily water input ('ppt', rain plus snowmelt) and potential evapotranspiration ('pet') in m/day, as
+            a Forcing or a mapping of (days, rows, cols) arrays; ensemble stacks (members, days, rows, cols) are
+            combined with ensemble parameters
+        storage: initial soil water storage (m, default: 0.0)
+        aquifer: initial aquifer storage (m, default: 0.0)
+        dtype: floating point type of the state grids (default: None, see precision.Precision)
+        start: first day of the forcing to simulate (default: 0). The first recorded day is the state at the end of
+            that day. The original daily loops of the driver scripts used day 0 as the initial state and stepped
+            from day 1; start=1 reproduces them.
+
+    """
+
+    def __init__(self, grid, params, forcing, storage=0.0, aquifer=0.0, dtype=None, start=0):
+        self.grid = grid
+        self.params = params if grid.cells is None else params.pack(grid.cells)
+        self.dtype = Precision(dtype)
+        if not isinstance(forcing, Forcing):
+            forcing = Forcing(grid.shape, dtype=self.dtype, **forcing)
+        self.forcing = forcing
+        self.ndays = forcing.ndays
+        # packed forcing of a masked grid, gathered into the same buffers every day
+        self._packed = {}
+        if not 0 <= start < self.ndays:
+            raise ValueError('start day ' + str(start) + ' is outside the ' + str(self.ndays) + ' days of forcing')
+        self.start = start
+        self.shape = np.broadcast_shapes(grid.state_shape, self.params.shape,
+                                         *(self._Forcing(name, 0).shape for name in forcing.keys()))
+        # two slots for each storage, the previous day and the current day, swapped every step instead of copied
+        self._slots = {name: (np.zeros(self.shape, dtype=self.dtype), np.zeros(self.shape, dtype=self.dtype))
+                       for name in STORAGES}
+        self.state = {name: self._slots[name][0] if name in STORAGES else np.zeros(self.shape, dtype=self.dtype)
+                      for name in STATE_VARIABLES}
+        self._slot = 0
+        self.previous = {}
+        self._work = np.zeros(self.shape, dtype=self.dtype)
+        self.reset(storage, aquifer)
+
+    def reset(self, storage=0.0, aquifer=0.0):
+        """
+        Set the model back to its initial state at the start day
+
+        Args:
+            storage: initial soil water storage (m, default: 0.0)
+            aquifer: initial aquifer storage (m, default: 0.0)
+
+        """
+        for value in self.state.values():
+            value.fill(0.0)
+        self._slot = 0
+        for name, value in (('s', storage), ('sb', aquifer)):
+            self.state[name], self.previous[name] = self._slots[name]
+            self.state[name][...] = value
+            self.previous[name][...] = value
+        self.day = self.start
+        self.route_residual = 0.0
+        self.storage0 = Total(self.state['s']) + Total(self.state['sb'])
+        self.totals = {name: CompensatedSum() for name, sign in BALANCE_TERMS}
+
+    def mass_balance(self):
+        """
+        Water balance of the model domain since the last reset, summed over all cells (and ensemble members) in float64
+
+        Returns:
+            dictionary of total fluxes (m, see BALANCE_TERMS), initial and final storage, and the error (initial
+            storage plus inflows minus outflows minus final storage)
+
+        """
+        balance = {name: total.value for name, total in self.totals.items()}
+        balance['storage0'] = self.storage0
+        balance['storage'] = Total(self.state['s']) + Total(self.state['sb'])
+        balance['error'] = (self.storage0 + sum(sign*balance[name] for name, sign in BALANCE_TERMS) -
+                            balance['storage'])
+        return balance
+
+    def unpack(self, values, fill=np.nan):
+        """
+        State values on the grid
+
+        Args:
+            values: state values, e.g. self.state['s'] or a recorded series (..., cells) when the grid is masked
+            fill: value of cells outside the mask (default: nan)
+
+        Returns:
+            values (..., rows, cols), unchanged when the grid is not masked
+
+        """
+        if self.grid.cells is None:
+            return values
+        return self.grid.cells.unpack(values, fill)
+
+    def step(self):
+        """
+        Advance the model one day
+
+        Returns:
+            dictionary of state grids at the end of the day (overwritten by the next step), packed to the active
+            cells when the grid is masked (see unpack); storages of the day before are in self.previous
+
+        """
+        if self.day >= self.ndays:
+            raise IndexError('simulation has reached the end of the forcing data')
+        p = self.params
+        st = self.state
+        # the current storages become the previous day and the new day is written over the older slot
+        self._slot = 1 - self._slot
+        for name in STORAGES:
+            self.previous[name] = st[name]
+            st[name] = self._slots[name][self._slot]
+        s = st['s']
+        sb = st['sb']
+        s_prev = self.previous['s']
+        sb_prev = self.previous['sb']
+        theta = self._work
+
+        # water input and lateral flow
+        ppt = self._Forcing('ppt', self.day)
+        np.add(s_prev, ppt, out=s)
+        np.divide(s, p.soildepth, out=theta)
+        WaterTableHeight(p.por, p.fc, theta, p.soildepth, out=st['hwt'])
+        LateralFlow_Darcy_2d(p.ksat, self.grid.slope, st['hwt'], self.grid.cellsize, self.grid.cellsize,
+                             out=st['qlat_out'])
+        self.route_residual = self.grid.lateral.route(st['qlat_out'], out=st['qlat_in'], residual=True)[1]
+        np.add(s, st['qlat_in'], out=s)
+        np.subtract(s, st['qlat_out'], out=s)
+
+        # evapotranspiration is limited by the water content at the end of the previous day
+        ET_theta_2d(self._Forcing('pet', self.day), p.fcl, p.wpl, s_prev, out=st['aet'])
+        np.subtract(s, st['aet'], out=s)
+
+        # percolation to and baseflow from the aquifer
+        np.divide(s, p.soildepth, out=theta)
+        WaterTableHeight(p.por, p.fc, theta, p.soildepth, out=theta)
+        Percolation_2d(p.ksub, theta, out=st['perc'])
+        np.subtract(s, st['perc'], out=s)
+        Baseflow(p.alpha, sb_prev, out=st['bf'])
+        np.add(sb_prev, st['perc'], out=sb)
+        np.subtract(sb, st['bf'], out=sb)
+
+        # saturation excess runoff
+        np.subtract(s, p.smax, out=st['r'])
+        np.maximum(st['r'], 0.0, out=st['r'])
+        self.grid.accumulate(st['r'], out=st['ra'])
+        np.minimum(s, p.smax, out=s)
+
+        np.add(st['ra'], st['qlat_in'], out=st['q'])
+        np.subtract(st['q'], st['qlat_out'], out=st['q'])
+        self.totals['ppt'].add(np.broadcast_to(ppt, self.shape))
+        for name in ('qlat_in', 'qlat_out', 'aet', 'r', 'bf'):
+            self.totals[name].add(st[name])
+        self.day += 1
+        return st
+
+    def run(self, ndays=None, record=STATE_VARIABLES, probes=()):
+        """
+        Run the model. Daily grids take memory in proportion to the length of the run times the size of the grid, so
+        long runs should record only what is needed with probes (see probes.PointProbe, probes.OutletProbe and
+        probes.SnapshotProbe) and record=().
+
+        Args:
+            ndays: number of days to run (default: None, all remaining days of forcing data)
+            record: names of state variables to keep daily grids of (default: all state variables)
+            probes: probes (probes.Probe) updated after every day (default: none)
+
+        Returns:
+            dictionary of (days, rows, cols) (or (days, members, rows, cols)) arrays for each recorded variable,
+            with nan outside the mask of a masked grid
+
+        """
+        if ndays is None:
+            ndays = self.ndays - self.day
+        out = {name: np.zeros((ndays,) + self.shape, dtype=self.dtype) for name in record}
+        for probe in probes:
+            probe.start(self, ndays)
+        for i in range(ndays):
+            self.step()
+            for name in record:
+                np.copyto(out[name][i], self.state[name])
+            for probe in probes:
+                probe.record(self, i)
+        return {name: self.unpack(values) for name, values in out.items()}
+
+    def _Forcing(self, name, day):
+        """
+        Forcing of a day, packed to the active cells of a masked grid
+        """
+        values = self.forcing.day(name, day)
+        cells = self.grid.cells
+        if cells is None:
+            return values
+        shape = values.shape[:-2] + (cells.size,)
+        buffer = self._packed.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != values.dtype:
+            buffer = self._packed[name] = np.empty(shape, dtype=values.dtype)
+        # station forcing is packed to a view of its value and leaves the buffer unused
+        return cells.pack(values, out=buffer)
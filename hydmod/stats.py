@@ -1,47 +1,163 @@
 import numpy as np
 
-def MeanDifference(modeled, observed):
+def KGE(modeled, observed, axis=0):
     """
-    Mean difference between modeled and observed values
+    Kling-Gupta Efficiency (Gupta et al. 2009)
 
     Args:
-        modeled: Modeled values (numpy array 1D)
-        observed: Observed values (numpy array 1D)
+        modeled: Modeled values (numpy array)
+        observed: Observed values (numpy array)
+        axis: axis of time, the metric is computed for every other element (e.g. per cell or ensemble member)
+            (default: 0)
+
+    Returns:
+        KGE value, pairs with missing (nan) values are ignored
+
+    """
+    m, o, n = _ValidPairs(modeled, observed, axis)
+    mean_m = _Divide(np.nansum(m, axis=axis), n)
+    mean_o = _Divide(np.nansum(o, axis=axis), n)
+    dm = np.subtract(m, np.expand_dims(mean_m, axis), where=~np.isnan(m), out=np.zeros(m.shape))
+    do = np.subtract(o, np.expand_dims(mean_o, axis), where=~np.isnan(o), out=np.zeros(o.shape))
+    return _KGE(np.sum(dm*do, axis=axis), np.sum(dm*dm, axis=axis), np.sum(do*do, axis=axis), mean_m, mean_o)
+
+def MeanDifference(modeled, observed, axis=0):
+    """
+    Mean difference (bias) between modeled and observed values
+
+    Args:
+        modeled: Modeled values (numpy array)
+        observed: Observed values (numpy array)
+        axis: axis of time, the metric is computed for every other element (default: 0)
 
     Returns:
-        Mean Difference value
+        Mean Difference value, pairs with missing (nan) values are ignored
 
     """
-    return(np.mean(np.subtract(modeled, observed)))
+    m, o, n = _ValidPairs(modeled, observed, axis)
+    return(_Divide(np.nansum(np.subtract(m, o), axis=axis), n))
 
-def NSE(modeled, observed):
+def NSE(modeled, observed, axis=0):
     """
     Nash-Sutcliffe Efficiency
 
     Args:
-        modeled: Modeled values (numpy array 1D)
-        observed: Observed values (numpy array 1D)
+        modeled: Modeled values (numpy array)
+        observed: Observed values (numpy array)
+        axis: axis of time, the metric is computed for every other element (default: 0)
 
     Returns:
-        NSE value
+        NSE value, pairs with missing (nan) values are ignored
 
     """
-    obs_mod2 = np.sum(np.square(np.subtract(observed, modeled)))
-    print(obs_mod2)
-    obs_mean2 = np.sum(np.square(np.subtract(observed, np.mean(observed))))
-    print(obs_mean2)
-    nse = 1-(obs_mod2/obs_mean2)
-    return nse
+    m, o, n = _ValidPairs(modeled, observed, axis)
+    mean_o = _Divide(np.nansum(o, axis=axis), n)
+    obs_mod2 = np.nansum(np.square(np.subtract(o, m)), axis=axis)
+    obs_mean2 = np.nansum(np.square(np.subtract(o, np.expand_dims(mean_o, axis))), axis=axis)
+    return(1.0 - _Divide(obs_mod2, obs_mean2))
 
-def RMSE(modeled, observed):
+def RMSE(modeled, observed, axis=0):
     """
     Root mean square error
 
     Args:
         modeled: Modeled/predicted values (numpy array)
         observed: Observed values (numpy array)
+        axis: axis of time, the metric is computed for every other element (default: 0)
 
     Returns:
+        RMSE value, pairs with missing (nan) values are ignored
+
+    """
+    m, o, n = _ValidPairs(modeled, observed, axis)
+    return(np.sqrt(_Divide(np.nansum(np.square(np.subtract(m, o)), axis=axis), n)))
+
+
+class SkillAccumulator(object):
+    """
+    Skill metrics updated one time step at a time, so simulations can be scored as they run without storing their
+    history. Means, variances and covariance use Welford's online algorithm. Elements of each step can be cells,
+    ensemble members or both.
+
+    Args:
+        shape: shape of the values of each time step (default: (), a single series)
 
     """
-    return(np.nanmean(np.sqrt(np.square(np.subtract(modeled, observed)))))
\ No newline at end of file
+
+    def __init__(self, shape=()):
+        self.shape = tuple(shape)
+        self.n = np.zeros(self.shape)
+        self.mean_m = np.zeros(self.shape)
+        self.mean_o = np.zeros(self.shape)
+        self.m2_m = np.zeros(self.shape)
+        self.m2_o = np.zeros(self.shape)
+        self.c_mo = np.zeros(self.shape)
+        self.sum_diff = np.zeros(self.shape)
+        self.sum_diff2 = np.zeros(self.shape)
+        self._dm = np.zeros(self.shape)
+        self._do = np.zeros(self.shape)
+
+    def update(self, modeled, observed):
+        """
+        Add the values of one time step, pairs with missing (nan) values are ignored
+
+        Args:
+            modeled: modeled values, broadcastable to shape
+            observed: observed values, broadcastable to shape
+
+        """
+        valid = np.isfinite(modeled) & np.isfinite(observed)
+        m = np.where(valid, modeled, 0.0)
+        o = np.where(valid, observed, 0.0)
+        np.add(self.n, valid, out=self.n)
+        n = np.maximum(self.n, 1.0)
+        np.subtract(m, self.mean_m, out=self._dm, where=valid)
+        np.subtract(o, self.mean_o, out=self._do, where=valid)
+        np.add(self.mean_m, self._dm/n, out=self.mean_m, where=valid)
+        np.add(self.mean_o, self._do/n, out=self.mean_o, where=valid)
+        # second factors use the updated means
+        np.add(self.m2_m, self._dm*(m - self.mean_m), out=self.m2_m, where=valid)
+        np.add(self.m2_o, self._do*(o - self.mean_o), out=self.m2_o, where=valid)
+        np.add(self.c_mo, self._do*(m - self.mean_m), out=self.c_mo, where=valid)
+        np.add(self.sum_diff, m - o, out=self.sum_diff)
+        np.add(self.sum_diff2, np.square(m - o), out=self.sum_diff2)
+
+    def kge(self):
+        return _KGE(self.c_mo, self.m2_m, self.m2_o, self.mean_m, self.mean_o)
+
+    def mean_difference(self):
+        return _Divide(self.sum_diff, self.n)
+
+    def nse(self):
+        return 1.0 - _Divide(self.sum_diff2, self.m2_o)
+
+    def rmse(self):
+        return np.sqrt(_Divide(self.sum_diff2, self.n))
+
+
+def _Divide(a, b):
+    """
+    a/b, nan where b is zero
+    """
+    out = np.full(np.broadcast_shapes(np.shape(a), np.shape(b)), np.nan)
+    np.divide(a, b, out=out, where=np.not_equal(b, 0.0))
+    return out[()]
+
+def _KGE(c_mo, m2_m, m2_o, mean_m, mean_o):
+    """
+    KGE from co-moment, sums of squared deviations and means
+    """
+    r = _Divide(c_mo, np.sqrt(np.multiply(m2_m, m2_o)))
+    alpha = np.sqrt(_Divide(m2_m, m2_o))
+    beta = _Divide(mean_m, mean_o)
+    return 1.0 - np.sqrt(np.square(r - 1.0) + np.square(alpha - 1.0) + np.square(beta - 1.0))
+
+def _ValidPairs(modeled, observed, axis):
+    """
+    Modeled and observed values with nan where either is missing, and the number of valid pairs along axis
+    """
+    m, o = np.broadcast_arrays(np.asarray(modeled, dtype=float), np.asarray(observed, dtype=float))
+    valid = np.isfinite(m) & np.isfinite(o)
+    m = np.where(valid, m, np.nan)
+    o = np.where(valid, o, np.nan)
+    return m, o, np.sum(valid, axis=axis)
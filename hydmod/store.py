@@ -0,0 +1,307 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import numpy as np
+from hydmod.probes import Probe
+
+# description of a store, next to one directory of chunk files per variable
+STORE_METADATA = 'store.json'
+STORE_DATES = 'dates.npy'
+
+
+class OutputWriter(Probe):
+    """
+    Daily grids of state variables written to a chunked array store on disk while a model runs (see
+    smr.SMRModel.run), for runs whose full output does not fit in memory. Days are collected into chunks of chunkdays
+    days in memory and each chunk is split into tiles of the grid and written by a background thread, so compression
+    and disk writes overlap with the next days of the model. Two chunk buffers are used in turn, so the model waits
+    only when the disk is slower than the model. Grids are stored unpacked (nan outside the mask of a masked grid)
+    with the geotransform and dates of the run; read them with OutputStore. The store is closed at the end of the
+    forcing, or with close when a run stops earlier.
+
+    Args:
+        path: directory of the store
+        names: state variables to write (default: ('s', 'q'))
+        chunkdays: days per chunk (default: 32)
+        tile: (rows, cols) of the spatial tiles of a chunk (default: None, the full grid)
+        compress: compress chunks (zlib, .npz files), otherwise chunks are .npy files that are memory-mapped when
+            read (default: True)
+        dates: optional dates of the days of the forcing (default: None, the dates of the forcing of the model)
+        overwrite: replace an existing store at path (default: False)
+
+    """
+
+    def __init__(self, path, names=('s', 'q'), chunkdays=32, tile=None, compress=True, dates=None, overwrite=False):
+        self.path = str(path)
+        self.names = tuple(names)
+        self.chunkdays = int(chunkdays)
+        self.tile = tile
+        self.compress = compress
+        self.dates = dates
+        self.overwrite = overwrite
+        self._thread = None
+
+    def start(self, model, ndays):
+        if self._thread is not None:
+            return
+        if os.path.exists(os.path.join(self.path, STORE_METADATA)):
+            if not self.overwrite:
+                raise IOError('output store ' + self.path + ' exists')
+            shutil.rmtree(self.path)
+        shape = model.shape[:len(model.shape) - len(model.grid.state_shape)] + model.grid.shape
+        tile = model.grid.shape if self.tile is None else tuple(int(x) for x in self.tile)
+        self.metadata = {
+            'names': self.names,
+            'shape': (0,) + shape,
+            'chunks': (self.chunkdays,) + shape[:-2] + tile,
+            'dtype': np.dtype(model.dtype).str,
+            'compress': bool(self.compress),
+            'geotransform': [float(x) for x in model.grid.geot],
+        }
+        for name in self.names:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+        dates = model.forcing.dates if self.dates is None else self.dates
+        self._dates = None if dates is None else np.asarray(dates).astype('datetime64[D]').ravel()[model.day:]
+        _WriteMetadata(self.path, self.metadata)
+        self._cells = model.grid.cells
+        self._days = 0
+        self._chunk = None
+        self._error = None
+        self._free = queue.Queue()
+        for k in range(2):
+            self._free.put({name: np.full((self.chunkdays,) + shape, np.nan, dtype=model.dtype)
+                            for name in self.names})
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._Write, name='OutputWriter', daemon=True)
+        self._thread.start()
+
+    def record(self, model, i):
+        if self._error is not None:
+            self._Raise()
+        if self._chunk is None:
+            self._chunk = self._free.get()
+        k = self._days % self.chunkdays
+        for name in self.names:
+            if self._cells is None:
+                np.copyto(self._chunk[name][k], model.state[name])
+            else:
+                self._cells.unpack(model.state[name], out=self._chunk[name][k])
+        self._days += 1
+        if k + 1 == self.chunkdays:
+            self._Flush()
+        if model.day >= model.ndays:
+            self.close()
+
+    def close(self):
+        """
+        Write the last (partial) chunk, wait for the background thread and write the dates of the stored days
+        """
+        if self._thread is None:
+            return
+        if self._chunk is not None:
+            self._Flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._dates is not None:
+            np.save(os.path.join(self.path, STORE_DATES), self._dates[:self._days], allow_pickle=False)
+        self._Raise()
+
+    def _Flush(self):
+        """
+        Hand the current chunk to the background thread
+        """
+        days = (self._days - 1) % self.chunkdays + 1
+        self._queue.put(((self._days - 1)//self.chunkdays, days, self._chunk))
+        self._chunk = None
+
+    def _Raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise IOError('writing output store ' + self.path + ' failed: ' + str(error))
+
+    def _Write(self):
+        """
+        Background thread: write chunks in order as tiles and update the number of stored days
+        """
+        chunks = self.metadata['chunks']
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            t, days, chunk = item
+            try:
+                if self._error is None:
+                    for name in self.names:
+                        _WriteChunk(self.path, name, t, chunk[name][:days], chunks, self.compress)
+                    self.metadata['shape'] = (t*self.chunkdays + days,) + self.metadata['shape'][1:]
+                    _WriteMetadata(self.path, self.metadata)
+            except Exception as error:
+                self._error = error
+            self._free.put(chunk)
+
+
+class OutputStore(object):
+    """
+    Reader of a store written by OutputWriter. Variables are read lazily: indexing store[name] (e.g.
+    store['q'][100:200, 10, 5] or store['s'][-1]) loads only the chunks that overlap the selection.
+
+    Args:
+        path: directory of the store
+
+    Attributes:
+        names: stored variables
+        shape: (days, rows, cols) (or (days, members, rows, cols)) of each variable
+        chunks: shape of a chunk
+        geot: GDAL geotransform of the grid
+        dates: dates of the stored days (datetime64[D]), or None
+
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(os.path.join(self.path, STORE_METADATA)) as f:
+            metadata = json.load(f)
+        self.names = tuple(metadata['names'])
+        self.shape = tuple(metadata['shape'])
+        self.chunks = tuple(metadata['chunks'])
+        self.dtype = np.dtype(metadata['dtype'])
+        self.compress = metadata['compress']
+        self.geot = tuple(metadata['geotransform'])
+        datespath = os.path.join(self.path, STORE_DATES)
+        self.dates = np.load(datespath)[:self.shape[0]] if os.path.exists(datespath) else None
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        return StoredArray(self, name)
+
+    def keys(self):
+        return self.names
+
+    def read(self, name, days=None, rows=None, cols=None):
+        """
+        Values of a variable in a range of days and a window of the grid
+
+        Args:
+            name: stored variable
+            days: slice of days (default: None, all days)
+            rows, cols: slices of rows and columns (default: None, the full grid)
+
+        Returns:
+            numpy array (days, rows, cols) (or (days, members, rows, cols))
+
+        """
+        full = slice(None)
+        lead = (full,)*(len(self.shape) - 3)
+        return StoredArray(self, name)[(days or full,) + lead + (rows or full, cols or full)]
+
+
+class StoredArray(object):
+    """
+    Lazy view of a stored variable, indexed with integers and slices along each axis like a numpy array
+
+    Args:
+        store: OutputStore
+        name: stored variable
+
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.shape = store.shape
+        self.dtype = store.dtype
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            k = key.index(Ellipsis)
+            key = key[:k] + (slice(None),)*(self.ndim - len(key) + 1) + key[k + 1:]
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for stored array of shape ' + str(self.shape))
+        key = key + (slice(None),)*(self.ndim - len(key))
+        # bounding range of each axis, then steps and integer indices are applied to the loaded block
+        ranges = []
+        select = []
+        for index, size in zip(key, self.shape):
+            if isinstance(index, slice):
+                indices = range(*index.indices(size))
+                if len(indices) == 0:
+                    ranges.append((0, 0))
+                    select.append(slice(None))
+                    continue
+                first, last, step = indices[0], indices[-1], indices.step
+                lo = min(first, last)
+                ranges.append((lo, max(first, last) + 1))
+                stop = last - lo + (1 if step > 0 else -1)
+                select.append(slice(first - lo, None if stop < 0 else stop, step))
+            else:
+                index = int(index)
+                if index < -size or index >= size:
+                    raise IndexError('index ' + str(index) + ' is out of bounds for size ' + str(size))
+                index %= size
+                ranges.append((index, index + 1))
+                select.append(0)
+        return self._Block(ranges)[tuple(select)]
+
+    def _Block(self, ranges):
+        """
+        Values of the box of [start, stop) ranges on each axis, loaded from the chunks that overlap it
+        """
+        store = self.store
+        out = np.full([hi - lo for lo, hi in ranges], np.nan, dtype=self.dtype)
+        if out.size == 0:
+            return out
+        (t0, t1), (r0, r1), (c0, c1) = ranges[0], ranges[-2], ranges[-1]
+        lead = tuple(slice(lo, hi) for lo, hi in ranges[1:-2])
+        ct, cr, cc = store.chunks[0], store.chunks[-2], store.chunks[-1]
+        for t in range(t0//ct, (t1 - 1)//ct + 1):
+            for r in range(r0//cr, (r1 - 1)//cr + 1):
+                for c in range(c0//cc, (c1 - 1)//cc + 1):
+                    chunk = _ReadChunk(store.path, self.name, (t, r, c), store.compress)
+                    ts = slice(max(t0, t*ct), min(t1, t*ct + chunk.shape[0]))
+                    rs = slice(max(r0, r*cr), min(r1, r*cr + chunk.shape[-2]))
+                    cs = slice(max(c0, c*cc), min(c1, c*cc + chunk.shape[-1]))
+                    out[(slice(ts.start - t0, ts.stop - t0),) + (slice(None),)*len(lead) +
+                        (slice(rs.start - r0, rs.stop - r0), slice(cs.start - c0, cs.stop - c0))] = \
+                        chunk[(slice(ts.start - t*ct, ts.stop - t*ct),) + lead +
+                              (slice(rs.start - r*cr, rs.stop - r*cr), slice(cs.start - c*cc, cs.stop - c*cc))]
+        return out
+
+
+def _ChunkPath(path, name, index, compress):
+    return os.path.join(path, name, '.'.join(str(i) for i in index) + ('.npz' if compress else '.npy'))
+
+def _ReadChunk(path, name, index, compress):
+    if compress:
+        with np.load(_ChunkPath(path, name, index, compress)) as f:
+            return f['values']
+    return np.load(_ChunkPath(path, name, index, compress), mmap_mode='r')
+
+def _WriteChunk(path, name, t, values, chunks, compress):
+    """
+    Write the tiles of a chunk of days, each to a temporary file first so readers never see a partial tile
+    """
+    nrow, ncol = values.shape[-2:]
+    for r in range(-(-nrow//chunks[-2])):
+        for c in range(-(-ncol//chunks[-1])):
+            tile = np.ascontiguousarray(values[..., r*chunks[-2]:(r + 1)*chunks[-2], c*chunks[-1]:(c + 1)*chunks[-1]])
+            target = _ChunkPath(path, name, (t, r, c), compress)
+            tmp = target + '.tmp'
+            with open(tmp, 'wb') as f:
+                if compress:
+                    np.savez_compressed(f, values=tile)
+                else:
+                    np.save(f, tile, allow_pickle=False)
+            os.replace(tmp, target)
+
+def _WriteMetadata(path, metadata):
+    tmp = os.path.join(path, STORE_METADATA + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(tmp, os.path.join(path, STORE_METADATA))
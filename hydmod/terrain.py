@@ -0,0 +1,195 @@
+import numpy as np
+from hydmod.flow_routing import FLOW_DIRECTIONS, _NeighbourSlices
+
+# row offset, column offset and the weights of the east and north differences of the 3x3 window of Horn's method
+#   a b c
+#   d e f   dz/dx = ((c + 2f + i) - (a + 2d + g))/8dx, dz/dy = ((a + 2b + c) - (g + 2h + i))/8dy
+#   g h i
+HORN_WINDOW = ((-1, -1, -1.0, 1.0), (-1, 0, 0.0, 2.0), (-1, 1, 1.0, 1.0), (0, -1, -2.0, 0.0), (0, 1, 2.0, 0.0),
+               (1, -1, -1.0, -1.0), (1, 0, 0.0, -2.0), (1, 1, 1.0, -1.0))
+
+
+def Aspect(dem, cellsize, units='degrees', nodata=None, edges=True, flat=0.0):
+    """
+    Aspect of the land surface with Horn's method, as gdaldem aspect (azimuth, edges computed): the direction the
+    surface faces, clockwise from north
+
+    Args:
+        dem: digital elevation model (2d numpy array)
+        cellsize: size of cells (m), scalar or (x, y) sizes (see CellSize)
+        units: units for aspect; one of 'degrees' (default) or 'radians'
+        nodata: no data value for dem (default: None, only nan)
+        edges: compute cells at the edges of the dem and next to no data, with neighbours outside the dem
+            extrapolated and no data neighbours set to the value of the cell (default: True, otherwise they are nan)
+        flat: value for flat cells (default: 0.0)
+
+    Returns:
+        aspect (float32), nan for no data cells
+
+    """
+    dzdx, dzdy = _Horn(dem, cellsize, nodata, edges)
+    return _Aspect(dzdx, dzdy, units, flat)
+
+def CellSize(geot):
+    """
+    Cell sizes from a GDAL geotransform
+
+    Args:
+        geot: GDAL geotransform
+
+    Returns:
+        (x, y) cell sizes, positive
+
+    """
+    return abs(geot[1]), abs(geot[5])
+
+def Gradients(dem, cellsize, nodata=None):
+    """
+    Elevation drop per distance from each cell to its eight neighbours, with distances from the real (x, y) cell
+    sizes
+
+    Args:
+        dem: digital elevation model (2d numpy array)
+        cellsize: size of cells (m), scalar or (x, y) sizes (see CellSize)
+        nodata: no data value for dem (default: None, only nan)
+
+    Returns:
+        gradients (float32, (8, rows, cols)) in the order of flow_routing.FLOW_DIRECTIONS (east, then clockwise),
+        positive downhill and nan where the neighbour is outside the dem or no data
+
+    """
+    z = _Elevation(dem, nodata)
+    csx, csy = _CellSize(cellsize)
+    out = np.full((len(FLOW_DIRECTIONS),) + z.shape, np.nan, dtype=np.float32)
+    for k, (drow, dcol, _) in enumerate(FLOW_DIRECTIONS):
+        src, dst = _NeighbourSlices(drow, dcol)
+        out[k][src] = (z[src] - z[dst]) / np.hypot(drow*csy, dcol*csx)
+    return out
+
+def Slope(dem, cellsize, units='percent', nodata=None, edges=True):
+    """
+    Slope of the land surface with Horn's method, as gdaldem slope (edges computed)
+
+    Args:
+        dem: digital elevation model (2d numpy array)
+        cellsize: size of cells (m), scalar or (x, y) sizes (see CellSize)
+        units: units for slope; one of 'percent' (default), 'degrees' or 'radians'
+        nodata: no data value for dem (default: None, only nan)
+        edges: compute cells at the edges of the dem and next to no data, with neighbours outside the dem
+            extrapolated and no data neighbours set to the value of the cell (default: True, otherwise they are nan)
+
+    Returns:
+        slope (float32), nan for no data cells
+
+    """
+    dzdx, dzdy = _Horn(dem, cellsize, nodata, edges)
+    return _Slope(dzdx, dzdy, units)
+
+def SlopeAspect(dem, cellsize, units='degrees', nodata=None, edges=True, flat=0.0):
+    """
+    Slope (percent) and aspect from one pass of Horn's method, see Slope and Aspect
+
+    Args:
+        dem: digital elevation model (2d numpy array)
+        cellsize: size of cells (m), scalar or (x, y) sizes (see CellSize)
+        units: units for aspect; one of 'degrees' (default) or 'radians'
+        nodata: no data value for dem (default: None, only nan)
+        edges: compute cells at the edges of the dem and next to no data (default: True)
+        flat: aspect of flat cells (default: 0.0)
+
+    Returns:
+        slope (percent) and aspect (float32)
+
+    """
+    dzdx, dzdy = _Horn(dem, cellsize, nodata, edges)
+    return _Slope(dzdx, dzdy, 'percent'), _Aspect(dzdx, dzdy, units, flat)
+
+
+def _Aspect(dzdx, dzdy, units, flat):
+    """
+    Azimuth of the downslope direction (-dz/dx east, -dz/dy north) as float32
+    """
+    aspect = np.mod(np.arctan2(-dzdx, -dzdy), 2*np.pi)
+    if units == 'degrees':
+        aspect = np.degrees(aspect)
+        aspect[aspect >= 360.0] = 0.0
+    aspect[(dzdx == 0.0) & (dzdy == 0.0)] = flat
+    return aspect.astype(np.float32)
+
+def _CellSize(cellsize):
+    csx, csy = np.broadcast_to(np.abs(np.asarray(cellsize, dtype=float)), (2,))
+    return float(csx), float(csy)
+
+def _Elevation(dem, nodata):
+    """
+    Elevations as float64 with no data cells set to nan
+    """
+    z = np.array(dem, dtype=np.float64)
+    if nodata is not None:
+        z[z == nodata] = np.nan
+    return z
+
+def _Horn(dem, cellsize, nodata, edges):
+    """
+    Elevation gradients to the east and to the north with Horn's 3x3 method
+    """
+    z = _Elevation(dem, nodata)
+    csx, csy = _CellSize(cellsize)
+    nrow, ncol = z.shape
+    pad = np.full((nrow + 2, ncol + 2), np.nan)
+    pad[1:-1, 1:-1] = z
+    extrapolate = edges and nrow >= 2 and ncol >= 2
+    if extrapolate:
+        # neighbours outside the dem are extrapolated from the two cells next to the edge (2a - b), as gdaldem
+        pad[0, 1:-1] = 2.0*z[0] - z[1]
+        pad[-1, 1:-1] = 2.0*z[-1] - z[-2]
+        pad[1:-1, 0] = 2.0*z[:, 0] - z[:, 1]
+        pad[1:-1, -1] = 2.0*z[:, -1] - z[:, -2]
+    dzdx, dzdy, incomplete = _HornSums(pad, z)
+    if extrapolate:
+        # gdaldem does not extrapolate across a corner, the column beyond a corner cell repeats the column of the cell
+        for row in (0, nrow - 1):
+            for col, outside, inside in ((0, 0, 1), (ncol - 1, 2, 1)):
+                window = pad[row:row + 3, col:col + 3].copy()
+                window[:, outside] = window[:, inside]
+                dzdx[row, col], dzdy[row, col] = (d[0, 0] for d in _HornSums(window, z[row:row + 1, col:col + 1])[:2])
+    dzdx /= 8.0*csx
+    dzdy /= 8.0*csy
+    # the cell itself has no weight in the window, so no data cells are set explicitly
+    invalid = np.isnan(z) | incomplete if not edges else np.isnan(z)
+    dzdx[invalid] = np.nan
+    dzdy[invalid] = np.nan
+    return dzdx, dzdy
+
+def _HornSums(pad, z):
+    """
+    Weighted sums of the east and north differences of Horn's window over a dem padded by one cell, and the cells
+    with a missing (nan) neighbour
+    """
+    nrow, ncol = z.shape
+    dzdx = np.zeros(z.shape)
+    dzdy = np.zeros(z.shape)
+    incomplete = np.zeros(z.shape, dtype=bool)
+    for drow, dcol, wx, wy in HORN_WINDOW:
+        values = pad[1 + drow:1 + drow + nrow, 1 + dcol:1 + dcol + ncol]
+        missing = np.isnan(values)
+        incomplete |= missing
+        # missing neighbours take the value of the cell, as gdaldem with computeEdges
+        values = np.where(missing, z, values)
+        if wx != 0.0:
+            dzdx += wx*values
+        if wy != 0.0:
+            dzdy += wy*values
+    return dzdx, dzdy, incomplete
+
+def _Slope(dzdx, dzdy, units):
+    """
+    Slope from the gradients as float32
+    """
+    gradient = np.hypot(dzdx, dzdy)
+    if units == 'percent':
+        return (gradient*100.0).astype(np.float32)
+    slope = np.arctan(gradient)
+    if units == 'degrees':
+        slope = np.degrees(slope)
+    return slope.astype(np.float32)
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from hydmod.aggregate import Aggregator, PeriodKeys
+from hydmod.domain import ActiveCells
+
+
+class _Grid(object):
+    def __init__(self, mask=None):
+        self.cells = None if mask is None else ActiveCells(mask)
+
+
+class _Forcing(object):
+    def __init__(self, dates):
+        self.dates = dates
+
+
+class _Model(object):
+    """
+    Stand-in for smr.SMRModel that steps through given daily grids of state variables
+    """
+
+    def __init__(self, grids, dates, mask=None, start=0):
+        self.grids = grids
+        self.grid = _Grid(mask)
+        self.forcing = _Forcing(dates)
+        self.ndays = dates.size
+        self.start = start
+        self.day = start
+        self.state = {}
+
+    def reset(self):
+        self.day = self.start
+
+    def run(self, probe, ndays=None):
+        ndays = self.ndays - self.day if ndays is None else ndays
+        probe.start(self, ndays)
+        cells = self.grid.cells
+        for i in range(ndays):
+            for name, grids in self.grids.items():
+                self.state[name] = grids[self.day] if cells is None else cells.pack(grids[self.day])
+            self.day += 1
+            probe.record(self, i)
+
+
+def _Run(ndays=75, shape=(3, 4), seed=0):
+    """
+    Daily grids from 2001-01-20, across the ends of January, February and March
+    """
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64('2001-01-20') + np.arange(ndays)
+    return dates, {'aet': rng.random((ndays,) + shape), 'swe': rng.random((ndays,) + shape)}
+
+def _Periods(dates, period):
+    keys = PeriodKeys(dates, period)
+    return [np.flatnonzero(keys == key) for key in np.unique(keys)]
+
+
+def test_monthly_statistics():
+    dates, grids = _Run()
+    emitted = []
+    aggregator = Aggregator(('aet', 'swe'), ('sum', 'mean', 'max', 'maxdate'), emit=lambda *p: emitted.append(p))
+    _Model(grids, dates).run(aggregator)
+    periods = _Periods(dates, 'month')
+    assert len(aggregator.results) == len(emitted) == len(periods) == 4
+    for (start, end, values), days in zip(aggregator.results, periods):
+        assert start == dates[days[0]] and end == dates[days[-1]]
+        assert values['days'] == days.size
+        for name in ('aet', 'swe'):
+            np.testing.assert_allclose(values[name + '_sum'], grids[name][days].sum(axis=0), rtol=1e-12)
+            np.testing.assert_allclose(values[name + '_mean'], grids[name][days].mean(axis=0), rtol=1e-12)
+            np.testing.assert_array_equal(values[name + '_max'], grids[name][days].max(axis=0))
+            np.testing.assert_array_equal(values[name + '_maxdate'], dates[days][grids[name][days].argmax(axis=0)])
+    # the first period starts with the run, the last one ends with the forcing
+    assert aggregator.results[0][2]['days'] == 12
+    assert aggregator.results[-1][1] == dates[-1]
+
+def test_run_stops_within_period():
+    dates, grids = _Run()
+    model = _Model(grids, dates)
+    aggregator = Aggregator(('aet',), period='month')
+    # 20 January to 14 February, then the rest of the forcing
+    model.run(aggregator, ndays=26)
+    assert len(aggregator.results) == 2
+    start, end, values = aggregator.results[-1]
+    assert (start, end, values['days']) == (np.datetime64('2001-02-01'), np.datetime64('2001-02-14'), 14)
+    np.testing.assert_allclose(values['aet_sum'], grids['aet'][12:26].sum(axis=0), rtol=1e-12)
+    model.run(aggregator)
+    start, end, values = aggregator.results[2]
+    assert (start, end, values['days']) == (np.datetime64('2001-02-15'), np.datetime64('2001-02-28'), 14)
+    np.testing.assert_allclose(values['aet_sum'], grids['aet'][26:40].sum(axis=0), rtol=1e-12)
+
+def test_reset_between_runs():
+    dates, grids = _Run()
+    model = _Model(grids, dates)
+    aggregator = Aggregator(('aet',), period='run')
+    model.run(aggregator, ndays=10)
+    model.reset()
+    model.run(aggregator)
+    assert [values['days'] for start, end, values in aggregator.results] == [10, 75]
+    np.testing.assert_allclose(aggregator.results[1][2]['aet_sum'], grids['aet'].sum(axis=0), rtol=1e-12)
+    # a period left open by update does not carry into a run
+    aggregator = Aggregator(('aet',), period='run')
+    aggregator.update(dates[0], {'aet': np.full((3, 4), 100.0)})
+    model.reset()
+    model.run(aggregator)
+    np.testing.assert_allclose(aggregator.results[0][2]['aet_sum'], grids['aet'].sum(axis=0), rtol=1e-12)
+
+def test_masked_water_year():
+    dates = np.datetime64('2001-09-25') + np.arange(12)
+    rng = np.random.default_rng(1)
+    grids = {'swe': rng.random((12, 3, 4))}
+    mask = np.ones((3, 4), dtype=bool)
+    mask[0, :2] = False
+    aggregator = Aggregator(('swe',), ('max', 'maxdate'), period='water_year')
+    _Model(grids, dates, mask=mask, start=2).run(aggregator)
+    assert [values['days'] for start, end, values in aggregator.results] == [4, 6]
+    values = aggregator.results[1][2]
+    np.testing.assert_array_equal(values['swe_max'][mask], grids['swe'][6:].max(axis=0)[mask])
+    assert np.isnan(values['swe_max'][~mask]).all()
+    assert np.isnat(values['swe_maxdate'][~mask]).all()
+
+def test_update_and_close():
+    dates, grids = _Run(40)
+    aggregator = Aggregator(('aet',), ('sum',), period='month')
+    for i in range(dates.size):
+        aggregator.update(dates[i], {'aet': grids['aet'][i]})
+    assert len(aggregator.results) == 1
+    start, end, values = aggregator.close()
+    assert (start, end, values['days']) == (np.datetime64('2001-02-01'), dates[-1], 28)
+    assert aggregator.close() is None
+
+def test_period_keys():
+    dates = np.array(['2000-09-30', '2000-10-01', '2001-09-30', '2001-10-01'], dtype='datetime64[D]')
+    keys = PeriodKeys(dates, 'water_year')
+    assert keys[0] != keys[1] and keys[1] == keys[2] and keys[2] != keys[3]
+    assert np.unique(PeriodKeys(dates, 'year')).size == 2
+    np.testing.assert_array_equal(PeriodKeys(dates, 'run'), 0)
+    with pytest.raises(ValueError):
+        Aggregator(('aet',), period='week')
+    with pytest.raises(ValueError):
+        Aggregator(('aet',), ('median',))
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from hydmod import backend
+from hydmod.point import SMRPoint
+from hydmod.precip import ModelSWE, SnowAge
+
+
+@pytest.fixture
+def restore():
+    """
+    Restore the backend after a test that changes it
+    """
+    previous = backend.backend
+    yield
+    backend.backend = previous
+
+
+def _Both(function, *args, **kwargs):
+    """
+    Results of a function with the NumPy implementations and with the compiled kernels
+    """
+    pytest.importorskip('numba')
+    results = []
+    for name in ('numpy', 'numba'):
+        backend.SetBackend(name)
+        results.append(function(*args, **kwargs))
+    return results
+
+def _Snow(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    ppt_snow = np.where(rng.random(shape) < 0.4, rng.random(shape)*20.0, 0.0)
+    swe_melt = rng.random(shape)*8.0
+    return ppt_snow, swe_melt
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_modelswe_backends_agree(restore, dtype):
+    ppt_snow, swe_melt = (x.astype(dtype) for x in _Snow((90, 7, 6)))
+    (swe, melt), (cswe, cmelt) = _Both(ModelSWE, ppt_snow, swe_melt)
+    assert swe.dtype == cswe.dtype == dtype
+    np.testing.assert_array_equal(cswe, swe)
+    np.testing.assert_array_equal(cmelt, melt)
+    # time on another axis, a view that the compiled scan cannot flatten without a copy
+    (swe, melt), (cswe, cmelt) = _Both(ModelSWE, np.moveaxis(ppt_snow, 0, 1), np.moveaxis(swe_melt, 0, 1), axis=1)
+    np.testing.assert_array_equal(cswe, swe)
+    np.testing.assert_array_equal(cmelt, melt)
+
+def test_snowage_backends_agree(restore):
+    ppt_snow, swe_melt = _Snow((120, 5, 4), seed=1)
+    swe = ModelSWE(ppt_snow, swe_melt)[0]
+    numpy, compiled = _Both(SnowAge, ppt_snow, swe)
+    np.testing.assert_array_equal(compiled, numpy)
+    assert (numpy > 0).any() and (numpy == 0).any()
+    numpy, compiled = _Both(SnowAge, ppt_snow)
+    np.testing.assert_array_equal(compiled, numpy)
+
+def test_point_backends_agree(restore):
+    rng = np.random.default_rng(2)
+    ppt_in = np.where(rng.random(365) < 0.3, rng.random(365)*0.05, 0.0)
+    pet = rng.random(365)*0.005
+    numpy, compiled = _Both(SMRPoint, ppt_in, pet, 1.0, 0.45, 0.3, 0.1, 5.0, 0.1, 0.001, storage=0.3,
+                            aquifer=0.05)
+    assert numpy['r'].max() > 0.0
+    for name in numpy:
+        np.testing.assert_array_equal(compiled[name], numpy[name], err_msg=name)
+
+def test_set_backend(restore, monkeypatch):
+    backend.SetBackend('NumPy')
+    assert backend.backend == 'numpy' and not backend.UseCompiled()
+    assert backend.Compiled(backend.ModelSWE_Kernel) is None
+    with pytest.raises(ValueError):
+        backend.SetBackend('cuda')
+    monkeypatch.setattr(backend, 'numba', None)
+    with pytest.raises(ImportError):
+        backend.SetBackend('numba')
+    # auto falls back to the NumPy implementations without numba
+    backend.SetBackend('auto')
+    assert not backend.UseCompiled()
+
+def test_compiled_once(restore):
+    pytest.importorskip('numba')
+    backend.SetBackend('numba')
+    kernel = backend.Compiled(backend.DaysSinceEvent_Kernel)
+    assert kernel is not None and backend.Compiled(backend.DaysSinceEvent_Kernel) is kernel
+
+def test_environment_variable():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = 'from hydmod import backend; print(backend.backend, backend.UseCompiled())'
+    env = dict(os.environ, HYDMOD_BACKEND='NUMPY', PYTHONPATH=root)
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ['numpy', 'False']
+    env['HYDMOD_BACKEND'] = 'fortran'
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+    assert result.returncode != 0 and 'HYDMOD_BACKEND' in result.stderr
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from hydmod.calibration import Calibration, SimulateSWE
+
+TRUE = {'k': 4.0, 'tbase': -1.0, 'train': 3.0, 'tsnow': 0.0}
+BOUNDS = {'k': (1.0, 8.0), 'tbase': (-3.0, 1.0), 'train': (1.5, 5.0), 'tsnow': (-2.0, 1.0)}
+
+
+def _Load(ndays=240, seed=0):
+    """
+    Winter to summer at a snow station, loaded in every worker process
+    """
+    rng = np.random.default_rng(seed)
+    day = np.arange(ndays)
+    tavg = -8.0 + 20.0*day/ndays + rng.normal(0.0, 3.0, ndays)
+    ppt = np.where(rng.random(ndays) < 0.4, rng.random(ndays)*20.0, 0.0)
+    return {'ppt': ppt, 'tavg': tavg}
+
+def _Calibration(**kwargs):
+    observed = SimulateSWE(_Load(), **TRUE)
+    return Calibration(SimulateSWE, observed, BOUNDS, load=_Load, **kwargs)
+
+
+def test_converges_to_known_parameters():
+    calibration = _Calibration(workers=1, seed=0)
+    best, loss = calibration.run(generations=150, tol=1e-6)
+    assert loss < 1e-3
+    for name in ('k', 'tbase'):
+        assert best[name] == pytest.approx(TRUE[name], abs=0.1)
+    # the best loss never increases from one generation to the next
+    assert np.all(np.diff(calibration.history) <= 0.0)
+
+def test_workers_reproducible():
+    serial = _Calibration(workers=1, seed=3)
+    pooled = _Calibration(workers=2, seed=3)
+    assert serial.run(generations=5, popsize=5, tol=0.0) == pooled.run(generations=5, popsize=5, tol=0.0)
+    np.testing.assert_array_equal(serial.population, pooled.population)
+    np.testing.assert_array_equal(serial.loss, pooled.loss)
+
+def test_resume_from_checkpoint(tmp_path):
+    checkpoint = tmp_path / 'calibration.pkl'
+    uninterrupted = _Calibration(workers=1, seed=5)
+    expected = uninterrupted.run(generations=8, popsize=5, tol=0.0)
+    # interrupted after three generations, then resumed by a new calibration
+    _Calibration(workers=1, seed=5, checkpoint=checkpoint).run(generations=3, popsize=5, tol=0.0)
+    assert checkpoint.exists() and not (tmp_path / 'calibration.pkl.tmp').exists()
+    resumed = _Calibration(workers=1, seed=5, checkpoint=checkpoint)
+    assert resumed.run(generations=8, popsize=5, tol=0.0) == expected
+    assert resumed.generation == uninterrupted.generation == 8
+    assert resumed.history == uninterrupted.history
+    np.testing.assert_array_equal(resumed.population, uninterrupted.population)
+
+def test_checkpoint_of_other_parameters(tmp_path):
+    checkpoint = tmp_path / 'calibration.pkl'
+    _Calibration(workers=1, seed=0, checkpoint=checkpoint).run(generations=1, popsize=2)
+    # k is fixed, so the saved population does not match the parameters
+    bounds = {name: BOUNDS[name] for name in ('tbase', 'train', 'tsnow')}
+    other = Calibration(SimulateSWE, SimulateSWE(_Load(), **TRUE), bounds, load=_Load, workers=1, checkpoint=checkpoint)
+    with pytest.raises(ValueError, match='checkpoint'):
+        other.run(generations=1)
@@ -0,0 +1,124 @@
+import glob
+import numpy as np
+import pytest
+from hydmod.climate import CLI_BLOCK_BYTES, CLI_COLUMNS, CLI_HEADER_LINES, ReadCLI, ReadSNOTEL
+
+# daily records of a CLIGEN file: day, month, year, ppt (in), duration, tp, ip, tmax, tmin, radobs (langley), wind,
+# wind direction, dewpoint
+CLI_RECORDS = [
+    (30, 12, 1, 0.00, 0.00, 0.00, 0.00, 2.5, -6.1, 151, 3.2, 270, -8.0),
+    (31, 12, 1, 0.35, 2.10, 0.30, 1.85, 1.0, -3.4, 98, 4.8, 225, -4.9),
+    (1, 1, 2, 1.27, 1.35, 0.04, 0.07, 19.4, -0.9, 425, 5.8, 196, 1.4),
+    (29, 2, 4, 0.06, 0.62, 0.67, 2.59, 13.5, -6.2, 698, 7.8, 247, -1.5),
+]
+SNOTEL_TEXT = """#Klondike station, daily
+#swe (in), precipitation accumulation (in), temperatures (F), precipitation increment (in)
+Date,Snow Water Equivalent,Precipitation Accumulation,Air Temperature Maximum,Air Temperature Minimum,Air Temperature Average,Precipitation Increment
+10/1/1980,0.0,0.0,50,32,41.0,0.0
+10/2/1980,0.4,0.5,,28,30.2,0.5
+#station moved
+10/3/1980,0.6,0.7,35,21,27.5,
+"""
+
+
+def _WriteCLI(path, records):
+    lines = ['header line ' + str(i) for i in range(CLI_HEADER_LINES)]
+    lines += [' '.join(str(value) for value in record) for record in records]
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+def _Caches(path):
+    return glob.glob(str(path) + '.*.npycache')
+
+
+def test_readcli_values(tmp_path):
+    path = _WriteCLI(tmp_path / 'station.cli', CLI_RECORDS)
+    cli = ReadCLI(path, cache=False)
+    records = np.array(CLI_RECORDS, dtype=float)
+    np.testing.assert_array_equal(cli['date'], np.array(['0001-12-30', '0001-12-31', '0002-01-01', '0004-02-29'],
+                                                        dtype='datetime64[D]'))
+    np.testing.assert_array_equal(cli['doy'], [364, 365, 1, 60])
+    np.testing.assert_allclose(cli['ppt'], records[:, 3]*0.0254, rtol=1e-12)
+    np.testing.assert_allclose(cli['radobs'], records[:, 9]*41.84, rtol=1e-12)
+    for k, name in enumerate(CLI_COLUMNS[4:], 4):
+        if name not in ('ppt', 'radobs'):
+            np.testing.assert_array_equal(cli[name], records[:, k])
+
+def test_readcli_yearoffset(tmp_path):
+    path = _WriteCLI(tmp_path / 'station.cli', CLI_RECORDS)
+    cli = ReadCLI(path, yearoffset=2000)
+    np.testing.assert_array_equal(cli['year'], [2001, 2001, 2002, 2004])
+    assert cli['date'][-1] == np.datetime64('2004-02-29')
+
+def test_readcli_cache(tmp_path):
+    path = _WriteCLI(tmp_path / 'station.cli', CLI_RECORDS)
+    parsed = ReadCLI(path, cache=False)
+    first = ReadCLI(path)
+    assert len(_Caches(path)) == 1
+    second = ReadCLI(path)
+    assert isinstance(second['ppt'], np.memmap)
+    for name in parsed:
+        np.testing.assert_array_equal(first[name], parsed[name])
+        np.testing.assert_array_equal(second[name], parsed[name])
+        assert second[name].dtype == parsed[name].dtype
+    # an edited file is parsed again and the cache of the old contents is removed
+    _WriteCLI(path, CLI_RECORDS[:2])
+    assert ReadCLI(path)['ppt'].size == 2
+    assert len(_Caches(path)) == 1
+
+def test_readcli_malformed(tmp_path):
+    records = [' '.join(str(value) for value in record) for record in CLI_RECORDS]
+    path = tmp_path / 'short.cli'
+    path.write_text('\n'.join(['header'] * CLI_HEADER_LINES + records[:2] + ['1 1 2 0.1'] + records[2:]) + '\n')
+    with pytest.raises(ValueError, match='line ' + str(CLI_HEADER_LINES + 3) + ' has 4 values'):
+        ReadCLI(path, cache=False)
+    path = tmp_path / 'text.cli'
+    path.write_text('\n'.join(['header'] * CLI_HEADER_LINES + records[:1] + [records[1].replace('0.35', '0.3S')]))
+    with pytest.raises(ValueError, match=r'line ' + str(CLI_HEADER_LINES + 2) + r' .*\(0\.3S\)'):
+        ReadCLI(path)
+    # a file that does not parse leaves no cache
+    assert not _Caches(path)
+def test_readcli_blank_blocks(tmp_path):
+    records = [' '.join(str(value) for value in record) for record in CLI_RECORDS]
+    # more than a block of blank and whitespace lines between records, and at the end of the file
+    blank = ['', '    ', '\t'] * (CLI_BLOCK_BYTES//3)
+    path = tmp_path / 'blank.cli'
+    path.write_text('\n'.join(['header'] * CLI_HEADER_LINES + records[:2] + blank + records[2:] + blank) + '\n')
+    cli = ReadCLI(path, cache=False)
+    np.testing.assert_array_equal(cli['day'], [30, 31, 1, 29])
+    np.testing.assert_allclose(cli['ppt'], np.array(CLI_RECORDS)[:, 3]*0.0254, rtol=1e-12)
+    # lines are still counted across blank blocks
+    path.write_text('\n'.join(['header'] * CLI_HEADER_LINES + records[:2] + blank + ['1 1 2 0.1']) + '\n')
+    with pytest.raises(ValueError, match='line ' + str(CLI_HEADER_LINES + 3 + len(blank)) + ' has 4 values'):
+        ReadCLI(path, cache=False)
+
+def test_readsnotel_values(tmp_path):
+    path = tmp_path / 'snotel.csv'
+    path.write_text(SNOTEL_TEXT)
+    snotel = ReadSNOTEL(path, cache=False)
+    np.testing.assert_array_equal(snotel['date'], np.arange('1980-10-01', '1980-10-04', dtype='datetime64[D]'))
+    np.testing.assert_array_equal(snotel['doy'], [275, 276, 277])
+    np.testing.assert_allclose(snotel['swe'], np.array([0.0, 0.4, 0.6])*0.0254, rtol=1e-12)
+    np.testing.assert_allclose(snotel['tmin'], (np.array([32.0, 28.0, 21.0]) - 32.0)*5.0/9.0, rtol=1e-12, atol=1e-12)
+    assert np.isnan(snotel['tmax'][1])
+    assert np.isnan(snotel['ppt'][2])
+
+def test_readsnotel_cache(tmp_path):
+    path = tmp_path / 'snotel.csv'
+    path.write_text(SNOTEL_TEXT.replace('\n', '\r\n'))
+    parsed = ReadSNOTEL(path, cache=False)
+    ReadSNOTEL(path)
+    cached = ReadSNOTEL(path)
+    assert len(_Caches(path)) == 1
+    assert isinstance(cached['swe'], np.memmap)
+    for name in parsed:
+        np.testing.assert_array_equal(cached[name], parsed[name])
+
+def test_readsnotel_malformed(tmp_path):
+    path = tmp_path / 'snotel.csv'
+    path.write_text(SNOTEL_TEXT + '10/4/1980,0.6,0.7,35\n')
+    with pytest.raises(ValueError, match='line 8 has 6 values'):
+        ReadSNOTEL(path, cache=False)
+    path.write_text(SNOTEL_TEXT + '10/4/1980,0.6,0.7,35,21,M,0.0\n')
+    with pytest.raises(ValueError, match=r'line 8 .*\(M\)'):
+        ReadSNOTEL(path, cache=False)
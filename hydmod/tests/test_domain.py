@@ -0,0 +1,90 @@
+import tracemalloc
+import numpy as np
+from hydmod.domain import ActiveCells
+from hydmod.flow_routing import FlowNetwork, FlowProportions_Sparse
+
+
+def _Watershed(shape=(14, 17), seed=0):
+    """
+    Dem of a valley draining south and an irregular mask inside it
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.indices(shape)
+    dem = 100.0 - 1.0*row + 0.7*np.abs(col - shape[1]//2) + rng.random(shape)*0.5
+    mask = (np.abs(col - shape[1]//2) < 2 + row//2) & (row > 1)
+    return dem, mask
+
+
+def test_pack_unpack():
+    dem, mask = _Watershed()
+    cells = ActiveCells(mask)
+    assert cells.size == mask.sum()
+    np.testing.assert_array_equal(cells.mask(), mask)
+    values = np.random.default_rng(1).random((3,) + mask.shape)
+    packed = cells.pack(values)
+    assert packed.shape == (3, mask.sum())
+    np.testing.assert_array_equal(packed, values[:, mask])
+    grid = cells.unpack(packed)
+    np.testing.assert_array_equal(grid[:, mask], values[:, mask])
+    assert np.isnan(grid[:, ~mask]).all()
+    np.testing.assert_array_equal(cells.unpack(packed, fill=-1.0)[:, ~mask], -1.0)
+
+def test_pack_unpack_out():
+    dem, mask = _Watershed(seed=2)
+    cells = ActiveCells(mask)
+    values = np.random.default_rng(3).random(mask.shape)
+    packed = np.empty(cells.size)
+    assert cells.pack(values, out=packed) is packed
+    out = np.full(mask.shape, 5.0)
+    assert cells.unpack(packed, out=out) is out
+    np.testing.assert_array_equal(out, np.where(mask, values, 5.0))
+
+def test_pack_out_without_allocation():
+    mask = np.zeros((300, 300), dtype=bool)
+    mask[10:290, 5:295] = True
+    cells = ActiveCells(mask)
+    values = np.random.default_rng(4).random((2,) + mask.shape)
+    packed = np.empty((2, cells.size))
+    cells.pack(values, out=packed)
+    tracemalloc.start()
+    try:
+        cells.pack(values, out=packed)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # gathered straight into out, without a temporary copy of the packed values or the indices
+    assert peak < 4096
+    np.testing.assert_array_equal(packed, values[:, mask])
+
+def test_pack_broadcast_and_scalar():
+    dem, mask = _Watershed()
+    cells = ActiveCells(mask)
+    station = np.broadcast_to(np.arange(4.0)[:, np.newaxis, np.newaxis], (4,) + mask.shape)
+    np.testing.assert_array_equal(cells.pack(station), np.arange(4.0)[:, np.newaxis])
+    np.testing.assert_array_equal(cells.pack(np.ones((2, 1, 1))), np.ones((2, 1)))
+    assert cells.pack(2.5) == 2.5
+
+def test_routing_order():
+    dem, mask = _Watershed(seed=4)
+    network = FlowProportions_Sparse(dem)
+    cells = ActiveCells(mask, network)
+    np.testing.assert_array_equal(np.sort(cells.index), np.flatnonzero(mask))
+    packed = cells.pack_network(network)
+    # cells are packed upslope to downslope, so every edge drains to a later cell
+    assert packed.donor.size > 0
+    assert np.all(packed.donor < packed.receiver)
+
+def test_pack_network():
+    dem, mask = _Watershed(seed=5)
+    network = FlowProportions_Sparse(dem)
+    cells = ActiveCells(mask, network)
+    packed = cells.pack_network(network)
+    flow = np.random.default_rng(6).random(mask.shape)
+    # flow from outside the mask does not enter and flow leaving the mask leaves the domain
+    expected = network.route(np.where(mask, flow, 0.0))
+    np.testing.assert_allclose(packed.route(cells.pack(flow)), cells.pack(expected), rtol=0.0, atol=1e-15)
+    # accumulation matches the grid network without the edges that leave or enter the mask
+    inside = mask.ravel()[network.donor] & mask.ravel()[network.receiver]
+    clipped = FlowNetwork(network.donor[inside], network.receiver[inside], network.proportion[inside], mask.shape)
+    np.testing.assert_allclose(cells.unpack(packed.accumulate(cells.pack(flow)), fill=0.0),
+                               clipped.accumulate(np.where(mask, flow, 0.0))*mask, rtol=1e-12)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from hydmod.ensemble import EnsembleParameter, EnsembleSize
+from hydmod.flow_routing import FlowProportions_Sparse
+from hydmod.precip import MeltDegreeDay_USACE, ModelSWE, ModelSWE_2d, PrecipPhase_2d
+from hydmod.smr import SMRGrid, SMRModel, SMRParameters
+
+SHAPE = (3, 4)
+
+
+def test_ensemble_parameters():
+    k = EnsembleParameter([1.0, 1.5, 2.0], ndim=3)
+    assert k.shape == (3, 1, 1, 1)
+    assert EnsembleSize(k, 2.0, np.ones(SHAPE[0])[:1]) == 3
+    assert EnsembleSize(1.0, 2.0) == 1
+    with pytest.raises(ValueError):
+        EnsembleSize(k, EnsembleParameter([1.0, 2.0]))
+    with pytest.raises(ValueError):
+        EnsembleParameter(np.ones((2, 2)))
+
+def test_ensemble_snow_broadcast():
+    # each member of an ensemble of snow parameters matches a run with that member's parameters
+    rng = np.random.default_rng(3)
+    tavg = rng.random((40,) + SHAPE)*12.0 - 4.0
+    ppt = np.where(rng.random((40,) + SHAPE) < 0.4, rng.random((40,) + SHAPE)*0.02, 0.0)
+    kvalues, trainvalues = np.array([1.0, 1.5]), np.array([2.0, 3.0])
+    k, train = EnsembleParameter(kvalues, ndim=3), EnsembleParameter(trainvalues, ndim=3)
+    melt = MeltDegreeDay_USACE(tavg, k=k, tbase=0.0)
+    snow, rain = PrecipPhase_2d(ppt, tavg, train, 0.0)
+    swe, actual = ModelSWE(snow, melt, axis=1)
+    assert swe.shape == (2, 40) + SHAPE
+    for m in range(2):
+        melt_m = MeltDegreeDay_USACE(tavg, k=kvalues[m], tbase=0.0)
+        snow_m, rain_m = PrecipPhase_2d(ppt, tavg, trainvalues[m], 0.0)
+        swe_m, actual_m = ModelSWE_2d(snow_m, melt_m)
+        np.testing.assert_allclose(swe[m], swe_m, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(rain[m], rain_m, rtol=1e-12, atol=1e-15)
+
+def test_ensemble_model():
+    # an ensemble of soil parameters, each member matching a run with that member's parameters
+    rng = np.random.default_rng(4)
+    row, col = np.indices((6, 7))
+    dem = 50.0 - row - 0.3*np.abs(col - 3) + rng.random((6, 7))*0.2
+    grid = SMRGrid(dem, np.full(dem.shape, 10.0), (0.0, 10.0, 0.0, 0.0, 0.0, -10.0),
+                   network=FlowProportions_Sparse(dem))
+    forcing = {'ppt': rng.random((20, 6, 7))*0.05, 'pet': np.full(20, 0.004)}
+    ksat, alpha = np.array([1.0, 5.0, 20.0]), np.array([0.01, 0.02, 0.05])
+    params = SMRParameters(1.0, 0.45, 0.3, 0.1, EnsembleParameter(ksat, ndim=2), 0.002,
+                           EnsembleParameter(alpha, ndim=2))
+    out = SMRModel(grid, params, forcing, storage=0.3).run()
+    assert out['q'].shape == (20, 3, 6, 7)
+    for m in range(3):
+        single = SMRModel(grid, SMRParameters(1.0, 0.45, 0.3, 0.1, ksat[m], 0.002, alpha[m]), forcing,
+                          storage=0.3).run()
+        for name in ('s', 'q', 'sb', 'bf'):
+            np.testing.assert_allclose(out[name][:, m], single[name], rtol=1e-12, atol=1e-15, err_msg=name)
@@ -0,0 +1,102 @@
+import tracemalloc
+import numpy as np
+from hydmod.flow_routing import FlowNetwork, FlowProportions, FlowProportions_Sparse, RouteFlow
+
+
+def _Dem(shape=(18, 23), seed=0):
+    """
+    Sloping surface with noise, so every cell has a distinct elevation and most drain to several neighbours
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.indices(shape)
+    return 100.0 - 1.5*row - 0.5*np.abs(col - shape[1]//2) + rng.random(shape)
+
+def _Proportions(dem):
+    """
+    Dense flow proportions (for RouteFlow) and the sparse network of the same dem
+    """
+    with np.errstate(invalid='ignore'):
+        flowprop = FlowProportions(dem)
+    return flowprop, FlowProportions_Sparse(dem)
+
+def _Accumulate_Loop(flowprop, weights):
+    """
+    Weighted flow accumulation by routing the flow of every cell downslope until none is left
+    """
+    acc = np.array(weights, dtype=np.float64)
+    flow = acc.copy()
+    for i in range(flow.size):
+        flow = RouteFlow(flowprop, flow)[0]
+        if not flow.any():
+            break
+        acc += flow
+    return acc
+
+
+def test_route_matches_routeflow():
+    dem = _Dem()
+    flowprop, network = _Proportions(dem)
+    rng = np.random.default_rng(1)
+    flow = rng.random((6,) + dem.shape)
+    routed, residual = network.route(flow, residual=True)
+    total = 0.0
+    for i in range(flow.shape[0]):
+        expected, unrouted = RouteFlow(flowprop, flow[i])
+        np.testing.assert_allclose(routed[i], expected, rtol=0.0, atol=1e-15)
+        total += unrouted
+    # flow leaving the grid and of pits is the only flow not routed
+    assert residual > 0.0
+    assert np.isclose(residual, total, rtol=1e-12, atol=1e-12)
+
+def test_route_out_and_types():
+    dem = _Dem(seed=2)
+    flowprop, network = _Proportions(dem)
+    flow = np.random.default_rng(3).random(dem.shape)
+    expected = RouteFlow(flowprop, flow)[0]
+    out = np.full(dem.shape, np.nan)
+    assert network.route(flow, out=out) is out
+    np.testing.assert_allclose(out, expected, rtol=0.0, atol=1e-15)
+    out32 = np.empty(dem.shape, dtype=np.float32)
+    network.route(flow.astype(np.float32), out=out32)
+    np.testing.assert_allclose(out32, expected, rtol=1e-6, atol=1e-6)
+    ones = network.route(np.ones(dem.shape, dtype=int))
+    np.testing.assert_allclose(ones, RouteFlow(flowprop, np.ones(dem.shape))[0], rtol=0.0, atol=1e-15)
+
+def test_accumulate_matches_routing():
+    dem = _Dem(seed=4)
+    flowprop, network = _Proportions(dem)
+    weights = np.random.default_rng(5).random(dem.shape)
+    np.testing.assert_allclose(network.accumulate(weights), _Accumulate_Loop(flowprop, weights), rtol=1e-12)
+    # routing still matches after accumulate has sorted the edges
+    np.testing.assert_allclose(network.route(weights), RouteFlow(flowprop, weights)[0], rtol=0.0, atol=1e-15)
+
+def test_accumulate_stack():
+    dem = _Dem(seed=6)
+    flowprop, network = _Proportions(dem)
+    weights = np.random.default_rng(7).random((3,) + dem.shape)
+    acc = network.accumulate(weights)
+    for i in range(weights.shape[0]):
+        np.testing.assert_allclose(acc[i], _Accumulate_Loop(flowprop, weights[i]), rtol=1e-12)
+
+def test_accumulate_chain():
+    # three cells in a row draining east, the last one is the outlet
+    network = FlowNetwork([0, 1], [1, 2], [1.0, 1.0], (1, 3))
+    np.testing.assert_array_equal(network.accumulate(np.ones((1, 3))), [[1.0, 2.0, 3.0]])
+    np.testing.assert_array_equal(network.route(np.ones((1, 3))), [[0.0, 1.0, 1.0]])
+
+def test_route_without_allocation():
+    dem = _Dem((60, 70), seed=8)
+    network = FlowProportions_Sparse(dem)
+    flow = np.random.default_rng(9).random((2,) + dem.shape)
+    out = np.empty(flow.shape)
+    network.route(flow, out=out)
+    tracemalloc.start()
+    network.route(flow, out=out)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < flow[0].nbytes//4
+
+def test_route_no_edges():
+    network = FlowNetwork([], [], [], (2, 3))
+    out = np.full((2, 3), np.nan)
+    np.testing.assert_array_equal(network.route(np.ones((2, 3)), out=out), 0.0)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from hydmod.forcing import Forcing, LapseRateOffset
+
+SHAPE = (3, 4)
+
+
+def _Series(ndays=10, seed=0):
+    return np.random.default_rng(seed).random(ndays)
+
+
+def test_station_series_view():
+    ppt = _Series()
+    forcing = Forcing(SHAPE, ppt=ppt)
+    assert forcing.ndays == 10
+    day = forcing.day('ppt', 3)
+    assert day.shape == SHAPE and not day.flags.writeable
+    np.testing.assert_array_equal(day, ppt[3])
+    full = forcing['ppt']
+    assert full.shape == (10,) + SHAPE
+    # the series is not copied to every cell
+    assert full.strides[1:] == (0, 0)
+    np.testing.assert_array_equal(full, np.broadcast_to(ppt[:, np.newaxis, np.newaxis], full.shape))
+    np.testing.assert_array_equal(forcing.station('ppt'), ppt)
+    assert 'ppt' in forcing and list(forcing.keys()) == ['ppt']
+
+def test_stacks_and_ensembles():
+    rng = np.random.default_rng(1)
+    stack = rng.random((10,) + SHAPE)
+    members = rng.random((2, 10) + SHAPE)
+    forcing = Forcing(SHAPE, dtype=np.float32, pet=stack, ppt=members)
+    assert forcing.day('pet', 4).dtype == np.float32
+    np.testing.assert_array_equal(forcing.day('pet', 4), stack[4].astype(np.float32))
+    assert forcing.day('ppt', 4).shape == (2,) + SHAPE
+    np.testing.assert_array_equal(forcing.day('ppt', 4), members[:, 4].astype(np.float32))
+    assert forcing['ppt'].shape == (2, 10) + SHAPE
+
+def test_adjustment():
+    tavg = _Series(seed=2)*10.0
+    dem = np.arange(12.0).reshape(SHAPE)*100.0
+    offset = LapseRateOffset(dem, 500.0)
+    np.testing.assert_allclose(offset, -0.0065*(dem - 500.0))
+    forcing = Forcing(SHAPE)
+    forcing.add('tavg', tavg, scale=2.0, offset=offset)
+    day = forcing.day('tavg', 5)
+    np.testing.assert_allclose(day, 2.0*tavg[5] + offset)
+    # the same buffer is reused for every day, unless out is given
+    assert forcing.day('tavg', 6) is day
+    out = np.empty(SHAPE)
+    assert forcing.day('tavg', 7, out=out) is out
+    np.testing.assert_allclose(out, 2.0*tavg[7] + offset)
+    np.testing.assert_allclose(forcing['tavg'], 2.0*tavg[:, np.newaxis, np.newaxis] + offset)
+
+def test_invalid_shapes():
+    forcing = Forcing(SHAPE, ppt=_Series())
+    with pytest.raises(ValueError, match='11 days'):
+        forcing.add('pet', _Series(11))
+    with pytest.raises(ValueError):
+        forcing.add('pet', np.zeros((10, 4, 3)))
+    with pytest.raises(ValueError):
+        forcing.add('pet', np.zeros((1, 2, 10) + SHAPE))
+    # a single grid is not taken as a stack with a day per column
+    with pytest.raises(ValueError, match='single grid'):
+        Forcing(SHAPE, pet=np.zeros(SHAPE))
+    with pytest.raises(ValueError, match='single grid'):
+        Forcing((10, 10), pet=np.zeros((10, 10)))
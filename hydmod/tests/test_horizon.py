@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from hydmod.horizon import HorizonIndex
+from hydmod.radiation import TerrainIllumination
+
+
+def _Ridge(shape=(30, 8), row=25, height=50.0):
+    """
+    Flat ground with a wall of the given height from row to the southern edge of the dem
+    """
+    dem = np.zeros(shape)
+    dem[row:] = height
+    return dem
+
+def _RidgeHorizon(shape=(30, 8), row=25, height=50.0, cellsize=10.0):
+    """
+    Horizon angle to the south of the cells north of the wall, by hand
+    """
+    distance = (row - np.arange(row))*cellsize
+    return np.arctan(height/distance)
+
+
+@pytest.mark.parametrize('dtype, tolerance', [(np.uint8, 0.5*np.pi/255.0), (np.float16, 1e-3)])
+def test_horizon_angles(dtype, tolerance):
+    horizon = HorizonIndex(_Ridge(), 10.0, dtype=dtype)
+    south = horizon.sector(np.pi)
+    assert south == 8
+    expected = _RidgeHorizon()
+    angle = horizon.angle(south)[:25]
+    # every cell is searched up to 15 cells away, further offsets are spaced geometrically
+    np.testing.assert_allclose(angle[10:], np.broadcast_to(expected[10:, np.newaxis], (15, 8)), rtol=0.0,
+                               atol=tolerance)
+    np.testing.assert_allclose(angle[:10], np.broadcast_to(expected[:10, np.newaxis], (10, 8)), rtol=0.0, atol=0.01)
+    # nothing rises to the north
+    np.testing.assert_array_equal(horizon.angle(horizon.sector(0.0)), 0.0)
+
+def test_shaded_scalar_and_series():
+    horizon = HorizonIndex(_Ridge(), 10.0)
+    elevation = np.radians([30.0, 60.0, -5.0])
+    azimuth = np.full(3, np.pi)
+    shaded = horizon.shaded(elevation, azimuth)
+    assert shaded.shape == (3, 30, 8)
+    for i in range(3):
+        single = horizon.shaded(elevation[i], azimuth[i])
+        assert single.shape == (30, 8)
+        np.testing.assert_array_equal(single, shaded[i])
+    # the sun at 30 degrees is behind the wall for cells less than 50/tan(30) = 87 m from it
+    np.testing.assert_array_equal(shaded[0][:25, 0], _RidgeHorizon() > np.radians(30.0))
+    assert shaded[2].all()
+    out = np.zeros((30, 8), dtype=bool)
+    assert horizon.shaded(elevation[0], np.pi, out=out) is out
+    np.testing.assert_array_equal(out, shaded[0])
+
+def test_shaded_per_cell():
+    horizon = HorizonIndex(_Ridge(), 10.0)
+    elevation = np.radians([30.0, 60.0])
+    azimuth = np.full(2, np.pi)
+    expected = horizon.shaded(elevation, azimuth)
+    grids = np.broadcast_to(elevation[:, np.newaxis, np.newaxis], (2, 30, 8))
+    np.testing.assert_array_equal(horizon.shaded(grids, np.full(grids.shape, np.pi)), expected)
+    # the sun lower towards the west of the grid
+    grids = np.where(np.arange(8) < 4, np.radians(30.0), np.radians(60.0))[np.newaxis] * np.ones((1, 30, 1))
+    shaded = horizon.shaded(grids, np.full(grids.shape, np.pi))
+    np.testing.assert_array_equal(shaded[0][:, :4], expected[0][:, :4])
+    np.testing.assert_array_equal(shaded[0][:, 4:], expected[1][:, 4:])
+
+def test_illumination_behind_ridge():
+    horizon = HorizonIndex(_Ridge(), 10.0)
+    flat = np.zeros((30, 8))
+    terrain = TerrainIllumination(flat, flat, horizon=horizon)
+    # the noon sun is about 21.5 degrees high at 45N on the winter solstice and 68.4 degrees on the summer solstice
+    winter = terrain.factor(45.0, 355, units='degrees')
+    assert winter.shape == (30, 8)
+    series = terrain.factor(45.0, np.array([355, 172]), units='degrees')
+    np.testing.assert_array_equal(winter, series[0])
+    np.testing.assert_array_equal(winter[:25, 0] == 0.0, _RidgeHorizon() > np.radians(21.5))
+    np.testing.assert_allclose(winter[:3], 1.0, rtol=1e-6)
+    assert winter[24, 0] == 0.0
+    # only the cell next to the wall (78.7 degrees) is still shaded in summer
+    np.testing.assert_array_equal(series[1][:25, 0] == 0.0, np.arange(25) == 24)
+    np.testing.assert_array_equal(terrain.factor(45.0, np.array([172]), units='degrees')[0], series[1])
+    # without the horizon every cell of flat ground has the factor of a horizontal surface
+    np.testing.assert_allclose(TerrainIllumination(flat, flat).factor(45.0, 355, units='degrees'), 1.0, rtol=1e-6)
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from hydmod import backend
+from hydmod.precip import DaysSinceEvent, ModelSWE, ModelSWE_2d, PrecipPhase, PrecipPhase_2d, SnowAge
+
+
+@pytest.fixture(params=['numpy', 'numba'])
+def kernels(request):
+    """
+    Run a test with the NumPy implementations and with the compiled kernels
+    """
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+    previous = backend.backend
+    backend.SetBackend(request.param)
+    yield request.param
+    backend.backend = previous
+
+
+def _ModelSWE_Loop(ppt_snow, swe_melt, dtype):
+    """
+    Daily loop of the original point model, applied to every point of the other axes
+    """
+    swe_cum = np.zeros(ppt_snow.shape, dtype=dtype)
+    act_melt = np.zeros(swe_melt.shape, dtype=dtype)
+    for point in np.ndindex(ppt_snow.shape[1:]):
+        for i in range(1, ppt_snow.shape[0]):
+            swe_inc = swe_cum[(i-1,) + point] + ppt_snow[(i,) + point] - swe_melt[(i,) + point]
+            if swe_inc > 0.0:
+                swe_cum[(i,) + point] = swe_inc
+                act_melt[(i,) + point] = swe_melt[(i,) + point]
+            else:
+                act_melt[(i,) + point] = swe_cum[(i-1,) + point]
+    return swe_cum, act_melt
+
+def _PrecipPhase_Loop(precip, temp, train, tsnow):
+    snow = np.zeros(precip.shape)
+    for index in np.ndindex(precip.shape):
+        t = temp[index]
+        if t >= train:
+            snow[index] = 0.0
+        elif t > tsnow:
+            snow[index] = precip[index]*(t - tsnow)/(train - tsnow)
+        else:
+            snow[index] = precip[index]
+    return snow, precip - snow
+
+def _DaysSinceEvent_Loop(events, reset=None):
+    age = np.zeros(events.shape)
+    for i in range(1, events.shape[0]):
+        restart = events[i] if reset is None else events[i] | reset[i]
+        age[i] = np.where(restart, 0, age[i-1] + 1)
+    return age
+
+def _Snow(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    ppt_snow = np.where(rng.random(shape) < 0.4, rng.random(shape)*20.0, 0.0)
+    swe_melt = rng.random(shape)*8.0
+    return ppt_snow, swe_melt
+
+
+def test_modelswe_point(kernels):
+    ppt_snow, swe_melt = _Snow(400)
+    swe, melt = ModelSWE(ppt_snow, swe_melt)
+    swe_ref, melt_ref = _ModelSWE_Loop(ppt_snow, swe_melt, np.float64)
+    assert swe.dtype == np.float64
+    np.testing.assert_allclose(swe, swe_ref, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(melt, melt_ref, rtol=1e-12, atol=1e-12)
+
+def test_modelswe_grid(kernels):
+    ppt_snow, swe_melt = _Snow((120, 4, 5), seed=1)
+    swe, melt = ModelSWE_2d(ppt_snow, swe_melt)
+    swe_ref, melt_ref = _ModelSWE_Loop(ppt_snow, swe_melt, np.float64)
+    np.testing.assert_allclose(swe, swe_ref, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(melt, melt_ref, rtol=1e-12, atol=1e-12)
+
+def test_modelswe_float32(kernels):
+    ppt_snow, swe_melt = (x.astype(np.float32) for x in _Snow((200, 3), seed=2))
+    swe, melt = ModelSWE(ppt_snow, swe_melt)
+    swe_ref, melt_ref = _ModelSWE_Loop(ppt_snow, swe_melt, np.float32)
+    assert swe.dtype == np.float32 and melt.dtype == np.float32
+    np.testing.assert_array_equal(swe, swe_ref)
+    np.testing.assert_array_equal(melt, melt_ref)
+
+def test_modelswe_axis(kernels):
+    ppt_snow, swe_melt = _Snow((3, 150), seed=3)
+    swe, melt = ModelSWE(ppt_snow, swe_melt, axis=1)
+    swe_ref, melt_ref = _ModelSWE_Loop(ppt_snow.T, swe_melt.T, np.float64)
+    np.testing.assert_allclose(swe, swe_ref.T, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(melt, melt_ref.T, rtol=1e-12, atol=1e-12)
+
+def test_precipphase():
+    rng = np.random.default_rng(4)
+    precip = rng.random(500)*10.0
+    temp = rng.random(500)*10.0 - 4.0
+    snow, rain = PrecipPhase(precip, temp, 3.0, 0.0)
+    snow_ref, rain_ref = _PrecipPhase_Loop(precip, temp, 3.0, 0.0)
+    np.testing.assert_allclose(snow, snow_ref, rtol=1e-14, atol=0.0)
+    np.testing.assert_allclose(rain, rain_ref, rtol=1e-14, atol=1e-14)
+
+def test_precipphase_grid_thresholds():
+    rng = np.random.default_rng(5)
+    precip = rng.random((30, 4, 6))*10.0
+    temp = rng.random((30, 4, 6))*10.0 - 4.0
+    train = 2.0 + rng.random((4, 6))
+    tsnow = -rng.random((4, 6))
+    snow, rain = PrecipPhase_2d(precip, temp, train, tsnow)
+    for r, c in np.ndindex(4, 6):
+        snow_ref, rain_ref = _PrecipPhase_Loop(precip[:, r, c], temp[:, r, c], train[r, c], tsnow[r, c])
+        np.testing.assert_allclose(snow[:, r, c], snow_ref, rtol=1e-14, atol=0.0)
+        np.testing.assert_allclose(rain[:, r, c], rain_ref, rtol=1e-14, atol=1e-14)
+
+def test_precipphase_float32():
+    precip = np.linspace(0.0, 10.0, 50, dtype=np.float32)
+    temp = np.linspace(-5.0, 5.0, 50, dtype=np.float32)
+    snow, rain = PrecipPhase(precip, temp)
+    assert snow.dtype == np.float32 and rain.dtype == np.float32
+    snow_ref, rain_ref = _PrecipPhase_Loop(precip.astype(np.float64), temp.astype(np.float64), 3.0, 0.0)
+    np.testing.assert_allclose(snow, snow_ref, rtol=1e-6, atol=1e-6)
+
+def test_snowage(kernels):
+    rng = np.random.default_rng(6)
+    snowfall = np.where(rng.random(300) < 0.2, 1.0, 0.0)
+    np.testing.assert_array_equal(SnowAge(snowfall), _DaysSinceEvent_Loop(snowfall > 0.0))
+    grid = np.where(rng.random((100, 3, 4)) < 0.2, 1.0, 0.0)
+    np.testing.assert_array_equal(SnowAge(grid), _DaysSinceEvent_Loop(grid > 0.0))
+
+def test_snowage_meltout(kernels):
+    rng = np.random.default_rng(7)
+    snowfall = np.where(rng.random((200, 5)) < 0.1, 1.0, 0.0)
+    swe = np.where(rng.random((200, 5)) < 0.3, 0.0, 1.0)
+    np.testing.assert_array_equal(SnowAge(snowfall, swe), _DaysSinceEvent_Loop(snowfall > 0.0, swe <= 0.0))
+
+def test_dayssinceevent_axis(kernels):
+    rng = np.random.default_rng(8)
+    events = rng.random((4, 250)) < 0.05
+    np.testing.assert_array_equal(DaysSinceEvent(events, axis=1), _DaysSinceEvent_Loop(events.T).T)
@@ -0,0 +1,90 @@
+import math
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from hydmod import precision
+from hydmod.flow_routing import FlowProportions
+from hydmod.precip import PrecipPhase, SnowAge
+from hydmod.precision import CompensatedSum, FloatType, Precision, SetPrecision, Total
+from hydmod.radiation import SnowAlbedo
+
+
+@pytest.fixture
+def restore():
+    """
+    Restore the global precision after a test that changes it
+    """
+    previous = precision.precision
+    yield
+    precision.precision = previous
+
+
+def test_compensated_sum():
+    total = CompensatedSum()
+    naive = 0.0
+    for value in [1e16] + [1.0]*1000 + [-1e16]:
+        total.add(value)
+        naive += value
+    # each 1.0 is lost when added to 1e16 in plain float64, the compensation keeps them
+    assert naive == 0.0
+    assert total.value == 1000.0
+    # arrays are summed in float64, float32 values are not accumulated in float32
+    total = CompensatedSum()
+    values = np.full(10**6, 0.1, dtype=np.float32)
+    for k in range(10):
+        total.add(values)
+    assert total.value == pytest.approx(1e7*float(np.float32(0.1)), rel=1e-12)
+    total.add(-2.5)
+    assert total.value == pytest.approx(1e7*float(np.float32(0.1)) - 2.5, rel=1e-12)
+
+def test_total():
+    values = np.random.default_rng(0).random((300, 400)).astype(np.float32)*1e4
+    total = Total(values)
+    assert isinstance(total, float)
+    assert total == pytest.approx(math.fsum(values.astype(np.float64).ravel()), rel=1e-14)
+    assert Total(2.5) == 2.5
+
+def test_precision(restore):
+    assert Precision(np.float32) == np.float32
+    assert Precision('float64') == np.float64
+    with pytest.raises(ValueError):
+        Precision(np.float16)
+    with pytest.raises(ValueError):
+        SetPrecision(np.int32)
+    SetPrecision(np.float32)
+    assert Precision() == np.float32 and Precision(np.float64) == np.float64
+    # integer inputs take the global precision, floating inputs keep their type
+    assert FloatType(np.arange(3)) == np.float32
+    assert FloatType(np.arange(3.0), np.float32(1.0)) == np.float64
+    assert FloatType(np.arange(3.0), dtype=np.float32) == np.float32
+    SetPrecision(np.float64)
+    assert Precision() == np.float64 and FloatType(np.arange(3)) == np.float64
+
+def test_kernels_honor_precision(restore):
+    rng = np.random.default_rng(1)
+    snowfall = np.where(rng.random((30, 4, 5)) < 0.3, 1.0, 0.0).astype(np.float32)
+    dem = rng.random((8, 9))*10.0
+    SetPrecision(np.float32)
+    assert SnowAge(snowfall).dtype == np.float32
+    assert SnowAlbedo(np.arange(10)).dtype == np.float32
+    with np.errstate(invalid='ignore'):
+        assert FlowProportions(dem).dtype == np.float32
+    snow, rain = PrecipPhase(snowfall, np.float32(1.0))
+    assert snow.dtype == rain.dtype == np.float32
+    # float64 inputs are not cast down
+    assert PrecipPhase(snowfall.astype(np.float64), 1.0)[0].dtype == np.float64
+    SetPrecision(np.float64)
+    assert SnowAge(snowfall).dtype == np.float64
+    assert SnowAlbedo(np.arange(10)).dtype == np.float64
+
+def test_environment_variable():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = 'from hydmod import precision; print(precision.Precision())'
+    env = dict(os.environ, HYDMOD_PRECISION='float32', PYTHONPATH=root)
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'float32'
+    env['HYDMOD_PRECISION'] = 'float16'
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+    assert result.returncode != 0 and 'HYDMOD_PRECISION' in result.stderr
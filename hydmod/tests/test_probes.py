@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from hydmod.domain import ActiveCells
+from hydmod.probes import SECONDS_PER_DAY, OutletProbe, PointProbe, SnapshotProbe
+
+GEOT = (500000.0, 30.0, 0.0, 4800000.0, 0.0, -30.0)
+
+
+class _Grid(object):
+    def __init__(self, shape, mask=None):
+        self.shape = shape
+        self.geot = GEOT
+        self.cells = None if mask is None else ActiveCells(mask)
+        self.state_shape = shape if mask is None else (self.cells.size,)
+
+
+class _Forcing(object):
+    def __init__(self, dates):
+        self.dates = dates
+
+
+class _Model(object):
+    """
+    Stand-in for smr.SMRModel that steps through given daily grids of state variables
+    """
+
+    def __init__(self, grids, mask=None, dates=None, start=0):
+        first = next(iter(grids.values()))
+        self.grids = grids
+        self.grid = _Grid(first.shape[-2:], mask)
+        self.ndays = first.shape[0]
+        self.shape = first.shape[1:-2] + self.grid.state_shape
+        self.dtype = first.dtype
+        self.forcing = _Forcing(dates)
+        self.day = start
+        self.state = {}
+
+    def run(self, probe, ndays=None):
+        ndays = self.ndays - self.day if ndays is None else ndays
+        probe.start(self, ndays)
+        for i in range(ndays):
+            cells = self.grid.cells
+            for name, grids in self.grids.items():
+                self.state[name] = grids[self.day] if cells is None else cells.pack(grids[self.day])
+            self.day += 1
+            probe.record(self, i)
+
+
+def _Grids(shape, names=('s', 'q'), seed=0):
+    rng = np.random.default_rng(seed)
+    return {name: rng.random(shape) for name in names}
+
+def _Mask(shape=(6, 8)):
+    mask = np.ones(shape, dtype=bool)
+    mask[0] = False
+    mask[:, -2:] = False
+    return mask
+
+
+def test_point_probe():
+    grids = _Grids((12, 6, 8))
+    probe = PointProbe(3, 4, names=('s', 'q'))
+    _Model(grids).run(probe)
+    assert probe.values['s'].shape == (12,)
+    np.testing.assert_array_equal(probe.values['s'], grids['s'][:, 3, 4])
+    np.testing.assert_array_equal(probe.values['q'], grids['q'][:, 3, 4])
+    # several cells of a masked grid, from the packed state
+    rows, cols = np.array([[1, 2], [5, 5]]), np.array([[0, 5], [1, 3]])
+    probe = PointProbe(rows, cols, names=('s',))
+    _Model(grids, mask=_Mask(), start=2).run(probe, ndays=7)
+    assert probe.values['s'].shape == (7, 2, 2)
+    np.testing.assert_array_equal(probe.values['s'], grids['s'][2:9, rows, cols])
+
+def test_point_probe_ensemble():
+    grids = _Grids((12, 3, 6, 8))
+    probe = PointProbe([2, 4], [1, 1])
+    _Model(grids, mask=_Mask()).run(probe)
+    assert probe.values['q'].shape == (12, 3, 2)
+    np.testing.assert_array_equal(probe.values['q'], grids['q'][:, :, [2, 4], [1, 1]])
+
+def test_point_probe_outside():
+    grids = _Grids((4, 6, 8))
+    with pytest.raises(ValueError, match='outside the grid'):
+        _Model(grids).run(PointProbe(6, 0))
+    with pytest.raises(ValueError, match='outside the mask'):
+        _Model(grids, mask=_Mask()).run(PointProbe(0, 3))
+
+def test_outlet_probe():
+    grids = _Grids((12, 6, 8))
+    probe = OutletProbe(5, 2)
+    _Model(grids, mask=_Mask()).run(probe)
+    # q in m of water over a 30 m cell each day
+    np.testing.assert_allclose(probe.discharge, grids['q'][:, 5, 2]*900.0/SECONDS_PER_DAY, rtol=1e-12)
+    assert probe.values['q'] is probe.discharge
+    probe = OutletProbe([5, 1], [2, 0], cellarea=1000.0)
+    _Model(_Grids((12, 2, 6, 8))).run(probe)
+    assert probe.discharge.shape == (12, 2, 2)
+    ensemble = _Grids((12, 2, 6, 8))['q']
+    np.testing.assert_allclose(probe.discharge, ensemble[:, :, [5, 1], [2, 0]]*1000.0/SECONDS_PER_DAY, rtol=1e-12)
+
+def test_snapshot_probe():
+    grids = _Grids((12, 6, 8))
+    probe = SnapshotProbe([1, 4, 11], names=('s', 'q'))
+    # day 1 is before the run and day 11 after it
+    _Model(grids, start=3).run(probe, ndays=6)
+    assert probe.values['s'].shape == (3, 6, 8)
+    assert np.isnan(probe.values['s'][[0, 2]]).all()
+    np.testing.assert_array_equal(probe.values['s'][1], grids['s'][4])
+    np.testing.assert_array_equal(probe.values['q'][1], grids['q'][4])
+    # masked ensemble, with nan outside the mask
+    mask = _Mask()
+    grids = _Grids((12, 2, 6, 8))
+    probe = SnapshotProbe(0)
+    _Model(grids, mask=mask).run(probe)
+    assert probe.values['s'].shape == (1, 2, 6, 8)
+    np.testing.assert_array_equal(probe.values['s'][0][:, mask], grids['s'][0][:, mask])
+    assert np.isnan(probe.values['s'][0][:, ~mask]).all()
+
+def test_snapshot_probe_dates():
+    grids = _Grids((12, 6, 8))
+    dates = np.datetime64('2001-03-25') + np.arange(12)
+    probe = SnapshotProbe(np.array(['2001-04-01', '2001-03-26'], dtype='datetime64[D]'))
+    _Model(grids, dates=dates).run(probe)
+    np.testing.assert_array_equal(probe.days, [7, 1])
+    np.testing.assert_array_equal(probe.values['s'], grids['s'][[7, 1]])
+    with pytest.raises(ValueError, match='not in the forcing'):
+        _Model(grids, dates=dates).run(SnapshotProbe(np.datetime64('2001-04-06')))
+    with pytest.raises(ValueError, match='no dates'):
+        _Model(grids).run(SnapshotProbe(np.datetime64('2001-04-01')))
@@ -0,0 +1,231 @@
+import tracemalloc
+import numpy as np
+import pytest
+from hydmod.atmosphere import WindRoughness
+from hydmod.radiation import (DENSITY_WATER, ENERGY_COMPONENTS, HEAT_FROM_GROUND, LATENT_HEAT_FUSION, SOLAR_GEOMETRY,
+                              DirectSolarRadiation_Adjustment, ExtraterrestrialRadiation, ExtraterrestrialRadiation_2d,
+                              LatentRadiation, LongwaveRadiation, SensibleRadiation, SnowEnergyBalance,
+                              SolarAzimuthAngle, SolarDeclination, SolarElevationAngle, SolarGeometryCache,
+                              SolarIncidenceAngle_2d, TerrainIllumination)
+
+DAYS = np.arange(1, 366, 7)
+
+
+def _Terrain(shape=(40, 50), seed=0):
+    """
+    Random slopes (percent) and aspects (degrees), with a band of flat ground
+    """
+    rng = np.random.default_rng(seed)
+    slope = rng.random(shape)*80.0
+    slope[:5] = 0.0
+    aspect = rng.random(shape)*360.0
+    return slope, aspect
+
+
+def test_geometry_cache_values():
+    cache = SolarGeometryCache()
+    lat = np.radians(np.linspace(40.0, 48.0, 6).reshape(2, 3))
+    geom = cache.lookup(lat, DAYS)
+    assert geom['phi'].shape == DAYS.shape + lat.shape
+    delta = SolarDeclination(DAYS)[:, np.newaxis, np.newaxis]
+    phi = SolarElevationAngle(lat, delta)
+    np.testing.assert_allclose(geom['delta'], np.broadcast_to(delta, geom['delta'].shape), rtol=1e-12)
+    np.testing.assert_allclose(geom['phi'], phi, rtol=1e-12)
+    np.testing.assert_allclose(geom['azs'], SolarAzimuthAngle(phi, lat, SolarDeclination(DAYS)), rtol=1e-12)
+    np.testing.assert_allclose(geom['sinphi'], np.sin(phi), rtol=1e-12)
+    np.testing.assert_allclose(geom['ra'], ExtraterrestrialRadiation(lat, DAYS[:, np.newaxis, np.newaxis]), rtol=1e-12)
+    np.testing.assert_allclose(ExtraterrestrialRadiation_2d(45.0, DAYS, units='degrees'),
+                               ExtraterrestrialRadiation(45.0, DAYS, units='degrees'), rtol=1e-12)
+    # a uniform latitude is broadcast over the grid without a copy
+    uniform = cache.lookup(np.full((30, 40), lat[0, 0]), DAYS, ('ra',))['ra']
+    assert uniform.shape == DAYS.shape + (30, 40) and uniform.strides[1:] == (0, 0)
+    np.testing.assert_array_equal(uniform, np.broadcast_to(geom['ra'][:, :1, :1], uniform.shape))
+
+def test_geometry_cache_hits_and_eviction():
+    cache = SolarGeometryCache(maxsize=120)
+    lat = np.radians([40.0, 41.0])
+    cache.lookup(lat, np.arange(1, 51))
+    assert (cache.hits, cache.misses, cache.size) == (0, 100, 100)
+    # a multi year run repeats the days of year, only days 51 to 55 are new
+    first = cache.lookup(lat, np.tile(np.arange(1, 56), 3))
+    assert (cache.hits, cache.misses, cache.size) == (100, 110, 110)
+    again = cache.lookup(lat, np.tile(np.arange(1, 56), 3))
+    assert (cache.hits, cache.misses) == (210, 110)
+    for name in first:
+        np.testing.assert_array_equal(again[name], first[name])
+    # the least recently used latitude is evicted once the cache is full
+    cache.lookup(lat[1], np.arange(1, 11))
+    cache.lookup(np.radians(42.0), np.arange(1, 31))
+    assert cache.size == 85 and cache.size <= cache.maxsize
+    cache.lookup(lat[1], np.arange(1, 56))
+    misses = cache.misses
+    cache.lookup(lat[0], np.arange(1, 56))
+    assert cache.misses == misses + 55
+    cache.clear()
+    assert (cache.hits, cache.misses, cache.size) == (0, 0, 0)
+
+def test_illumination_exact():
+    slope, aspect = _Terrain()
+    lat = np.radians(45.0)
+    factor = TerrainIllumination(slope, aspect, units='degrees').factor(lat, DAYS)
+    assert factor.shape == DAYS.shape + slope.shape
+    # the incidence angle of the original per cell evaluation, relative to the sun on a horizontal surface
+    geom = SOLAR_GEOMETRY.lookup(lat, DAYS, ('phi', 'azs'))
+    phi, azs = geom['phi'][:, np.newaxis, np.newaxis], geom['azs'][:, np.newaxis, np.newaxis]
+    incidence = SolarIncidenceAngle_2d(slope, np.radians(aspect), azs, phi)
+    np.testing.assert_allclose(factor, np.sin(incidence)/np.sin(phi), rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(factor[:, :5], 1.0, rtol=1e-6)
+
+@pytest.mark.parametrize('bins, tolerance', [((32, 72), 0.1), ((90, 360), 0.03)])
+def test_illumination_bins(bins, tolerance):
+    slope, aspect = _Terrain()
+    exact = TerrainIllumination(slope, aspect, units='degrees').factor(45.0, DAYS, units='degrees')
+    binned = TerrainIllumination(slope, aspect, units='degrees', bins=bins).factor(45.0, DAYS, units='degrees')
+    assert np.abs(binned - exact).max() < tolerance
+    assert np.abs(binned - exact).mean() < 0.15*tolerance
+    # flat ground has a bin of its own, whatever its aspect
+    np.testing.assert_allclose(binned[:, :5], 1.0, rtol=1e-6)
+
+def test_illumination_bins_flat_winter():
+    flat = np.zeros((4, 5))
+    aspect = np.linspace(0.0, 359.0, 20).reshape(4, 5)
+    for bins in (None, (32, 72), (4, 4)):
+        terrain = TerrainIllumination(flat, aspect, units='degrees', bins=bins)
+        np.testing.assert_allclose(terrain.factor(45.0, 355, units='degrees'), 1.0, rtol=1e-6)
+
+def _Integrated(slope, aspect, lat, doy, steps):
+    """
+    Daily factor by brute force over a (days, steps, rows, cols) stack of sun positions from the time of day
+    """
+    delta = SolarDeclination(doy)
+    omegas = np.arccos(-np.tan(lat)*np.tan(delta))
+    omega = omegas[:, np.newaxis]*((np.arange(steps) + 0.5)*(2.0/steps) - 1.0)
+    tod = (12.0 + omega*12.0/np.pi)[..., np.newaxis, np.newaxis]
+    delta = delta[:, np.newaxis, np.newaxis, np.newaxis]
+    sinphi = np.sin(lat)*np.sin(delta) + np.cos(lat)*np.cos(delta)*np.cos(np.pi*(tod - 12.0)/12.0)
+    phi = np.arcsin(sinphi)
+    azs = np.arccos(np.clip((np.sin(phi)*np.sin(lat) - np.sin(delta))/(np.cos(phi)*np.cos(lat)), -1.0, 1.0))
+    azs = np.where(tod > 12.0, np.pi + azs, np.pi - azs)
+    incidence = SolarIncidenceAngle_2d(slope, np.radians(aspect), azs, phi)
+    return np.sum(np.sin(incidence), axis=1)/np.sum(np.maximum(sinphi, 0.0), axis=1)
+
+def test_integration_exact():
+    slope, aspect = _Terrain(shape=(12, 15))
+    lat = np.radians(45.0)
+    factor = TerrainIllumination(slope, aspect, units='degrees', steps=24).factor(lat, DAYS)
+    assert factor.shape == DAYS.shape + slope.shape
+    np.testing.assert_allclose(factor, _Integrated(slope, aspect, lat, DAYS, 24), rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(factor[:, :5], 1.0, rtol=1e-5)
+    # the morning sun on east facing slopes balances the afternoon sun on west facing ones
+    terrain = TerrainIllumination(np.full((1, 2), 40.0), np.array([[90.0, 270.0]]), units='degrees', steps=24)
+    east, west = terrain.factor(lat, DAYS)[..., 0, 0], terrain.factor(lat, DAYS)[..., 0, 1]
+    np.testing.assert_allclose(east, west, rtol=1e-4)
+    # a steep north facing slope sees no sun at noon in winter, but some early and late in the day in summer
+    terrain = TerrainIllumination(np.full((1, 1), 150.0), 0.0, units='degrees', steps=48)
+    noon = TerrainIllumination(np.full((1, 1), 150.0), 0.0, units='degrees')
+    assert terrain.factor(lat, 355)[0, 0] == noon.factor(lat, 355)[0, 0] == 0.0
+    assert terrain.factor(lat, 172)[0, 0] > noon.factor(lat, 172)[0, 0]
+
+def test_integration_chunks_and_latitudes():
+    slope, aspect = _Terrain(shape=(12, 15))
+    days = np.tile(DAYS, 2)
+    expected = TerrainIllumination(slope, aspect, units='degrees', steps=12).factor(45.0, days, units='degrees')
+    for chunk in (1, 7, 500):
+        terrain = TerrainIllumination(slope, aspect, units='degrees', steps=12, chunk=chunk)
+        out = np.full(expected.shape, 9.0, dtype=expected.dtype)
+        assert terrain.factor(45.0, days, units='degrees', out=out) is out
+        np.testing.assert_allclose(out, expected, rtol=1e-6)
+    # a grid of latitudes, one per row
+    lat = np.broadcast_to(np.linspace(44.0, 46.0, 12)[:, np.newaxis], slope.shape)
+    terrain = TerrainIllumination(slope, aspect, units='degrees', steps=12, chunk=7)
+    factor = terrain.factor(lat, DAYS, units='degrees')
+    for row in (0, 5, 11):
+        single = TerrainIllumination(slope[row:row + 1], aspect[row:row + 1], units='degrees', steps=12)
+        np.testing.assert_allclose(factor[:, row:row + 1], single.factor(lat[row, 0], DAYS, units='degrees'),
+                                   rtol=1e-5, atol=1e-6)
+
+def test_integration_bins():
+    slope, aspect = _Terrain(shape=(12, 15))
+    exact = TerrainIllumination(slope, aspect, units='degrees', steps=12).factor(45.0, DAYS, units='degrees')
+    binned = TerrainIllumination(slope, aspect, units='degrees', bins=(90, 360), steps=12)
+    assert np.abs(binned.factor(45.0, DAYS, units='degrees') - exact).max() < 0.03
+    lat = np.broadcast_to(np.linspace(44.0, 46.0, 12)[:, np.newaxis], slope.shape)
+    exact = TerrainIllumination(slope, aspect, units='degrees', steps=12).factor(lat, DAYS, units='degrees')
+    assert np.abs(binned.factor(lat, DAYS, units='degrees') - exact).max() < 0.03
+
+def test_integration_memory():
+    slope, aspect = _Terrain(shape=(60, 80))
+    terrain = TerrainIllumination(slope, aspect, units='degrees', steps=24, chunk=8)
+    days = np.arange(1, 121)
+    out = np.empty(days.shape + slope.shape, dtype=terrain.cosbeta.dtype)
+    terrain.factor(45.0, days, units='degrees', out=out)
+    tracemalloc.start()
+    try:
+        terrain.factor(45.0, days, units='degrees', out=out)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # a few float64 grids per day of a chunk, far below the (days, steps, rows, cols) stack
+    assert peak < 4*8*slope.size*8
+
+def _Weather(ndays=70, shape=(6, 7), seed=2):
+    """
+    Station series of a winter and spring, with grids of radiation, forest cover and snow albedo
+    """
+    rng = np.random.default_rng(seed)
+    tavg = rng.normal(-2.0, 6.0, ndays)
+    series = {'tavg': tavg, 'td': tavg - rng.random(ndays)*5.0, 'wind': 0.5 + rng.random(ndays)*6.0,
+              'cc': rng.random(ndays)}
+    grids = {'qin': rng.random((ndays,) + shape)*20000.0, 'pfc': rng.random(shape)*80.0,
+             'snowalbedo': 0.5 + rng.random((ndays,) + shape)*0.4}
+    return series, grids
+
+def test_energy_balance_matches_separate_terms():
+    series, grids = _Weather()
+    tavg, td, wind, cc = (series[name][:, np.newaxis, np.newaxis] for name in ('tavg', 'td', 'wind', 'cc'))
+    qin, pfc, snowalbedo = grids['qin'], grids['pfc'], grids['snowalbedo']
+    # the separate calls of the original energy balance drivers
+    shortwave = DirectSolarRadiation_Adjustment(qin, pfc, snowalbedo)
+    longwave = LongwaveRadiation(tavg, pfc, cc)
+    sensible = SensibleRadiation(tavg, WindRoughness(wind, pfc))
+    latent = LatentRadiation(td, 0.0, wind, pfc)
+    qtotal = np.maximum(shortwave + longwave + sensible + latent + HEAT_FROM_GROUND, 0.0)
+    assert (qtotal == 0.0).any() and (qtotal > 0.0).any()
+    for chunk in (1, 16, 100):
+        total, maxmelt, fluxes = SnowEnergyBalance(qin, tavg, td, wind, cc, pfc, snowalbedo, chunk=chunk,
+                                                   components=True)
+        assert total.shape == qin.shape and total.dtype == np.float64
+        np.testing.assert_allclose(total, qtotal, rtol=1e-10, atol=1e-6)
+        np.testing.assert_allclose(maxmelt, qtotal/(LATENT_HEAT_FUSION*DENSITY_WATER), rtol=1e-10, atol=1e-12)
+        assert tuple(fluxes) == ENERGY_COMPONENTS
+        for name, expected in zip(ENERGY_COMPONENTS, (shortwave, longwave, sensible, latent)):
+            np.testing.assert_allclose(fluxes[name], np.broadcast_to(expected, qin.shape), rtol=1e-10, atol=1e-6,
+                                       err_msg=name)
+
+def test_energy_balance_out_and_precision():
+    series, grids = _Weather()
+    tavg, td, wind, cc = (series[name][:, np.newaxis, np.newaxis] for name in ('tavg', 'td', 'wind', 'cc'))
+    expected = SnowEnergyBalance(grids['qin'], tavg, td, wind, cc, grids['pfc'], grids['snowalbedo'], melt=False)
+    out = np.empty(grids['qin'].shape)
+    assert SnowEnergyBalance(grids['qin'], tavg, td, wind, cc, grids['pfc'], grids['snowalbedo'], melt=False,
+                             out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    # float32 inputs give float32 energy
+    inputs = (grids['qin'], tavg, td, wind, cc, grids['pfc'], grids['snowalbedo'])
+    total, maxmelt = SnowEnergyBalance(*(x.astype(np.float32) for x in inputs))
+    assert total.dtype == maxmelt.dtype == np.float32
+    np.testing.assert_allclose(total, expected, rtol=1e-4, atol=1e-1)
+
+def test_energy_balance_memory():
+    series, grids = _Weather(ndays=200, shape=(60, 80))
+    tavg, td, wind, cc = (series[name][:, np.newaxis, np.newaxis] for name in ('tavg', 'td', 'wind', 'cc'))
+    qin, pfc, snowalbedo = grids['qin'], grids['pfc'], grids['snowalbedo']
+    out = np.empty(qin.shape)
+    tracemalloc.start()
+    try:
+        SnowEnergyBalance(qin, tavg, td, wind, cc, pfc, snowalbedo, chunk=10, melt=False, out=out)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # temporaries of a few chunks of days, where the separate calls allocate several (days, rows, cols) arrays
+    assert peak < 8*out.nbytes*10/200
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+from hydmod.raster import AlignWindow, BoundingWindow, RasterInputs, WindowGeoTransform, WindowSlices
+
+GEOT = (500000.0, 10.0, 0.0, 4800000.0, 0.0, -10.0)
+SHAPE = (50, 70)
+
+
+class _Band(object):
+    """
+    Stand-in for a GDAL raster band holding an array, with a mask band of 255 where there is data
+    """
+
+    def __init__(self, values, valid=None):
+        self.values = values
+        self.valid = valid
+
+    def ReadAsArray(self, xoff, yoff, xsize, ysize):
+        return self.values[yoff:yoff + ysize, xoff:xoff + xsize].copy()
+
+    def GetMaskBand(self):
+        valid = np.ones(self.values.shape, dtype=bool) if self.valid is None else self.valid
+        return _Band(np.where(valid, 255, 0).astype(np.uint8))
+
+
+def _Inputs(blocksize=(16, 32)):
+    """
+    Inputs of an integer dem with a nodata corner and a float32 slope with nodata elsewhere, without GDAL
+    """
+    rng = np.random.default_rng(0)
+    dem = rng.integers(1000, 2000, SHAPE).astype(np.int16)
+    demvalid = np.ones(SHAPE, dtype=bool)
+    demvalid[:5, :5] = False
+    dem[~demvalid] = -9999
+    slope = rng.random(SHAPE).astype(np.float32)*40.0
+    slopevalid = np.ones(SHAPE, dtype=bool)
+    slopevalid[-3:, 10:20] = False
+    inputs = RasterInputs.__new__(RasterInputs)
+    inputs.shape = SHAPE
+    inputs.geot = GEOT
+    inputs.blocksize = blocksize
+    inputs.bands = {'dem': _Band(dem, demvalid), 'slope': _Band(slope, slopevalid)}
+    inputs.nodata = {'dem': -9999, 'slope': None}
+    return inputs, {'dem': demvalid, 'slope': slopevalid}
+
+
+def test_read_fill():
+    inputs, valid = _Inputs()
+    dem = inputs.bands['dem'].values
+    np.testing.assert_array_equal(inputs.read('dem'), dem)
+    window = (2, 3, 10, 12)
+    rows, cols = WindowSlices(window)
+    # nan does not fit the 16 bit dem, which is read as floating point
+    filled = inputs.read('dem', window, fill=np.nan)
+    assert np.issubdtype(filled.dtype, np.floating)
+    np.testing.assert_array_equal(np.isnan(filled), ~valid['dem'][rows, cols])
+    np.testing.assert_array_equal(filled[valid['dem'][rows, cols]], dem[rows, cols][valid['dem'][rows, cols]])
+    # an integer fill keeps the type of the raster
+    filled = inputs.read('dem', window, fill=0)
+    assert filled.dtype == np.int16
+    np.testing.assert_array_equal(filled, np.where(valid['dem'][rows, cols], dem[rows, cols], 0))
+    assert inputs.read('dem', window, dtype=np.float32, fill=np.nan).dtype == np.float32
+    with pytest.raises(ValueError, match='nan'):
+        inputs.read('dem', window, dtype=np.int32, fill=np.nan)
+    filled = inputs.read('slope', fill=np.nan)
+    assert filled.dtype == np.float32
+    np.testing.assert_array_equal(np.isnan(filled), ~valid['slope'])
+
+def test_mask():
+    inputs, valid = _Inputs()
+    np.testing.assert_array_equal(inputs.mask(), valid['dem'] & valid['slope'])
+    np.testing.assert_array_equal(inputs.mask(names=('dem',)), valid['dem'])
+    window = (40, 8, 10, 20)
+    np.testing.assert_array_equal(inputs.mask(window), (valid['dem'] & valid['slope'])[WindowSlices(window)])
+    with pytest.raises(ValueError):
+        inputs.read('dem', (45, 0, 10, 10))
+
+@pytest.mark.parametrize('window, size', [(None, None), ((3, 5, 40, 60), None), ((3, 5, 40, 60), (20, 40)),
+                                          ((17, 33, 1, 1), (100, 100))])
+def test_tiles_cover_window(window, size):
+    inputs, valid = _Inputs()
+    tiles = list(inputs.tiles(window, size))
+    count = np.zeros(SHAPE, dtype=int)
+    for tile in tiles:
+        count[WindowSlices(tile)] += 1
+    expected = np.zeros(SHAPE, dtype=int)
+    expected[WindowSlices((0, 0) + SHAPE if window is None else window)] = 1
+    np.testing.assert_array_equal(count, expected)
+    # each tile is within one tile of whole blocks of the rasters, so no block is read by two tiles
+    ytile, xtile = (16, 32) if size is None else (-(-size[0]//16)*16, -(-size[1]//32)*32)
+    for row, col, nrows, ncols in tiles:
+        assert row//ytile == (row + nrows - 1)//ytile and col//xtile == (col + ncols - 1)//xtile
+
+def test_window_of_bounding_box():
+    inputs, valid = _Inputs()
+    # cells 12 to 21 of row and 25 to 30 of column
+    xmin, xmax = GEOT[0] + 25.5*10.0, GEOT[0] + 30.2*10.0
+    ymin, ymax = GEOT[3] - 21.5*10.0, GEOT[3] - 12.1*10.0
+    assert inputs.window(xmin, ymin, xmax, ymax, align=False) == (12, 25, 10, 6)
+    assert inputs.window(xmin, ymin, xmax, ymax) == (0, 0, 32, 32)
+    assert inputs.window(GEOT[0] - 100.0, ymin, xmax, GEOT[3] + 100.0, align=False) == (0, 0, 22, 31)
+    with pytest.raises(ValueError):
+        inputs.window(GEOT[0] - 100.0, ymin, GEOT[0] - 50.0, ymax)
+    assert inputs.geotransform((12, 25, 10, 6)) == (500250.0, 10.0, 0.0, 4799880.0, 0.0, -10.0)
+    assert inputs.geotransform() == GEOT
+
+def test_align_and_bounding_windows():
+    assert AlignWindow((17, 33, 10, 5), (16, 32), SHAPE) == (16, 32, 16, 32)
+    # clipped to the grid at its edges
+    assert AlignWindow((40, 60, 10, 10), (16, 32), SHAPE) == (32, 32, 18, 38)
+    assert AlignWindow((0, 0) + SHAPE, (16, 32), SHAPE) == (0, 0) + SHAPE
+    mask = np.zeros(SHAPE, dtype=bool)
+    mask[20, 41] = mask[33, 35] = True
+    window = BoundingWindow(mask)
+    assert window == (20, 35, 14, 7)
+    assert mask[WindowSlices(window)].sum() == 2
+    assert BoundingWindow(mask, (16, 32)) == (16, 32, 32, 32)
+    with pytest.raises(ValueError):
+        BoundingWindow(np.zeros(SHAPE, dtype=bool))
+    assert WindowGeoTransform(GEOT, window) == (500350.0, 10.0, 0.0, 4799800.0, 0.0, -10.0)
+
+def test_gdal_integer_raster(tmp_path):
+    gdal = pytest.importorskip('osgeo.gdal')
+    path = str(tmp_path / 'dem.tif')
+    ds = gdal.GetDriverByName('GTiff').Create(path, 7, 5, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform(GEOT)
+    dem = np.arange(35, dtype=np.int16).reshape(5, 7)
+    dem[0, 0] = -9999
+    ds.GetRasterBand(1).WriteArray(dem)
+    ds.GetRasterBand(1).SetNoDataValue(-9999)
+    ds = None
+    inputs = RasterInputs({'dem': path})
+    values = inputs.read('dem', fill=np.nan)
+    assert np.isnan(values[0, 0]) and np.isnan(values).sum() == 1
+    np.testing.assert_array_equal(values[1:], dem[1:])
+    inputs.close()
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from hydmod.ensemble import EnsembleParameter
+from hydmod.et import ET_theta_2d
+from hydmod.flow_routing import FlowProportions, FlowProportions_Sparse, RouteFlow
+from hydmod.groundwater import Baseflow, LateralFlow_Darcy_2d, Percolation_2d, WaterTableHeight
+from hydmod.smr import BALANCE_TERMS, SMRGrid, SMRModel, SMRParameters
+from hydmod.terrain import Slope
+
+GEOT = (500000.0, 10.0, 0.0, 4800000.0, 0.0, -10.0)
+
+
+def _Dem(shape=(12, 15), seed=0):
+    """
+    Valley draining south, so lateral flow and runoff leave the grid at its lower edge
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.indices(shape)
+    return 100.0 - 2.0*row - 0.5*np.abs(col - shape[1]//2) + rng.random(shape)*0.3
+
+def _Grid(mask=None, dtype=None):
+    # runoff is routed over the multiple flow direction network of the dem, so richdem is not needed
+    dem = _Dem()
+    return SMRGrid(dem, Slope(dem, 10.0), GEOT, dtype=dtype, mask=mask, network=FlowProportions_Sparse(dem))
+
+def _Forcing(shape, ndays=60, seed=1):
+    """
+    Wet days large enough to saturate the soil and produce runoff
+    """
+    rng = np.random.default_rng(seed)
+    ppt = np.where(rng.random((ndays,) + shape) < 0.3, rng.random((ndays,) + shape)*0.08, 0.0)
+    return {'ppt': ppt, 'pet': rng.random((ndays,) + shape)*0.006}
+
+def _Model(grid, dtype=None, ksat=10.0):
+    params = SMRParameters(1.0, 0.45, 0.3, 0.1, ksat, 0.002, dtype=dtype)
+    return SMRModel(grid, params, _Forcing(grid.shape), storage=0.25, aquifer=0.05, dtype=dtype)
+
+def _Gross(balance):
+    """
+    Total water passing through the domain, the scale of the mass balance error
+    """
+    return balance['storage0'] + sum(abs(balance[name]) for name, sign in BALANCE_TERMS)
+
+
+def test_mass_balance_float64():
+    model = _Model(_Grid())
+    model.run(record=())
+    balance = model.mass_balance()
+    # every flux of the balance is exercised
+    for name, sign in BALANCE_TERMS:
+        assert balance[name] > 0.0
+    assert balance['qlat_out'] > balance['qlat_in']
+    assert abs(balance['error']) < 1e-12*_Gross(balance)
+
+def test_mass_balance_float32():
+    model = _Model(_Grid(dtype=np.float32), dtype=np.float32)
+    out = model.run(record=('s',))
+    assert out['s'].dtype == np.float32
+    balance = model.mass_balance()
+    # fluxes are totalled in float64, so the error is only the rounding of the float32 state
+    assert abs(balance['error']) < 1e-6*_Gross(balance)
+
+def test_mass_balance_masked():
+    mask = np.zeros((12, 15), dtype=bool)
+    mask[2:11, 3:12] = True
+    model = _Model(_Grid(mask=mask))
+    out = model.run(record=('s',))
+    assert np.isnan(out['s'][:, ~mask]).all()
+    balance = model.mass_balance()
+    assert balance['r'] > 0.0
+    assert abs(balance['error']) < 1e-12*_Gross(balance)
+
+def test_mass_balance_ensemble_and_reset():
+    model = _Model(_Grid(), ksat=EnsembleParameter([1.0, 10.0, 40.0], ndim=2))
+    model.run(ndays=30, record=())
+    balance = model.mass_balance()
+    assert abs(balance['error']) < 1e-12*_Gross(balance)
+    model.reset(0.25, 0.05)
+    balance = model.mass_balance()
+    assert balance['storage'] == balance['storage0']
+    assert balance['error'] == 0.0
+    model.run(record=())
+    balance = model.mass_balance()
+    assert abs(balance['error']) < 1e-12*_Gross(balance)
+
+def test_matches_daily_loop():
+    # the daily loop of the original driver scripts, with baseflow, runoff accumulated by routing it downslope until
+    # none is left and day 0 as the initial state
+    dem = _Dem()
+    slope = Slope(dem, 10.0)
+    forcing = _Forcing(dem.shape, ndays=30)
+    ppt, pet = forcing['ppt'], forcing['pet']
+    soildepth, por, fc, wp, ksat, ksub, alpha = 1.0, 0.45, 0.3, 0.1, 10.0, 0.002, 0.02
+    with np.errstate(invalid='ignore'):
+        fprop = FlowProportions(dem)
+    s, sb = np.zeros(ppt.shape), np.zeros(ppt.shape)
+    r, ra, qlat_in, aet, bf = (np.zeros(ppt.shape) for k in range(5))
+    s[0], sb[0] = 0.25, 0.05
+    for i in range(1, ppt.shape[0]):
+        s[i] = s[i - 1] + ppt[i]
+        hwt = WaterTableHeight(por, fc, np.divide(s[i], soildepth), soildepth)
+        qlat_out = LateralFlow_Darcy_2d(ksat, np.divide(slope, 100.0), hwt, GEOT[1], GEOT[1])
+        qlat_in[i] = RouteFlow(fprop, qlat_out)[0]
+        s[i] = s[i] + qlat_in[i] - qlat_out
+        aet[i] = ET_theta_2d(pet[i], fc*soildepth, wp*soildepth, s[i - 1])
+        s[i] = s[i] - aet[i]
+        perc = Percolation_2d(ksub, WaterTableHeight(por, fc, np.divide(s[i], soildepth), soildepth))
+        s[i] = s[i] - perc
+        bf[i] = Baseflow(alpha, sb[i - 1])
+        sb[i] = sb[i - 1] + perc - bf[i]
+        r[i] = np.where(s[i] > soildepth*por, s[i] - soildepth*por, 0.0)
+        flow = r[i]
+        ra[i] = r[i]
+        while flow.any():
+            flow = RouteFlow(fprop, flow)[0]
+            ra[i] += flow
+        s[i] = np.where(s[i] > soildepth*por, soildepth*por, s[i])
+    params = SMRParameters(soildepth, por, fc, wp, ksat, ksub, alpha)
+    model = SMRModel(_Grid(), params, forcing, storage=0.25, aquifer=0.05, start=1)
+    out = model.run()
+    assert out['s'].shape == (29,) + dem.shape
+    for name, expected in (('s', s), ('sb', sb), ('r', r), ('ra', ra), ('qlat_in', qlat_in), ('aet', aet),
+                           ('bf', bf)):
+        np.testing.assert_allclose(out[name], expected[1:], rtol=1e-10, atol=1e-12, err_msg=name)
+
+def test_network_shape():
+    dem = _Dem()
+    with pytest.raises(ValueError):
+        SMRGrid(dem, Slope(dem, 10.0), GEOT, network=FlowProportions_Sparse(dem[1:]))
+
+def test_richdem_network():
+    pytest.importorskip('richdem')
+    dem = _Dem()
+    grid = SMRGrid(dem, Slope(dem, 10.0), GEOT)
+    model = _Model(grid)
+    model.run(record=())
+    balance = model.mass_balance()
+    assert abs(balance['error']) < 1e-12*_Gross(balance)
+
+def test_packed_forcing_buffers():
+    mask = np.zeros((12, 15), dtype=bool)
+    mask[2:11, 3:12] = True
+    grid = _Grid(mask=mask)
+    model = _Model(grid)
+    forcing = _Forcing(grid.shape)
+    ppt = model._Forcing('ppt', 1)
+    assert ppt.shape == (grid.cells.size,)
+    np.testing.assert_array_equal(ppt, grid.cells.pack(forcing['ppt'][1]))
+    # every day is gathered into the same buffer
+    assert model._Forcing('ppt', 2) is ppt
+    np.testing.assert_array_equal(ppt, grid.cells.pack(forcing['ppt'][2]))
+    # station forcing is packed to a view of its daily value
+    model = SMRModel(grid, SMRParameters(1.0, 0.45, 0.3, 0.1, 10.0, 0.002),
+                     {'ppt': np.full(60, 0.01), 'pet': np.full(60, 0.002)}, storage=0.25, aquifer=0.05)
+    assert model._Forcing('ppt', 3).shape == (1,)
@@ -0,0 +1,93 @@
+import numpy as np
+from hydmod.stats import KGE, MeanDifference, NSE, RMSE, SkillAccumulator
+
+
+def _Series(shape, seed=0, missing=0.0):
+    rng = np.random.default_rng(seed)
+    observed = rng.gamma(2.0, 3.0, shape)
+    modeled = 0.8*observed + rng.normal(0.5, 1.0, shape)
+    if missing:
+        observed[rng.random(shape) < missing] = np.nan
+        modeled[rng.random(shape) < missing] = np.nan
+    return modeled, observed
+
+def _Reference(m, o):
+    """
+    Metrics of one series from their textbook formulas, pairs with nan dropped
+    """
+    valid = np.isfinite(m) & np.isfinite(o)
+    m, o = m[valid], o[valid]
+    r = np.corrcoef(m, o)[0, 1]
+    alpha = np.std(m)/np.std(o)
+    beta = np.mean(m)/np.mean(o)
+    return {
+        'kge': 1.0 - np.sqrt((r - 1.0)**2 + (alpha - 1.0)**2 + (beta - 1.0)**2),
+        'nse': 1.0 - np.sum((o - m)**2)/np.sum((o - np.mean(o))**2),
+        'rmse': np.sqrt(np.mean((m - o)**2)),
+        'mean_difference': np.mean(m - o),
+    }
+
+
+def test_metrics_series():
+    m, o = _Series(365)
+    expected = _Reference(m, o)
+    np.testing.assert_allclose(KGE(m, o), expected['kge'], rtol=1e-12)
+    np.testing.assert_allclose(NSE(m, o), expected['nse'], rtol=1e-12)
+    np.testing.assert_allclose(RMSE(m, o), expected['rmse'], rtol=1e-12)
+    np.testing.assert_allclose(MeanDifference(m, o), expected['mean_difference'], rtol=1e-12)
+
+def test_metrics_missing_values():
+    m, o = _Series(500, seed=1, missing=0.1)
+    expected = _Reference(m, o)
+    np.testing.assert_allclose(KGE(m, o), expected['kge'], rtol=1e-12)
+    np.testing.assert_allclose(NSE(m, o), expected['nse'], rtol=1e-12)
+    np.testing.assert_allclose(RMSE(m, o), expected['rmse'], rtol=1e-12)
+    np.testing.assert_allclose(MeanDifference(m, o), expected['mean_difference'], rtol=1e-12)
+
+def test_metrics_axis():
+    m, o = _Series((4, 3, 200), seed=2, missing=0.05)
+    kge, nse, rmse = KGE(m, o, axis=2), NSE(m, o, axis=2), RMSE(m, o, axis=2)
+    assert kge.shape == (4, 3)
+    for index in np.ndindex(4, 3):
+        expected = _Reference(m[index], o[index])
+        np.testing.assert_allclose(kge[index], expected['kge'], rtol=1e-12)
+        np.testing.assert_allclose(nse[index], expected['nse'], rtol=1e-12)
+        np.testing.assert_allclose(rmse[index], expected['rmse'], rtol=1e-12)
+
+def test_metrics_no_valid_pairs():
+    m = np.array([1.0, np.nan, 3.0])
+    o = np.array([np.nan, 2.0, np.nan])
+    assert np.isnan(RMSE(m, o))
+    assert np.isnan(MeanDifference(m, o))
+
+def test_skill_accumulator():
+    m, o = _Series((300, 5), seed=3, missing=0.05)
+    skill = SkillAccumulator((5,))
+    for i in range(m.shape[0]):
+        skill.update(m[i], o[i])
+    for j in range(5):
+        expected = _Reference(m[:, j], o[:, j])
+        np.testing.assert_allclose(skill.kge()[j], expected['kge'], rtol=1e-10)
+        np.testing.assert_allclose(skill.nse()[j], expected['nse'], rtol=1e-10)
+        np.testing.assert_allclose(skill.rmse()[j], expected['rmse'], rtol=1e-10)
+        np.testing.assert_allclose(skill.mean_difference()[j], expected['mean_difference'], rtol=1e-10)
+
+def test_skill_accumulator_matches_batch():
+    m, o = _Series((250, 2, 3), seed=4, missing=0.1)
+    skill = SkillAccumulator((2, 3))
+    for i in range(m.shape[0]):
+        skill.update(m[i], o[i])
+    np.testing.assert_allclose(skill.kge(), KGE(m, o), rtol=1e-10)
+    np.testing.assert_allclose(skill.nse(), NSE(m, o), rtol=1e-10)
+    np.testing.assert_allclose(skill.rmse(), RMSE(m, o), rtol=1e-10)
+    np.testing.assert_allclose(skill.mean_difference(), MeanDifference(m, o), rtol=1e-10)
+
+def test_skill_accumulator_broadcast_observations():
+    # one observed series scored against an ensemble of modeled series
+    m, o = _Series((200, 4), seed=5)
+    observed = o[:, 0]
+    skill = SkillAccumulator((4,))
+    for i in range(m.shape[0]):
+        skill.update(m[i], observed[i])
+    for j in range(4):
+        np.testing.assert_allclose(skill.nse()[j], _Reference(m[:, j], observed)['nse'], rtol=1e-10)
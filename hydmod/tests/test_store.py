@@ -0,0 +1,125 @@
+import os
+import numpy as np
+import pytest
+from hydmod.domain import ActiveCells
+from hydmod.store import OutputStore, OutputWriter
+
+GEOT = (500000.0, 30.0, 0.0, 4800000.0, 0.0, -30.0)
+
+
+class _Grid(object):
+    def __init__(self, shape, mask=None):
+        self.shape = shape
+        self.geot = GEOT
+        self.cells = None if mask is None else ActiveCells(mask)
+        self.state_shape = shape if mask is None else (self.cells.size,)
+
+
+class _Forcing(object):
+    def __init__(self, dates):
+        self.dates = dates
+
+
+class _Model(object):
+    """
+    Stand-in for smr.SMRModel that steps through given daily grids of state variables
+    """
+
+    def __init__(self, grids, mask=None, dates=None, start=0):
+        first = next(iter(grids.values()))
+        self.grids = grids
+        self.grid = _Grid(first.shape[-2:], mask)
+        self.ndays = first.shape[0]
+        self.shape = first.shape[1:-2] + self.grid.state_shape
+        self.dtype = first.dtype
+        self.forcing = _Forcing(dates)
+        self.day = start
+        self.state = {}
+
+    def run(self, probe, ndays=None):
+        ndays = self.ndays - self.day if ndays is None else ndays
+        probe.start(self, ndays)
+        for i in range(ndays):
+            cells = self.grid.cells
+            for name, grids in self.grids.items():
+                self.state[name] = grids[self.day] if cells is None else cells.pack(grids[self.day])
+            self.day += 1
+            probe.record(self, i)
+
+
+def _Grids(shape, names=('s', 'q'), dtype=np.float32, seed=0):
+    rng = np.random.default_rng(seed)
+    return {name: rng.random(shape).astype(dtype) for name in names}
+
+def _Dates(ndays):
+    return np.datetime64('2001-10-01') + np.arange(ndays)
+
+
+def test_roundtrip_tiles(tmp_path):
+    # 10 days in chunks of 4 days (the last one partial) and 3x4 tiles of a 7x9 grid (partial tiles at the edges)
+    grids = _Grids((10, 7, 9))
+    dates = _Dates(10)
+    model = _Model(grids, dates=dates)
+    model.run(OutputWriter(tmp_path / 'out', chunkdays=4, tile=(3, 4)))
+    store = OutputStore(tmp_path / 'out')
+    assert store.names == ('s', 'q')
+    assert store.shape == (10, 7, 9)
+    assert store.chunks == (4, 3, 4)
+    assert store.dtype == np.float32
+    assert store.geot == GEOT
+    np.testing.assert_array_equal(store.dates, dates)
+    assert len(os.listdir(tmp_path / 'out' / 'q')) == 3*3*3
+    for name in ('s', 'q'):
+        np.testing.assert_array_equal(store[name][:], grids[name])
+    q = store['q']
+    np.testing.assert_array_equal(q[3:9, 2:6, 1:8], grids['q'][3:9, 2:6, 1:8])
+    np.testing.assert_array_equal(q[-1], grids['q'][-1])
+    np.testing.assert_array_equal(q[:, 4, 5], grids['q'][:, 4, 5])
+    np.testing.assert_array_equal(q[::3, ::-2, 6], grids['q'][::3, ::-2, 6])
+    np.testing.assert_array_equal(q[..., 2], grids['q'][..., 2])
+    assert q[5:5].shape == (0, 7, 9)
+    np.testing.assert_array_equal(store.read('s', days=slice(2, 7), rows=slice(1, 5)), grids['s'][2:7, 1:5])
+    with pytest.raises(IndexError):
+        q[10]
+    with pytest.raises(KeyError):
+        store['aet']
+
+def test_roundtrip_masked_members(tmp_path):
+    # an ensemble of 2 members on a masked grid, stored unpacked with nan outside the mask
+    mask = np.zeros((6, 8), dtype=bool)
+    mask[1:5, 2:7] = True
+    mask[1, 2] = False
+    grids = _Grids((9, 2, 6, 8), names=('q',), dtype=np.float64, seed=1)
+    model = _Model(grids, mask=mask)
+    model.run(OutputWriter(tmp_path / 'out', names=('q',), chunkdays=5, tile=(4, 4), compress=False))
+    store = OutputStore(tmp_path / 'out')
+    assert store.shape == (9, 2, 6, 8)
+    assert store.dates is None
+    q = store['q'][:]
+    np.testing.assert_array_equal(q[..., mask], grids['q'][..., mask])
+    assert np.isnan(q[..., ~mask]).all()
+    np.testing.assert_array_equal(store.read('q', days=slice(4, 6), cols=slice(3, 5))[:, 1][..., mask[:, 3:5]],
+                                  grids['q'][4:6, 1, :, 3:5][..., mask[:, 3:5]])
+    assert os.path.exists(tmp_path / 'out' / 'q' / '1.1.1.npy')
+
+def test_start_day_and_close(tmp_path):
+    # a run that starts on day 3 of the forcing and stops after 6 of its 9 days
+    grids = _Grids((12, 4, 5), names=('s',), seed=2)
+    dates = _Dates(12)
+    model = _Model(grids, dates=dates, start=3)
+    writer = OutputWriter(tmp_path / 'out', names=('s',), chunkdays=4)
+    model.run(writer, ndays=6)
+    writer.close()
+    store = OutputStore(tmp_path / 'out')
+    assert store.shape == (6, 4, 5)
+    np.testing.assert_array_equal(store['s'][:], grids['s'][3:9])
+    np.testing.assert_array_equal(store.dates, dates[3:9])
+
+def test_existing_store(tmp_path):
+    grids = _Grids((3, 2, 2), names=('q',))
+    _Model(grids).run(OutputWriter(tmp_path / 'out', names=('q',)))
+    with pytest.raises(IOError):
+        _Model(grids).run(OutputWriter(tmp_path / 'out', names=('q',)))
+    grids = _Grids((5, 2, 2), names=('q',), seed=3)
+    _Model(grids).run(OutputWriter(tmp_path / 'out', names=('q',), overwrite=True))
+    np.testing.assert_array_equal(OutputStore(tmp_path / 'out')['q'][:], grids['q'])
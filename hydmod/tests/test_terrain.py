@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from hydmod.terrain import Aspect, CellSize, Slope, SlopeAspect
+
+# 30 m dem with a no data cell, and the output of gdaldem slope -p -compute_edges and gdaldem aspect -zero_for_flat
+# -compute_edges for it (gdaldem writes 0 rather than no data for the aspect of the no data cell)
+DEM = np.array([
+    [1204.7, 1199.6, 1196.3, 1188.5, 1187.8, 1185.9],
+    [1205.0, 1199.2, 1200.2, 1194.6, 1187.7, 1186.5],
+    [1211.0, 1202.3, 1202.1, -9999.0, 1190.3, 1186.1],
+    [1213.2, 1205.5, 1202.1, 1199.4, 1194.1, 1187.5],
+    [1211.6, 1208.8, 1206.6, 1201.6, 1196.6, 1191.1],
+])
+GDALDEM_SLOPE = np.array([
+    [8.5100, 14.2837, 21.6521, 19.4541, 6.9365, 3.4691],
+    [23.6280, 13.3716, 14.2992, 20.7176, 8.6956, 7.0912],
+    [29.1519, 16.9302, 7.7419, np.nan, 14.1453, 13.6025],
+    [22.4387, 16.8264, 10.2839, 16.9756, 20.4943, 20.8236],
+    [4.8310, 11.4944, 17.0297, 19.1840, 19.6785, 14.3827],
+])
+GDALDEM_ASPECT = np.array([
+    [87.1922, 78.5591, 58.6966, 46.7366, 38.6606, 65.8987],
+    [63.6156, 56.9541, 40.7454, 65.6518, 77.8290, 87.3064],
+    [62.0432, 56.0361, 36.6844, np.nan, 56.7778, 82.9620],
+    [87.4453, 63.3721, 52.5731, 68.0944, 59.3157, 66.4101],
+    [104.9931, 46.4681, 44.8020, 60.3171, 62.7835, 39.5928],
+])
+
+
+def _AngleDifference(a, b):
+    difference = np.abs(a - b) % 360.0
+    return np.minimum(difference, 360.0 - difference)
+
+def _Plane(shape=(6, 7), east=-2.0, south=1.0, cellsize=10.0):
+    """
+    Plane that changes by east and south per cell to the east and to the south
+    """
+    row, col = np.indices(shape)
+    return 100.0 + east*col + south*row, np.hypot(east, south)/cellsize
+
+
+def test_gdaldem_fixture():
+    slope = Slope(DEM, 30.0, nodata=-9999.0)
+    aspect = Aspect(DEM, 30.0, nodata=-9999.0)
+    assert slope.dtype == np.float32 and aspect.dtype == np.float32
+    np.testing.assert_array_equal(np.isnan(slope), np.isnan(GDALDEM_SLOPE))
+    np.testing.assert_allclose(slope, GDALDEM_SLOPE, rtol=5e-5)
+    np.testing.assert_array_equal(np.isnan(aspect), np.isnan(GDALDEM_ASPECT))
+    valid = ~np.isnan(GDALDEM_ASPECT)
+    assert _AngleDifference(aspect[valid], GDALDEM_ASPECT[valid]).max() < 5e-3
+
+def test_gdal_demprocessing():
+    gdal = pytest.importorskip('osgeo.gdal')
+    src = gdal.GetDriverByName('MEM').Create('', DEM.shape[1], DEM.shape[0], 1, gdal.GDT_Float64)
+    src.SetGeoTransform((500000.0, 30.0, 0.0, 4800000.0, 0.0, -30.0))
+    band = src.GetRasterBand(1)
+    band.SetNoDataValue(-9999.0)
+    band.WriteArray(DEM)
+    slope = gdal.DEMProcessing('', src, 'slope', format='MEM', computeEdges=True, slopeFormat='percent')
+    aspect = gdal.DEMProcessing('', src, 'aspect', format='MEM', computeEdges=True, zeroForFlat=True)
+    valid = DEM != -9999.0
+    cellsize = CellSize(src.GetGeoTransform())
+    np.testing.assert_allclose(Slope(DEM, cellsize, nodata=-9999.0)[valid], slope.ReadAsArray()[valid], rtol=5e-5)
+    difference = _AngleDifference(Aspect(DEM, cellsize, nodata=-9999.0)[valid], aspect.ReadAsArray()[valid])
+    assert difference.max() < 5e-3
+
+def test_plane():
+    # neighbours outside the dem are extrapolated, so every cell of a plane has the slope of the plane except the
+    # corners, where gdaldem repeats the column of the cell and the east difference is halved
+    dem, gradient = _Plane()
+    corners = np.zeros(dem.shape, dtype=bool)
+    corners[::dem.shape[0] - 1, ::dem.shape[1] - 1] = True
+    slope = Slope(dem, 10.0)
+    np.testing.assert_allclose(slope[~corners], 100.0*gradient, rtol=1e-6)
+    np.testing.assert_allclose(slope[corners], 100.0*np.hypot(1.0, 1.0)/10.0, rtol=1e-6)
+    degrees = Slope(dem, 10.0, units='degrees')
+    np.testing.assert_allclose(degrees[~corners], np.degrees(np.arctan(gradient)), rtol=1e-6)
+    # lower to the east and to the north
+    np.testing.assert_allclose(Aspect(dem, 10.0)[~corners], np.degrees(np.arctan2(2.0, 1.0)), rtol=1e-6)
+    np.testing.assert_allclose(Aspect(dem, 10.0, units='radians')[~corners], np.arctan2(2.0, 1.0), rtol=1e-6)
+    slope, aspect = SlopeAspect(dem, 10.0, units='radians')
+    np.testing.assert_allclose(slope[~corners], 100.0*gradient, rtol=1e-6)
+    np.testing.assert_allclose(aspect[~corners], np.arctan2(2.0, 1.0), rtol=1e-6)
+
+def test_plane_aspects():
+    for east, south, expected in ((0.0, 1.0, 0.0), (-1.0, 0.0, 90.0), (0.0, -1.0, 180.0), (1.0, 0.0, 270.0)):
+        dem = _Plane((4, 5), east, south)[0]
+        assert _AngleDifference(Aspect(dem, 10.0), expected).max() < 1e-4
+
+def test_flat_and_edges():
+    flat = np.full((4, 5), 250.0)
+    np.testing.assert_array_equal(Slope(flat, 30.0), 0.0)
+    np.testing.assert_array_equal(Aspect(flat, 30.0), 0.0)
+    np.testing.assert_array_equal(Aspect(flat, 30.0, flat=-1.0), -1.0)
+    # without edges, cells with a neighbour outside the dem or no data are nan
+    slope = Slope(DEM, 30.0, nodata=-9999.0, edges=False)
+    complete = np.zeros(DEM.shape, dtype=bool)
+    complete[1:-1, 1:-1] = True
+    complete[1:4, 2:5] = False
+    np.testing.assert_array_equal(~np.isnan(slope), complete)
+    np.testing.assert_allclose(slope[complete], GDALDEM_SLOPE[complete], rtol=5e-5)
@@ -5,6 +5,12 @@ import hydmod.conversions as conv
 import hydmod.groundwater as gw
 import hydmod.flow_routing as fr
 import hydmod.radiation as rad
+import hydmod.smr as smr
+import hydmod.forcing as frc
+import hydmod.climate as clm
+import hydmod.raster as rst
+import hydmod.terrain as trn
+import hydmod.probes as prb
 from datetime import datetime
 import pandas as pd
 from osgeo import gdal
@@ -17,45 +23,35 @@ import os
 
 os.chdir('C:/temp/smr/trimmer_peak')
 dempath = 'dem/dem.tif'
-demds = gdal.Open(dempath)
-geot = demds.GetGeoTransform()
-demnp = demds.GetRasterBand(1).ReadAsArray()
-nrow = demds.RasterYSize
-ncol = demds.RasterXSize
-demds = None
+rasters = rst.RasterInputs({'dem': dempath})
+geot = rasters.geotransform()
+nrow, ncol = rasters.shape
+demnp = rasters.read('dem')
 demfil = rd.FillDepressions(rd.LoadGDAL(dempath))
 rdaccum = rd.FlowAccumulation(demfil, method='Dinf')
 #rd.rdShow(rdaccum, cmap='jet')
 print ("max", np.where(rdaccum==np.max(rdaccum)))
-slpds = gdal.Open('export/arcmap/gtiffs/FVSLOP.tif')
-slpnp = slpds.GetRasterBand(1).ReadAsArray()*100.0
-aspds = gdal.Open('export/arcmap/gtiffs/TASPEC.tif')
-aspnp = aspds.GetRasterBand(1).ReadAsArray()
+#slope (percent) and aspect (radians) from the dem, Horn's method as gdaldem
+slpnp, aspnp = trn.SlopeAspect(demnp, trn.CellSize(geot), units='radians', nodata=rasters.nodata['dem'])
 clipath = 'climate/265191.cli'
-clidat = np.genfromtxt(clipath, skip_header=15)
+cli = clm.ReadCLI(clipath)
 
 daystart = 1
 dayend = 366
 ndays = dayend-daystart+1
-d = clidat[daystart-1:dayend-1, 0]
-m = clidat[daystart-1:dayend-1, 1]
-y = clidat[daystart-1:dayend-1, 2]
-ppt = clidat[daystart-1:dayend-1, 3] * 0.0254
-tmax = clidat[daystart-1:dayend-1, 7]
-tmin = clidat[daystart-1:dayend-1, 8]
-wind = clidat[daystart-1:dayend-1, 10]
-td = clidat[daystart-1:dayend-1, 12]
-radobs = conv.LangleyTokJsqm(clidat[daystart-1:dayend-1, 9]) #langleys -> kJ/m^2
-
-
-doy = conv.DayOfYear(m, d, y)
-ppt2d = np.reshape(np.repeat(ppt, nrow*ncol), (ndays-1, nrow, ncol))
-tmin2d = np.reshape(np.repeat(tmin, nrow*ncol), (ndays-1, nrow, ncol))
-tmax2d = np.reshape(np.repeat(tmax, nrow*ncol), (ndays-1, nrow, ncol))
-tavg2d = 0.5 * (tmin2d + tmax2d)
-wind2d = np.reshape(np.repeat(wind, nrow*ncol), (ndays-1, nrow, ncol))
-td2d = np.reshape(np.repeat(td, nrow*ncol), (ndays-1, nrow, ncol))
-radobs2d = np.reshape(np.repeat(radobs, nrow*ncol), (ndays-1, nrow, ncol))
+days = slice(daystart-1, dayend-1)
+ppt = cli['ppt'][days]
+tmax = cli['tmax'][days]
+tmin = cli['tmin'][days]
+wind = cli['wind'][days]
+td = cli['td'][days]
+radobs = cli['radobs'][days]
+doy = cli['doy'][days]
+forcing = frc.Forcing((nrow, ncol), ppt=ppt, tmin=tmin, tmax=tmax, tavg=0.5 * (tmin + tmax), wind=wind, td=td,
+                      radobs=radobs)
+#station series broadcast onto the grid without copying
+ppt2d, tmin2d, tmax2d, tavg2d = forcing['ppt'], forcing['tmin'], forcing['tmax'], forcing['tavg']
+wind2d, td2d, radobs2d = forcing['wind'], forcing['td'], forcing['radobs']
 
 # from optimization in R
 k = 1.16
@@ -72,66 +68,35 @@ ppt_in2d = np.add(ppt_rain2d, act_melt2d)
 
 lat = 41.97
 
-s = np.zeros(ppt_in2d.shape)
-r = np.zeros(ppt_in2d.shape)
-ra = np.zeros(ppt_in2d.shape)  # accumulated runoff
-hwt = np.zeros(ppt_in2d.shape)
-qlat_out = np.zeros(ppt_in2d.shape)
-qlat_in = np.zeros(ppt_in2d.shape)
-perc = np.zeros(ppt_in2d.shape)
-sb = np.zeros(ppt_in2d.shape)
-bf = np.zeros(ppt_in2d.shape)
-q = np.zeros(ppt_in2d.shape)
-r[0, :, :] = 0.0  # set initial runoff m
-ra[0, :, :] = 0.0
-s[0, :, :] = 0.7  # set initial storage (i.e water content) m
-sb[0, :, :] = 0.0  # set initial aquifer storage (baseflow source) m
-soildepth = np.full((nrow, ncol), 2.0)  # depth of soil profile m
+# calculate PET from shortwave radiation on the sloping surface plus net longwave radiation
+qs = rad.TerrainIllumination(slpnp, aspnp).radiation(lat, doy, radobs2d, units='degrees') # kJ/m^2
+ql = rad.LongwaveRadiation(tavg2d, 80.0, 0.0) # kJ/m^2
+Ra2d = (qs + ql)/1000.0*rad.LATENT_HEAT_VAPORIZATION_MJ # mm/timestep (day)
+pet2d = et.PET_Hargreaves1985(tmax2d, tmin2d, tavg2d, Ra2d)/1000.0  # m/day
 
-aet = np.zeros(ppt_in2d.shape)
+#soil parameters
+soildepth = np.full((nrow, ncol), 2.0)  # depth of soil profile m
 ksat = np.full((nrow, ncol), 10.0) # m/day
-
 por = np.full((nrow, ncol), 0.5)
 fc = np.full((nrow, ncol), 0.3)
 wp = np.full((nrow, ncol), 0.1)
 ksub = np.full((nrow, ncol), 0.001) # m/day
 alpha = 0.02 #baseflow recession coefficient
-porl = np.multiply(por, soildepth)
-fcl = np.multiply(fc, soildepth)
-wpl = np.multiply(wp, soildepth)
-smax = porl
-qlat_nr = np.zeros(ndays)
 
-fprop = fr.FlowProportions(demfil)
-qs = rad.DirectSolarRadiation(lat, doy[0], slpnp, aspnp, units='degrees')
-qd = qs
-ql = rad.LongwaveRadiation(tavg2d[0], 90.0, 0.0, qd, qs)/1000.0
-Ra2d = (qs+ql)*rad.LATENT_HEAT_VAPORIZATION_MJ # mm/timestep (day)
-# calculate PET
-pet2d = np.zeros(ppt_in2d.shape)
-pet2d[0] = et.PET_Hargreaves1985(tmax2d[0], tmin2d[0], tavg2d[0], Ra2d)/1000.0  # m/day
-aet[0,:,:] = et.ET_theta_2d(pet2d[0,:,:], fcl, wpl, s[0,:,:])
-
-ims = []
-for i in range(1, ppt_in2d.shape[0]):
-    qs = rad.DirectSolarRadiation(lat, doy[i], slpnp, aspnp, units='degrees')
-    qd = qs
-    ql = rad.LongwaveRadiation(tavg2d[i], 80.0, 0.0, qd, qs) / 1000.0
-    Ra2d = (qs + ql) * rad.LATENT_HEAT_VAPORIZATION_MJ  # mm/timestep (day)
-    s[i, :, :] = s[i - 1, :, :] + ppt_in2d[i,:,:]
-    hwt[i, :, :] = gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], soildepth), soildepth)
-    qlat_out[i, :, :] = gw.LateralFlow_Darcy_2d(ksat, slpnp/100.0, hwt[i, :, :], geot[1], geot[1])
-    qlat_in[i, :, :], qlat_nr[i] = fr.RouteFlow(fprop, qlat_out[i, :, :])
-    s[i, :, :] = s[i, :, :] + qlat_in[i, :, :] - qlat_out[i, :, :]
-    pet2d[i] = et.PET_Hargreaves1985(tmax2d[i], tmin2d[i], tavg2d[i], Ra2d) / 1000.0  # m/day
-    aet[i, :, :] = et.ET_theta_2d(pet2d[i, :, :], fcl, wpl, s[i - 1, :, :])
-    s[i, :, :] = s[i, :, :] - aet[i, :, :]
-    perc[i, :, :] = gw.Percolation_2d(ksub, gw.WaterTableHeight(por, fc, np.divide(s[i, :, :], 1.0), soildepth))
-    s[i, :, :] = s[i, :, :] - perc[i, :, :]
-    r[i, :, :] = np.where(s[i, :, :] > (soildepth*por), (s[i, :, :] - (soildepth*por)), 0.0)
-    ra[i, :, :] = rd.FlowAccumulation(rd.LoadGDAL(dempath), method='Dinf', weights=r[i, :, :])
-    s[i, :, :] = np.where(s[i, :, :] > (soildepth * por), (soildepth * por), s[i, :, :])
-    #rd.rdShow(rd.rdarray(r[i, :, :], no_data=-9999), cmap='jet', vmin=0.0, vmax=5.0)
+#run soil moisture routing model, initial storage (i.e water content) 0.7 m
+grid = smr.SMRGrid(demfil, slpnp, geot)
+params = smr.SMRParameters(soildepth, por, fc, wp, ksat, ksub, alpha)
+model = smr.SMRModel(grid, params, {'ppt': ppt_in2d, 'pet': pet2d}, storage=0.7, start=1)
+#day 0 of the forcing is the initial state and the model steps from day 1, as the original daily loop
+simdoy = doy[model.start:]
+outrow = 12
+outcol = 1
+#record only the series that are plotted
+point = prb.PointProbe(outrow, outcol, names=('qlat_in', 'qlat_out', 'ra', 'hwt'))
+etpoint = prb.PointProbe(outrow-6, outcol+10, names=('aet',))
+model.run(record=(), probes=(point, etpoint))
+qlat_in, qlat_out, ra, hwt = (point.values[name] for name in ('qlat_in', 'qlat_out', 'ra', 'hwt'))
+aet = etpoint.values['aet']
 
 # print("ppt", ppt_in2d)
 # print("pet", pet)
@@ -149,26 +114,24 @@ for i in range(1, ppt_in2d.shape[0]):
 # print("qlat in", qlat_in)
 # print("r", r)
 # print("s", s)
-outrow = 12
-outcol = 1
 #print(ppt_in2d)
-# print('qlat', qlat_in[:, outrow, outcol]-qlat_out[:,outrow, outcol])
-# print('runoff accum', ra[:, outrow, outcol])
-# print('flow', ra[:, outrow, outcol]+(qlat_in[:, outrow, outcol]-qlat_out[:, outrow, outcol]))
+# print('qlat', qlat_in-qlat_out)
+# print('runoff accum', ra)
+# print('flow', ra+(qlat_in-qlat_out))
 
 ##############################################################
 ###### Use these plots #######################################
 ##############################################################
-plt.plot(doy, qlat_in[:, outrow, outcol]-qlat_out[:, outrow, outcol], 'g',
-         doy, ra[:, outrow, outcol], 'c',
-         doy, (ra[:, outrow, outcol]+(qlat_in[:, outrow, outcol]-qlat_out[:, outrow, outcol])), 'b')
+plt.plot(simdoy, qlat_in-qlat_out, 'g',
+         simdoy, ra, 'c',
+         simdoy, (ra+(qlat_in-qlat_out)), 'b')
 plt.show()
-plt.plot(doy, qlat_in[:, outrow, outcol], 'b', doy, qlat_out[:, outrow, outcol], 'r')
+plt.plot(simdoy, qlat_in, 'b', simdoy, qlat_out, 'r')
 plt.show()
 
-plt.plot(doy, hwt[:, outrow, outcol], 'b')
+plt.plot(simdoy, hwt, 'b')
 plt.show()
-plt.plot(doy, pet2d[:, outrow-6, outcol+10], 'r', doy, aet[:, outrow-6, outcol+10], 'g')
+plt.plot(doy, pet2d[:, outrow-6, outcol+10], 'r', simdoy, aet, 'g')
 plt.show()
 
 # print(np.sum(ppt_in2d[1, :, :]))